@@ -0,0 +1,260 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+Allocation of RealTxn values into VirtualTxn splits by the owners'
+AllocationRules.
+
+A batch of RealTxn rows is allocated with a fixed number of queries: the
+rules, categories and VirtualAccts involved are read once, the splits are
+written with one executemany, and running balances and checkpoints are
+adjusted once per VirtualAcct. Amounts are split and summed in integer
+cents. The splits of every RealTxn sum exactly to its value; a RealTxn that
+cannot be split that way, or whose splits would land in a closed period of
+a Budget, is left without splits.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+
+from shared.bulk import bulk_insert
+from shared.cache import bump_ledger_version
+from shared.controllers import local_date
+from shared.ledger import (
+    adjust_balances,
+    as_cents,
+    bump_change_counts,
+    format_cents,
+    from_cents,
+    shift_checkpoints_by_day,
+)
+from shared.models import (
+    AllocationRule,
+    Category,
+    RealAcct,
+    VirtualAcct,
+    VirtualTxn,
+    VirtualAcctCheckpoint,
+)
+
+# primary keys per IN clause when looking for existing splits
+PK_CHUNK_SIZE = 500
+
+
+class AllocationResult(object):
+    """
+    Counts of one allocation batch.
+    """
+    
+    def __init__(self):
+        self.virtualtxn_count = 0
+        self.allocated_count = 0
+        self.unallocated_count = 0
+        self.skipped_count = 0
+        self.owner_ids = set()
+    
+    def __unicode__(self):
+        return (u"Allocated %d transactions into %d splits; %d could not be allocated "
+                u"and %d were already split" % (self.allocated_count, self.virtualtxn_count,
+                                                self.unallocated_count, self.skipped_count))
+
+
+def split_value(value, rules, default_budget):
+    """
+    Returns a list of (budget, amount) that splits value by the given
+    AllocationRules, with the amounts summing exactly to value.
+    
+    Fixed amounts are taken first, in order, and capped at what is left.
+    Percentages are then taken of what the fixed amounts left, rounded
+    toward zero to the cent. Whatever remains, including rounding, goes to
+    default_budget.
+    """
+    return [(budget, from_cents(amount)) for budget, amount
+            in _split_cents(as_cents(value), _cent_rules(rules), default_budget)]
+
+
+def _cent_rules(rules):
+    # (budget, amount in cents, percentage in hundredths of a percent)
+    return [(rule.budget, None if rule.amount is None else as_cents(rule.amount),
+             None if rule.percentage is None else as_cents(rule.percentage))
+            for rule in rules]
+
+
+def _split_cents(value, rules, default_budget):
+    # split_value() over cents and _cent_rules(), which for a batch is many
+    # times faster than over Decimals
+    if not rules:
+        return [(default_budget, value)] if value else []
+    sign = -1 if value < 0 else 1
+    remaining = abs(value)
+    # [budget, amount] in the order the budgets are first given a share
+    shares = []
+    
+    def take(budget, amount):
+        amount = min(amount, remaining)
+        if amount > 0:
+            for share in shares:
+                if share[0].pk == budget.pk:
+                    share[1] += amount
+                    break
+            else:
+                shares.append([budget, amount])
+        return remaining - amount
+    
+    for budget, amount, percentage in rules:
+        if amount is not None:
+            remaining = take(budget, amount)
+    base = remaining
+    for budget, amount, percentage in rules:
+        if percentage is not None:
+            remaining = take(budget, base * percentage // 10000)
+    take(default_budget, remaining)
+    
+    return [(budget, sign * amount) for budget, amount in shares]
+
+
+def _allocated_pks(pks):
+    allocated = set()
+    for start in range(0, len(pks), PK_CHUNK_SIZE):
+        allocated.update(VirtualTxn.objects.filter(real_txn__in=pks[start:start + PK_CHUNK_SIZE])
+                         .values_list('real_txn', flat=True))
+    return allocated
+
+
+def _open_accounts(wanted):
+    """
+    Returns a dict of {(budget pk, period start): VirtualAcct} for the
+    wanted dict of {(budget, period start): RealAcct pk}, opening missing
+    accounts against the given RealAcct.
+    """
+    starts = defaultdict(set)
+    for budget, period_start in wanted:
+        starts[budget.pk].add(period_start)
+    query = Q()
+    for budget_pk, period_starts in starts.items():
+        query |= Q(parent_budget=budget_pk, period_start__in=period_starts)
+    accounts = dict(((account.parent_budget_id, account.period_start), account)
+                    for account in VirtualAcct.objects.filter(query))
+    
+    for (budget, period_start), realacct_id in wanted.items():
+        if (budget.pk, period_start) not in accounts:
+            accounts[(budget.pk, period_start)] = VirtualAcct.objects.create(
+                owner_id=budget.owner_id, name=budget.name, parent_budget=budget,
+                real_acct_id=realacct_id, period_start=period_start)
+    return accounts
+
+
+def allocate_splits(realtxns, batch_size=None, skip_allocated=True):
+    """
+    Splits each of the saved RealTxn objects in realtxns by the rules of its
+    Category, and writes the splits with insert_splits(). RealTxn objects
+    that already have splits are skipped unless skip_allocated is False.
+    
+    This does not manage the database transaction; use allocate() unless
+    the caller already has one open, as import_statement does. Returns an
+    AllocationResult.
+    """
+    result = AllocationResult()
+    realtxns = list(realtxns)
+    if skip_allocated:
+        allocated = _allocated_pks([txn.pk for txn in realtxns])
+        result.skipped_count = len(allocated)
+        realtxns = [txn for txn in realtxns if txn.pk not in allocated]
+    if not realtxns:
+        return result
+    
+    categories = Category.objects.select_related('budget')\
+        .in_bulk(set(txn.category_id for txn in realtxns))
+    rules = defaultdict(list)
+    for rule in AllocationRule.objects.filter(category__in=categories).select_related('budget'):
+        rules[rule.category_id].append(rule)
+    for category_id, category_rules in rules.items():
+        rules[category_id] = _cent_rules(category_rules)
+    
+    # every RealTxn's shares, as (budget, period start, amount in cents)
+    period_starts = {}
+    plans = []
+    wanted = {}
+    for txn in realtxns:
+        category = categories[txn.category_id]
+        day = local_date(txn.date)
+        shares = _split_cents(as_cents(txn.value), rules[category.pk], category.budget)
+        if any(budget.is_closed_on(day) for budget, _ in shares):
+            result.unallocated_count += 1
+            continue
+        plan = []
+        for budget, amount in shares:
+            if (budget.pk, day) not in period_starts:
+                period_starts[(budget.pk, day)] = \
+                    budget.period_length_controller.period_start_date(day)
+            period_start = period_starts[(budget.pk, day)]
+            wanted.setdefault((budget, period_start), txn.real_account_id)
+            plan.append((budget, period_start, amount))
+        plans.append((txn, day, plan))
+    accounts = _open_accounts(wanted) if wanted else {}
+    
+    splits = []
+    for txn, day, plan in plans:
+        txn_accounts = [accounts[(budget.pk, period_start)] for budget, period_start, _ in plan]
+        # a split must stay on its RealTxn's account
+        if any(account.real_acct_id != txn.real_account_id for account in txn_accounts):
+            result.unallocated_count += 1
+            continue
+        for account, (_, _, amount) in zip(txn_accounts, plan):
+            splits.append((txn.owner_id, account.pk, txn.pk, day, amount))
+        result.allocated_count += 1
+        result.owner_ids.add(txn.owner_id)
+    
+    result.virtualtxn_count = insert_splits(splits, batch_size=batch_size)
+    return result
+
+
+def insert_splits(splits, batch_size=None):
+    """
+    Writes splits, (owner pk, VirtualAcct pk, RealTxn pk, date, value in
+    cents) tuples, as VirtualTxn rows with bulk_insert(), batch_size rows
+    per executemany. That sends no signals, so the running balances and
+    checkpoints of their VirtualAccts and the change counts of the
+    RealAccts those belong to are adjusted here once per account. Does not
+    manage the database transaction. Returns the number of splits written.
+    """
+    daily_totals = defaultdict(lambda: defaultdict(int))
+    for owner_id, acct_id, real_txn_id, day, value in splits:
+        daily_totals[acct_id][day] += value
+    
+    bulk_insert(VirtualTxn, ['owner', 'virtual_acct', 'real_txn', 'date', 'value'],
+                [(owner_id, acct_id, real_txn_id, unicode(day), format_cents(value))
+                 for owner_id, acct_id, real_txn_id, day, value in splits],
+                batch_size=batch_size)
+    adjust_balances(VirtualAcct, dict((pk, from_cents(sum(totals.values())))
+                                      for pk, totals in daily_totals.items()))
+    for pk, totals in daily_totals.items():
+        shift_checkpoints_by_day(VirtualAcctCheckpoint, pk, totals)
+    if daily_totals:
+        bump_change_counts(RealAcct.objects.filter(virtualacct__in=list(daily_totals)))
+    return len(splits)
+
+
+def allocate(realtxns, batch_size=None, skip_allocated=True):
+    """
+    Runs allocate_splits() in one database transaction, then marks the
+    owners' cached pages stale. Returns an AllocationResult.
+    """
+    result = transaction.commit_on_success(allocate_splits)(
+        realtxns, batch_size=batch_size, skip_allocated=skip_allocated)
+    for owner_id in result.owner_ids:
+        bump_ledger_version(owner_id)
+    return result
@@ -0,0 +1,117 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+"""
+Generators that render the full transaction history of a RealAcct as CSV or
+OFX, a piece at a time, for use with a StreamingHttpResponse.
+"""
+
+import csv
+from xml.sax.saxutils import escape
+
+from django.db.models import Min, Max
+from django.utils import timezone
+
+from shared.ledger import as_decimal
+from shared.models import CENTS
+from shared.pagination import keyset_chunks
+
+CSV_HEADER = ('date', 'transaction', 'value', 'category', 'budget',
+              'virtual account', 'split value')
+
+
+class _Echo(object):
+    """
+    File-like object whose write() returns what it was given, so a csv
+    writer can produce one line at a time.
+    """
+    def write(self, value):
+        return value
+
+
+def _utf8(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def _amount(value):
+    return as_decimal(value).quantize(CENTS)
+
+
+def _realtxn_chunks(realacct):
+    queryset = realacct.realtxn_set.select_related('category__budget')\
+        .prefetch_related('virtualtxn_set__virtual_acct')
+    return keyset_chunks(queryset)
+
+
+def csv_lines(realacct):
+    """
+    Yields the CSV export of realacct: one line per VirtualTxn split, or one
+    line with empty split columns for a RealTxn without splits.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for chunk in _realtxn_chunks(realacct):
+        for txn in chunk:
+            row = [txn.date.isoformat(), txn.pk, _amount(txn.value),
+                   _utf8(txn.category.name), _utf8(txn.category.budget.name)]
+            splits = txn.virtualtxn_set.all()
+            if not splits:
+                yield writer.writerow(row + ['', ''])
+            for split in splits:
+                yield writer.writerow(row + [_utf8(split.virtual_acct.name), _amount(split.value)])
+
+
+def _ofx_date(value):
+    return value.strftime('%Y%m%d')
+
+
+def ofx_lines(realacct):
+    """
+    Yields the OFX 2 bank statement export of realacct, one STMTTRN per
+    RealTxn. Splits are listed in the MEMO of their transaction.
+    """
+    dates = realacct.realtxn_set.aggregate(first=Min('date'), last=Max('date'))
+    today = timezone.localtime(timezone.now()).date()
+    
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<?OFX OFXHEADER="200" VERSION="211" SECURITY="NONE" '
+           'OLDFILEUID="NONE" NEWFILEUID="NONE"?>\n')
+    yield ('<OFX><BANKMSGSRSV1><STMTTRNRS><TRNUID>0</TRNUID>'
+           '<STATUS><CODE>0</CODE><SEVERITY>INFO</SEVERITY></STATUS>\n'
+           '<STMTRS><CURDEF>CAD</CURDEF>'
+           '<BANKACCTFROM><BANKID>0</BANKID><ACCTID>%d</ACCTID>'
+           '<ACCTTYPE>CHECKING</ACCTTYPE></BANKACCTFROM>\n'
+           '<BANKTRANLIST><DTSTART>%s</DTSTART><DTEND>%s</DTEND>\n'
+           % (realacct.pk, _ofx_date(dates['first'] or today), _ofx_date(dates['last'] or today)))
+    
+    for chunk in _realtxn_chunks(realacct):
+        lines = []
+        for txn in chunk:
+            memo = '; '.join('%s: %s' % (split.virtual_acct.name, _amount(split.value))
+                             for split in txn.virtualtxn_set.all())
+            lines.append(
+                '<STMTTRN><TRNTYPE>%s</TRNTYPE><DTPOSTED>%s</DTPOSTED>'
+                '<TRNAMT>%s</TRNAMT><FITID>%d</FITID><NAME>%s</NAME>'
+                '<MEMO>%s</MEMO></STMTTRN>\n' % (
+                    'CREDIT' if txn.value >= 0 else 'DEBIT', _ofx_date(txn.date),
+                    _amount(txn.value), txn.pk, escape(txn.category.name), escape(memo)))
+        yield _utf8(u''.join(lines))
+    
+    yield ('</BANKTRANLIST>\n'
+           '<LEDGERBAL><BALAMT>%s</BALAMT><DTASOF>%s</DTASOF></LEDGERBAL>\n'
+           '</STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n'
+           % (realacct.balance, _ofx_date(today)))
@@ -0,0 +1,269 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+"""
+Parsers for bank statements, and the bulk import of parsed statement lines
+into RealTxn rows.
+
+Each parser takes an iterable of lines and yields (date, value) tuples, with
+credits positive and debits negative as on RealTxn.
+"""
+
+import csv
+import re
+import time
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.db.models import F, Max
+
+from shared.bulk import build_instances, bulk_insert
+from shared.cache import bump_ledger_version
+from shared.controllers import local_date
+from shared.ledger import (
+    adjust_rollups,
+    as_cents,
+    format_cents,
+    from_cents,
+    month_start,
+    shift_checkpoints_by_day,
+)
+from shared.models import (
+    ClosedPeriodError,
+    Category,
+    RealAcct,
+    RealTxn,
+    RealAcctCheckpoint,
+    CategoryMonthTotal,
+)
+
+from accounts.allocation import allocate_splits
+
+# rows per executemany; None writes a whole import with one
+DEFAULT_BATCH_SIZE = None
+
+CSV_DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y', '%Y%m%d')
+QIF_DATE_FORMATS = ('%m/%d/%Y', '%m/%d/%y', "%m/%d'%Y", "%m/%d'%y", '%d/%m/%Y', '%Y-%m-%d')
+
+
+class StatementError(Exception):
+    """
+    Raised when a statement line cannot be parsed.
+    """
+
+
+def _parse_date(value, formats):
+    value = value.strip()
+    for date_format in formats:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    raise StatementError(u"Unrecognized date %r" % value)
+
+
+def _parse_value(value):
+    try:
+        return Decimal(value.strip().replace(',', '').replace('$', ''))
+    except InvalidOperation:
+        raise StatementError(u"Unrecognized amount %r" % value)
+
+
+def parse_csv(lines):
+    """
+    Parses a CSV statement with a header row. The date is read from a 'date'
+    column, and the value from an 'amount' or 'value' column, or from
+    'credit' and 'debit' columns.
+    """
+    reader = csv.reader(lines)
+    header = [column.strip().lower() for column in next(reader)]
+    if 'date' not in header:
+        raise StatementError(u"CSV statement has no date column")
+    date_i = header.index('date')
+    
+    for row in reader:
+        if not row:
+            continue
+        row = dict(zip(header, row))
+        if row.get('amount') or row.get('value'):
+            value = _parse_value(row.get('amount') or row.get('value'))
+        else:
+            value = (_parse_value(row.get('credit') or '0')
+                     - abs(_parse_value(row.get('debit') or '0')))
+        yield _parse_date(row[header[date_i]], CSV_DATE_FORMATS), value
+
+
+OFX_TAG = re.compile(r'<(DTPOSTED|TRNAMT)>([^<\r\n]+)', re.IGNORECASE)
+
+
+def parse_ofx(lines):
+    """
+    Parses the STMTTRN entries of an OFX statement, SGML (1.x) or XML (2.x).
+    """
+    posted = None
+    for match in OFX_TAG.finditer(''.join(lines)):
+        tag, value = match.group(1).upper(), match.group(2).strip()
+        if tag == 'DTPOSTED':
+            posted = _parse_date(value[:8], ('%Y%m%d',))
+        elif posted is not None:
+            yield posted, _parse_value(value)
+            posted = None
+
+
+def parse_qif(lines):
+    """
+    Parses the D (date) and T (amount) fields of each entry in a QIF
+    statement. Entries end with a '^' line.
+    """
+    posted = value = None
+    for line in lines:
+        line = line.strip()
+        if line.startswith('D'):
+            posted = _parse_date(line[1:], QIF_DATE_FORMATS)
+        elif line.startswith('T') or line.startswith('U'):
+            value = _parse_value(line[1:])
+        elif line == '^':
+            if posted is not None and value is not None:
+                yield posted, value
+            posted = value = None
+
+
+PARSERS = {
+    'csv': parse_csv,
+    'ofx': parse_ofx,
+    'qif': parse_qif,
+}
+
+
+class ImportResult(object):
+    """
+    Counts and timing of one statement import.
+    """
+    
+    def __init__(self):
+        self.realtxn_count = 0
+        self.virtualtxn_count = 0
+        self.unsplit_count = 0
+        self.seconds = 0.0
+    
+    @property
+    def rows_per_second(self):
+        if not self.seconds:
+            return 0.0
+        return self.realtxn_count / self.seconds
+    
+    def __unicode__(self):
+        return (u"Imported %d transactions (%d splits, %d left unsplit) in %.2fs, "
+                u"%.0f transactions/s" % (self.realtxn_count, self.virtualtxn_count,
+                                          self.unsplit_count, self.seconds,
+                                          self.rows_per_second))
+
+
+def import_statement(realacct, category, entries, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Imports (date, value) entries as RealTxn rows on realacct with the given
+    category, in one database transaction. Each RealTxn is split by the
+    category's AllocationRules (see accounts.allocation); without rules its
+    full value goes to the category budget's VirtualAcct for the period of
+    its date.
+    
+    Rows are inserted with bulk_insert(), which does not send signals, so
+    running balances, checkpoints and category month totals are adjusted
+    here once per import. The owner's ledger version is bumped once the
+    import is committed.
+    Returns an ImportResult.
+    """
+    started = time.time()
+    result = _import_entries(realacct, category, entries, batch_size)
+    bump_ledger_version(realacct.owner_id)
+    result.seconds = time.time() - started
+    return result
+
+
+@transaction.commit_on_success
+def _import_entries(realacct, category, entries, batch_size):
+    result = ImportResult()
+    realtxns = insert_realtxns(realacct, [(day, value, category.pk) for day, value in entries],
+                               batch_size)
+    result.realtxn_count = len(realtxns)
+    allocation = allocate_splits(realtxns, batch_size=batch_size, skip_allocated=False)
+    result.virtualtxn_count = allocation.virtualtxn_count
+    result.unsplit_count = allocation.unallocated_count
+    return result
+
+
+def insert_realtxns(realacct, entries, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Writes (date, value, category pk) entries as RealTxn rows on realacct
+    with bulk_insert(), batch_size rows per executemany. That sends no
+    signals, so the account's running balance, change count and
+    checkpoints and the category month totals are adjusted here once for
+    the batch, from sums in integer cents. Does not manage the database
+    transaction. Returns the new RealTxns, with their pks, in the order of
+    entries.
+    
+    Raises ClosedPeriodError, before writing anything, if an entry is dated
+    in a closed period of its category's budget.
+    """
+    entries = [(local_date(day), value, as_cents(value), category_id)
+               for day, value, category_id in entries]
+    if not entries:
+        return []
+    closed_through = dict(Category.objects.filter(
+        pk__in=set(category_id for _, _, _, category_id in entries),
+        budget__closed_through__isnull=False).values_list('pk', 'budget__closed_through'))
+    for day, _, _, category_id in entries:
+        if category_id in closed_through and day <= closed_through[category_id]:
+            raise ClosedPeriodError(u"%s is in a closed budget period." % day)
+    
+    daily_totals = defaultdict(int)
+    month_totals = defaultdict(int)
+    for day, _, cents, category_id in entries:
+        daily_totals[day] += cents
+        month_totals[(realacct.owner_id, category_id, month_start(day))] += cents
+    
+    # Updating the balance first locks the account row, and every other
+    # writer to this account updates the same row, so no other RealTxn on
+    # this account can commit with an id in the range inserted below.
+    RealAcct.objects.filter(pk=realacct.pk).update(
+        running_balance=F('running_balance') + from_cents(sum(daily_totals.values())),
+        change_count=F('change_count') + 1)
+    last_id = RealTxn.objects.aggregate(last=Max('id'))['last'] or 0
+    
+    fields = ['owner', 'real_account', 'category', 'date', 'value']
+    rows = [(realacct.owner_id, realacct.pk, category_id, unicode(day), format_cents(cents))
+            for day, _, cents, category_id in entries]
+    # SQLite numbers new rows on from the largest id, and the update above
+    # took its database-wide write lock, so the rows are written with the
+    # ids SQLite would give them; other databases' are read back in insert
+    # order.
+    if connection.vendor == 'sqlite':
+        pks = xrange(last_id + 1, last_id + 1 + len(rows))
+        bulk_insert(RealTxn, ['id'] + fields, [(pk,) + row for pk, row in zip(pks, rows)],
+                    batch_size=batch_size)
+    else:
+        bulk_insert(RealTxn, fields, rows, batch_size=batch_size)
+        pks = RealTxn.objects.filter(real_account=realacct, id__gt=last_id)\
+            .order_by('id').values_list('id', flat=True)
+    realtxns = build_instances(RealTxn, ['id'] + fields,
+                               [(pk, realacct.owner_id, realacct.pk, category_id, day, value)
+                                for pk, (day, value, _, category_id) in zip(pks, entries)])
+    
+    shift_checkpoints_by_day(RealAcctCheckpoint, realacct.pk, daily_totals)
+    adjust_rollups(CategoryMonthTotal, dict((key, from_cents(total))
+                                            for key, total in month_totals.items()))
+    return realtxns
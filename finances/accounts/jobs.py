@@ -0,0 +1,76 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+Job kinds for the heavy work on RealAccts, run by the run_jobs worker; see
+shared.jobs.
+"""
+
+from datetime import datetime
+from decimal import Decimal
+
+from shared.jobs import job_kind, report_progress
+from shared.models import Category, RealAcct, RealTxn
+from shared.pagination import keyset_chunks
+
+from accounts.allocation import AllocationResult, allocate
+from accounts.importers import import_statement
+
+# RealTxns allocated per database transaction by the allocate job
+ALLOCATE_CHUNK_SIZE = 2000
+
+
+def _date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+@job_kind('import_statement')
+def import_statement_job(job, realacct, category, entries):
+    """
+    Imports parsed statement entries, given as [date (YYYY-MM-DD), value]
+    pairs, into the owner's RealAcct with pk realacct, in one database
+    transaction.
+    """
+    realacct = RealAcct.objects.get(owner=job.owner_id, pk=realacct)
+    category = Category.objects.get(owner=job.owner_id, pk=category)
+    entries = [(_date(day), Decimal(value)) for day, value in entries]
+    report_progress(job, 0, len(entries))
+    return unicode(import_statement(realacct, category, entries))
+
+
+@job_kind('allocate')
+def allocate_job(job, first=None, last=None):
+    """
+    Splits the owner's RealTxns that have no splits yet, optionally only
+    those dated from first to last (YYYY-MM-DD), oldest first. Each chunk
+    of ALLOCATE_CHUNK_SIZE is allocated in its own database transaction;
+    transactions already split are skipped, so a retry resumes where a
+    failed attempt stopped.
+    """
+    realtxns = RealTxn.objects.filter(owner=job.owner_id, virtualtxn__isnull=True)
+    if first:
+        realtxns = realtxns.filter(date__gte=_date(first))
+    if last:
+        realtxns = realtxns.filter(date__lte=_date(last))
+    report_progress(job, 0, realtxns.count())
+    
+    total = AllocationResult()
+    for chunk in keyset_chunks(realtxns, chunk_size=ALLOCATE_CHUNK_SIZE):
+        result = allocate(chunk)
+        total.virtualtxn_count += result.virtualtxn_count
+        total.allocated_count += result.allocated_count
+        total.unallocated_count += result.unallocated_count
+        total.skipped_count += result.skipped_count
+        report_progress(job, job.progress + len(chunk))
+    return unicode(total)
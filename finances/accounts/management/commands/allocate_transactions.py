@@ -0,0 +1,61 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+from datetime import datetime
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from shared.models import RealTxn
+
+from accounts.allocation import allocate
+
+
+def _date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError('Dates must be given as YYYY-MM-DD, not %r' % value)
+
+
+class Command(BaseCommand):
+    args = '<username>'
+    help = ('Splits every RealTxn of a user that has no VirtualTxn splits yet by '
+            'the AllocationRules of its Category, as one batch.')
+    option_list = BaseCommand.option_list + (
+        make_option('--from', dest='first',
+                    help='only transactions dated on or after this date (YYYY-MM-DD)'),
+        make_option('--to', dest='last',
+                    help='only transactions dated on or before this date (YYYY-MM-DD)'),
+        make_option('--batch-size', type='int', default=None,
+                    help='rows per INSERT statement (default: as many as the database allows)'),
+    )
+    
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: allocate_transactions %s' % self.args)
+        try:
+            owner = User.objects.get(username=args[0])
+        except User.DoesNotExist:
+            raise CommandError('No user %r' % args[0])
+        
+        realtxns = RealTxn.objects.filter(owner=owner, virtualtxn__isnull=True)
+        if options['first']:
+            realtxns = realtxns.filter(date__gte=_date(options['first']))
+        if options['last']:
+            realtxns = realtxns.filter(date__lte=_date(options['last']))
+        
+        result = allocate(realtxns, batch_size=options['batch_size'], skip_allocated=False)
+        self.stdout.write(unicode(result))
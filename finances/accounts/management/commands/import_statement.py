@@ -0,0 +1,68 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+import os
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shared.models import RealAcct, Category
+
+from accounts.importers import PARSERS, DEFAULT_BATCH_SIZE, StatementError, import_statement
+
+
+class Command(BaseCommand):
+    args = '<realacct_pk> <statement file>'
+    help = ('Imports a CSV, OFX or QIF bank statement into RealTxn rows on a '
+            'RealAcct, with one default VirtualTxn split per transaction.')
+    option_list = BaseCommand.option_list + (
+        make_option('--category', type='int',
+                    help='pk of the Category given to every imported transaction (required)'),
+        make_option('--format', choices=sorted(PARSERS),
+                    help='statement format; taken from the file extension by default'),
+        make_option('--batch-size', type='int', default=DEFAULT_BATCH_SIZE,
+                    help='rows per INSERT statement (default: as many as the database allows)'),
+    )
+    
+    def handle(self, *args, **options):
+        if len(args) != 2:
+            raise CommandError('Usage: import_statement %s' % self.args)
+        if options['category'] is None:
+            raise CommandError('--category is required')
+        
+        try:
+            realacct = RealAcct.objects.get(pk=args[0])
+        except RealAcct.DoesNotExist:
+            raise CommandError('No RealAcct with pk %s' % args[0])
+        try:
+            category = Category.objects.select_related('budget').get(
+                pk=options['category'], owner=realacct.owner_id)
+        except Category.DoesNotExist:
+            raise CommandError('No Category with pk %s owned by the account owner'
+                               % options['category'])
+        
+        statement_format = options['format'] or os.path.splitext(args[1])[1][1:].lower()
+        if statement_format not in PARSERS:
+            raise CommandError('Unknown statement format %r; use --format' % statement_format)
+        
+        with open(args[1], 'rU') as statement:
+            try:
+                entries = list(PARSERS[statement_format](statement))
+            except StatementError as e:
+                raise CommandError(unicode(e))
+        
+        result = import_statement(realacct, category, entries,
+                                  batch_size=options['batch_size'])
+        self.stdout.write(unicode(result))
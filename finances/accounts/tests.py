@@ -13,6 +13,397 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-"""
-Nothing here yet.
-"""
+from datetime import date
+from decimal import Decimal
+import json
+import os
+import tempfile
+from StringIO import StringIO
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db.models import Sum
+from shared.jobs import enqueue
+from shared.models import Budget, Category, RealAcct, VirtualAcct, RealTxn, VirtualTxn,\
+    AllocationRule, Job
+from accounts.allocation import allocate, split_value
+from accounts.views.mixins.realacct_list import dashboard_realaccts
+
+
+class ExportRealAcctTests(TestCase):
+    """
+    Tests the streamed CSV and OFX exports of a RealAcct.
+    """
+    
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'email@domain.tld', 'pass')
+        budget = Budget.objects.create(owner = self.user, name = 'food', period_budget_amount = '100.00')
+        category = Category.objects.create(owner = self.user, name = 'groceries', budget = budget)
+        self.acct = RealAcct.objects.create(owner = self.user, name = 'chequing')
+        vacct = VirtualAcct.objects.create(owner = self.user, name = 'food envelope',
+                                           real_acct = self.acct, parent_budget = budget)
+        txn = RealTxn.objects.create(owner = self.user, value = '-12.50', category = category,
+                                     real_account = self.acct, date = date(2013, 2, 3))
+        VirtualTxn.objects.create(owner = self.user, value = '-12.50', real_txn = txn,
+                                  virtual_acct = vacct)
+        RealTxn.objects.create(owner = self.user, value = '100.00', category = category,
+                               real_account = self.acct, date = date(2013, 2, 1))
+        self.client.login(username = 'testuser', password = 'pass')
+    
+    def export(self, export_format):
+        response = self.client.get(reverse('accounts:real-export', args = [self.acct.pk, export_format]))
+        self.assertEqual(response.status_code, 200)
+        assert(response.streaming)
+        return ''.join(response.streaming_content)
+    
+    def test_csv(self):
+        lines = self.export('csv').splitlines()
+        self.assertEqual(len(lines), 3)
+        assert(lines[1].startswith('2013-02-01,'))
+        assert(lines[2].endswith(',groceries,food,food envelope,-12.50'))
+    
+    def test_ofx(self):
+        content = self.export('ofx')
+        self.assertEqual(content.count('<STMTTRN>'), 2)
+        assert('<DTSTART>20130201</DTSTART><DTEND>20130203</DTEND>' in content)
+        assert('<MEMO>food envelope: -12.50</MEMO>' in content)
+        assert('<BALAMT>87.50</BALAMT>' in content)
+    
+    def test_other_owner(self):
+        other = User.objects.create_user('other', 'other@domain.tld', 'pass')
+        self.client.login(username = 'other', password = 'pass')
+        response = self.client.get(reverse('accounts:real-export', args = [self.acct.pk, 'csv']))
+        self.assertEqual(response.status_code, 404)
+
+
+class ShowRealAcctTests(TestCase):
+    """
+    Tests that a RealAcct is only shown to its owner, and that its page of
+    transactions comes with their categories.
+    """
+    
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'email@domain.tld', 'pass')
+        budget = Budget.objects.create(owner = self.user, name = 'food', period_budget_amount = '100.00')
+        category = Category.objects.create(owner = self.user, name = 'groceries', budget = budget)
+        self.acct = RealAcct.objects.create(owner = self.user, name = 'chequing')
+        for day in range(1, 6):
+            RealTxn.objects.create(owner = self.user, value = '-1.00', category = category,
+                                   real_account = self.acct, date = date(2013, 1, day))
+        self.path = reverse('accounts:real-detail', args = [self.acct.pk])
+    
+    def test_owner(self):
+        self.client.login(username = 'testuser', password = 'pass')
+        with self.assertNumQueries(4):
+            response = self.client.get(self.path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['realtxn_list']), 5)
+        assert('groceries' in response.content)
+    
+    def test_other_owner(self):
+        User.objects.create_user('other', 'other@domain.tld', 'pass')
+        self.client.login(username = 'other', password = 'pass')
+        self.assertEqual(self.client.get(self.path).status_code, 404)
+
+
+class ImportStatementTests(TestCase):
+    """
+    Tests the statement parsers and the bulk import.
+    """
+    
+    CSV = 'Date,Description,Amount\n2013-01-05,Groceries,-40.25\n2013-02-10,Pay,1000.00\n'
+    OFX = ('<OFX><STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20130105120000<TRNAMT>-40.25</STMTTRN>'
+           '<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20130210<TRNAMT>1000.00</STMTTRN></OFX>')
+    QIF = '!Type:Bank\nD01/05/2013\nT-40.25\nPGroceries\n^\nD02/10/2013\nT1,000.00\n^\n'
+    
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'email@domain.tld', 'pass')
+        self.budget = Budget.objects.create(owner = self.user, name = 'food', period_budget_amount = '100.00')
+        self.category = Category.objects.create(owner = self.user, name = 'groceries', budget = self.budget)
+        self.acct = RealAcct.objects.create(owner = self.user, name = 'chequing')
+        self.paths = []
+    
+    def tearDown(self):
+        for path in self.paths:
+            os.remove(path)
+    
+    def assert_imported(self):
+        self.assertEqual(RealAcct.objects.get(pk = self.acct.pk).balance, Decimal('959.75'))
+        self.assertEqual(RealTxn.objects.filter(real_account = self.acct).count(), 2)
+        self.assertEqual(self.acct.balance_as_of(date(2013, 1, 31)), Decimal('-40.25'))
+        
+        january = VirtualAcct.objects.get(parent_budget = self.budget, period_start = date(2013, 1, 1))
+        self.assertEqual(january.balance, Decimal('-40.25'))
+        self.assertEqual(january.virtualtxn_set.get().real_txn.value, Decimal('-40.25'))
+        self.assertEqual(VirtualAcct.objects.filter(parent_budget = self.budget).count(), 2)
+        
+        totals = self.category.month_totals.values_list('month', 'total')
+        self.assertEqual(dict(totals), {date(2013, 1, 1): Decimal('-40.25'),
+                                        date(2013, 2, 1): Decimal('1000.00')})
+    
+    def test_command(self):
+        # checkpoints made before the import must include it
+        self.acct.balance_as_of(date(2013, 3, 1))
+        for statement_format in ('csv', 'ofx', 'qif'):
+            descriptor, path = tempfile.mkstemp(suffix = '.' + statement_format)
+            self.paths.append(path)
+            with os.fdopen(descriptor, 'w') as statement:
+                statement.write(getattr(self, statement_format.upper()))
+            RealTxn.objects.filter(real_account = self.acct).delete()
+            call_command('import_statement', self.acct.pk, path, category = self.category.pk,
+                         stdout = StringIO())
+            self.assert_imported()
+            self.assertEqual(self.acct.balance_as_of(date(2013, 3, 1)), Decimal('959.75'))
+    
+    def test_upload(self):
+        self.client.login(username = 'testuser', password = 'pass')
+        response = self.client.post(reverse('accounts:real-import', args = [self.acct.pk]), {
+            'statement': SimpleUploadedFile('statement.csv', self.CSV),
+            'format': 'csv',
+            'category': self.category.pk,
+        })
+        self.assertEqual(response.status_code, 302)
+        # the import is queued for the worker
+        self.assertEqual(RealTxn.objects.count(), 0)
+        call_command('run_jobs', once = True, stdout = StringIO())
+        self.assert_imported()
+
+
+class DashboardTests(TestCase):
+    """
+    Tests that the dashboard figures come from one query however many
+    accounts there are.
+    """
+    
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'email@domain.tld', 'pass')
+        self.budget = Budget.objects.create(owner = self.user, name = 'food', period_budget_amount = '100.00')
+        self.category = Category.objects.create(owner = self.user, name = 'groceries', budget = self.budget)
+    
+    def add_account(self, name):
+        acct = RealAcct.objects.create(owner = self.user, name = name)
+        for value in ('-30.00', '500.00'):
+            RealTxn.objects.create(owner = self.user, value = value, category = self.category,
+                                   real_account = acct, date = date(2013, 1, 1))
+        return acct
+    
+    def test_dashboard_realaccts(self):
+        acct = self.add_account('chequing')
+        vacct = VirtualAcct.objects.create(owner = self.user, name = 'food', real_acct = acct,
+                                           parent_budget = self.budget)
+        txn = acct.realtxn_set.get(value = '-30.00')
+        VirtualTxn.objects.create(owner = self.user, value = '-30.00', real_txn = txn, virtual_acct = vacct)
+        VirtualTxn.objects.create(owner = self.user, value = '50.00', real_txn = txn, virtual_acct = vacct)
+        
+        with self.assertNumQueries(1):
+            [row] = list(dashboard_realaccts(self.user))
+        self.assertEqual(row.balance, Decimal('470.00'))
+        self.assertEqual(row.txn_count, 2)
+        self.assertEqual(row.last_activity, date(2013, 1, 1))
+        self.assertEqual(Decimal(str(row.budget_amount)), Decimal('100'))
+        self.assertEqual(Decimal(str(row.budget_spent)), Decimal('30'))
+    
+    def test_query_count(self):
+        self.client.login(username = 'testuser', password = 'pass')
+        self.add_account('chequing')
+        with self.assertNumQueries(5):
+            self.client.get(reverse('accounts:index'))
+        self.add_account('savings')
+        self.add_account('credit card')
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('accounts:index'))
+        self.assertEqual(len(response.context['realacct_list']), 3)
+    
+    def test_budget_query_count(self):
+        self.client.login(username = 'testuser', password = 'pass')
+        acct = self.add_account('chequing')
+        # accounts for a past period only; viewing the dashboard does not
+        # open the current ones
+        VirtualAcct.objects.create(owner = self.user, name = 'food', real_acct = acct,
+                                   parent_budget = self.budget, period_start = date(2013, 1, 1))
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('accounts:index'))
+        self.assertIn('no account yet', response.content)
+        for i in range(4):
+            budget = Budget.objects.create(owner = self.user, name = 'budget %d' % i,
+                                           period_budget_amount = '10.00')
+            VirtualAcct.objects.create(owner = self.user, name = 'budget %d' % i, real_acct = acct,
+                                       parent_budget = budget, period_start = date(2013, 1, 1))
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('accounts:index'))
+        self.assertEqual(len(response.context['budget_list']), 5)
+        self.assertEqual(VirtualAcct.objects.filter(owner = self.user).count(), 5)
+    
+    def test_cached_page(self):
+        self.client.login(username = 'testuser', password = 'pass')
+        acct = self.add_account('chequing')
+        first = self.client.get(reverse('accounts:index')).content
+        # only the ledger version is read
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse('accounts:index')).content, first)
+        
+        RealTxn.objects.create(owner = self.user, value = '-1234.56', category = self.category,
+                               real_account = acct, date = date(2013, 1, 2))
+        self.assertIn('-764.56', self.client.get(reverse('accounts:index')).content)
+
+
+class AllocationTests(TestCase):
+    """
+    Tests that RealTxns are split by their category's allocation rules in
+    one batch, with splits that sum exactly to each RealTxn.
+    """
+    
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'email@domain.tld', 'pass')
+        self.food, self.household, self.savings = [
+            Budget.objects.create(owner = self.user, name = name, period_budget_amount = '100.00')
+            for name in ('food', 'household', 'savings')]
+        self.category = Category.objects.create(owner = self.user, name = 'groceries', budget = self.food)
+        AllocationRule.objects.create(owner = self.user, category = self.category,
+                                      budget = self.savings, percentage = '50.00', priority = 1)
+        AllocationRule.objects.create(owner = self.user, category = self.category,
+                                      budget = self.household, amount = '10.00')
+        self.acct = RealAcct.objects.create(owner = self.user, name = 'chequing')
+    
+    def add_txns(self, acct, values):
+        return [RealTxn.objects.create(owner = self.user, value = value, category = self.category,
+                                       real_account = acct, date = date(2013, 1, n + 1))
+                for n, value in enumerate(values)]
+    
+    def test_split_value(self):
+        rules = list(self.category.allocation_rules.all())
+        self.assertEqual(split_value(Decimal('-100.01'), rules, self.food), [
+            (self.household, Decimal('-10.00')),
+            (self.savings, Decimal('-45.00')),
+            (self.food, Decimal('-45.01')),
+        ])
+        self.assertEqual(split_value(Decimal('5.00'), rules, self.food),
+                         [(self.household, Decimal('5.00'))])
+        
+        rules = [AllocationRule(budget = self.savings, percentage = Decimal('60')),
+                 AllocationRule(budget = self.household, percentage = Decimal('60'))]
+        self.assertEqual(split_value(Decimal('10.00'), rules, self.food), [
+            (self.savings, Decimal('6.00')),
+            (self.household, Decimal('4.00')),
+        ])
+        self.assertEqual(split_value('-3.1', [], self.food), [(self.food, Decimal('-3.10'))])
+        self.assertEqual(split_value(Decimal('0.00'), rules, self.food), [])
+    
+    def test_allocate(self):
+        txns = self.add_txns(self.acct, ['-100.01', '-5.00', '33.33', '0.01'])
+        with self.assertNumQueries(16):
+            result = allocate(txns)
+        self.assertEqual((result.allocated_count, result.virtualtxn_count), (4, 8))
+        
+        for txn in txns:
+            total = txn.virtualtxn_set.aggregate(total = Sum('value'))['total']
+            self.assertEqual(Decimal(str(total)).quantize(Decimal('0.01')), Decimal(txn.value))
+        balances = dict((account.parent_budget_id, account.balance)
+                        for account in VirtualAcct.objects.filter(period_start = date(2013, 1, 1)))
+        self.assertEqual(balances, {self.household.pk: Decimal('-4.99'),
+                                    self.savings.pk: Decimal('-33.34'),
+                                    self.food.pk: Decimal('-33.34')})
+        
+        # already split transactions are left alone
+        result = allocate(txns)
+        self.assertEqual((result.allocated_count, result.skipped_count), (0, 4))
+    
+    def test_other_account(self):
+        self.add_txns(self.acct, ['-20.00'])
+        other = RealAcct.objects.create(owner = self.user, name = 'credit card')
+        self.add_txns(other, ['-30.00'])
+        
+        out = StringIO()
+        call_command('allocate_transactions', 'testuser', stdout = out)
+        # January's accounts were opened on the first RealAcct
+        self.assertEqual(RealTxn.objects.filter(virtualtxn__isnull = True).get().real_account, other)
+        assert('1 could not be allocated' in out.getvalue())
+    
+    def test_job(self):
+        self.add_txns(self.acct, ['-20.00', '-30.00', '15.00'])
+        job = enqueue(self.user, 'allocate', first = '2013-01-02')
+        call_command('run_jobs', once = True, stdout = StringIO())
+        job = Job.objects.get(pk = job.pk)
+        self.assertEqual((job.status, job.progress, job.progress_total), (Job.DONE, 2, 2))
+        self.assertEqual(RealTxn.objects.filter(virtualtxn__isnull = True).get().date, date(2013, 1, 1))
+
+
+class RealTxnApiTests(TestCase):
+    """
+    Tests the batch JSON API of a RealAcct's transactions.
+    """
+    
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'email@domain.tld', 'pass')
+        self.budget = Budget.objects.create(owner = self.user, name = 'food', period_budget_amount = '100.00')
+        self.category = Category.objects.create(owner = self.user, name = 'groceries', budget = self.budget)
+        self.acct = RealAcct.objects.create(owner = self.user, name = 'chequing')
+        self.vacct = VirtualAcct.objects.create(owner = self.user, name = 'other', real_acct = self.acct,
+                                                parent_budget = Budget.objects.create(
+                                                    owner = self.user, name = 'other',
+                                                    period_budget_amount = '100.00'))
+        self.path = reverse('accounts:real-txns', args = [self.acct.pk])
+        self.client.login(username = 'testuser', password = 'pass')
+    
+    def post(self, transactions):
+        return self.client.post(self.path, json.dumps({'transactions': transactions}),
+                                content_type = 'application/json')
+    
+    def test_post(self):
+        response = self.post([
+            {'date': '2013-01-05', 'value': '-40.25', 'category': self.category.pk},
+            {'date': '2013-01-06', 'value': -10.5, 'category': self.category.pk,
+             'splits': [{'virtual_acct': self.vacct.pk, 'value': '-10.50'}]},
+        ])
+        self.assertEqual(response.status_code, 201)
+        result = json.loads(response.content)
+        self.assertEqual((result['created'], result['splits'], result['unsplit']), (2, 2, 0))
+        
+        self.assertEqual(RealAcct.objects.get(pk = self.acct.pk).balance, Decimal('-50.75'))
+        self.assertEqual(VirtualAcct.objects.get(pk = self.vacct.pk).balance, Decimal('-10.50'))
+        first = RealTxn.objects.get(pk = result['ids'][0])
+        self.assertEqual(first.virtualtxn_set.get().virtual_acct.parent_budget, self.budget)
+    
+    def test_invalid(self):
+        other = User.objects.create_user('other', 'other@domain.tld', 'pass')
+        other_category = Category.objects.create(owner = other, name = 'theirs', budget = Budget.objects.create(
+            owner = other, name = 'theirs', period_budget_amount = '100.00'))
+        response = self.post([
+            {'date': '2013-01-05', 'value': '-40.25', 'category': self.category.pk},
+            {'date': '2013-13-05', 'value': '-1.001', 'category': other_category.pk},
+            {'date': '2013-01-06', 'value': '-10.50', 'category': self.category.pk,
+             'splits': [{'virtual_acct': self.vacct.pk, 'value': '-10.00'}]},
+        ])
+        self.assertEqual(response.status_code, 400)
+        errors = json.loads(response.content)['errors']
+        self.assertEqual(sorted(errors), ['1', '2'])
+        self.assertEqual(len(errors['1']), 3)
+        self.assertEqual(RealTxn.objects.count(), 0)
+        self.assertEqual(RealAcct.objects.get(pk = self.acct.pk).change_count, 0)
+    
+    def test_conditional_get(self):
+        RealTxn.objects.create(owner = self.user, value = '-1.00', category = self.category,
+                               real_account = self.acct, date = date(2013, 1, 1))
+        response = self.client.get(self.path)
+        self.assertEqual(response.status_code, 200)
+        [txn] = json.loads(response.content)['transactions']
+        self.assertEqual((txn['value'], txn['date'], txn['splits']), ('-1.00', '2013-01-01', []))
+        
+        # the session is cached, so only the user and the change count are read
+        with self.assertNumQueries(2):
+            response = self.client.get(self.path, HTTP_IF_NONE_MATCH = response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        
+        etag = response['ETag']
+        self.post([{'date': '2013-01-02', 'value': '-2.00', 'category': self.category.pk}])
+        response = self.client.get(self.path, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)['transactions']), 2)
+    
+    def test_other_owner(self):
+        User.objects.create_user('other', 'other@domain.tld', 'pass')
+        self.client.login(username = 'other', password = 'pass')
+        self.assertEqual(self.client.get(self.path).status_code, 404)
+        self.assertEqual(self.post([]).status_code, 404)
@@ -17,10 +17,17 @@ from django.conf.urls import patterns, url
 from accounts.views import Dashboard
 from accounts.views import CreateRealAcct
 from accounts.views import ShowRealAcct
+from accounts.views import ExportRealAcct
+from accounts.views import ImportStatement
+from accounts.views import RealTxnApi
 
 urlpatterns = patterns('',
     # accounts dashboard page
     url(r'^index/$', Dashboard.as_view(), name='index'),
     url(r'^create/$', CreateRealAcct.as_view(), name='create'),
     url(r'^(?P<realacct_pk>\d+)/$', ShowRealAcct.as_view(), name='real-detail'),
+    url(r'^(?P<realacct_pk>\d+)/export\.(?P<export_format>csv|ofx)$',
+        ExportRealAcct.as_view(), name='real-export'),
+    url(r'^(?P<realacct_pk>\d+)/import/$', ImportStatement.as_view(), name='real-import'),
+    url(r'^(?P<realacct_pk>\d+)/txns\.json$', RealTxnApi.as_view(), name='real-txns'),
 )
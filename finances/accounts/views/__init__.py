@@ -16,3 +16,6 @@
 from dash import Dashboard
 from create_real_acct import CreateRealAcct
 from show_real_acct import ShowRealAcct
+from export_real_acct import ExportRealAcct
+from import_statement import ImportStatement
+from txn_api import RealTxnApi
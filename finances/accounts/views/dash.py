@@ -15,12 +15,13 @@
 
 from django.views.generic.base import TemplateView
 
-from shared.views.mixins import LoginRequiredMixin
+from shared.views.mixins import LedgerCacheMixin, LoginRequiredMixin
 
-from accounts.views.mixins import RealAcctListMixin
+from accounts.views.mixins import RealAcctListMixin, BudgetListMixin
 
 
-class Dashboard(RealAcctListMixin, LoginRequiredMixin, TemplateView):
+class Dashboard(LedgerCacheMixin, RealAcctListMixin, BudgetListMixin, LoginRequiredMixin,
+                TemplateView):
     """
     Show a listing of accounts and graphics about their status.
     """
@@ -0,0 +1,50 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.generic.base import View
+
+from shared.models import RealAcct
+from shared.views.mixins import LoginRequiredMixin
+
+from accounts.export import csv_lines, ofx_lines
+
+# export format -> (line generator, content type)
+EXPORT_FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'ofx': (ofx_lines, 'application/x-ofx'),
+}
+
+
+class ExportRealAcct(LoginRequiredMixin, View):
+    """
+    Stream the full transaction history of a RealAcct as CSV or OFX.
+    
+    The export is generated chunk by chunk as it is sent rather than
+    rendered through a template, so memory use does not grow with the
+    size of the account.
+    """
+    
+    def get(self, request, realacct_pk, export_format):
+        if export_format not in EXPORT_FORMATS:
+            raise Http404(u"Unknown export format %s" % export_format)
+        realacct = get_object_or_404(RealAcct.objects.for_user(request.user), pk=realacct_pk)
+        lines, content_type = EXPORT_FORMATS[export_format]
+        
+        response = StreamingHttpResponse(lines(realacct), content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="account-%d.%s"' % (
+            realacct.pk, export_format)
+        return response
@@ -0,0 +1,92 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from django import forms
+from django.contrib import messages
+from django.core.urlresolvers import reverse
+from django.shortcuts import get_object_or_404
+from django.views.generic.edit import BaseFormView
+from django.views.generic.base import TemplateView
+
+from shared.jobs import enqueue
+from shared.models import RealAcct, Category
+from shared.views.mixins import LoginRequiredMixin
+
+from accounts.importers import PARSERS, StatementError
+
+
+class StatementForm(forms.Form):
+    statement = forms.FileField()
+    format = forms.ChoiceField(choices=[(name, name.upper()) for name in sorted(PARSERS)])
+    category = forms.ModelChoiceField(queryset=Category.objects.none())
+    
+    def __init__(self, owner, *args, **kwargs):
+        super(StatementForm, self).__init__(*args, **kwargs)
+        self.fields['category'].queryset = Category.objects.for_user(owner)
+    
+    def clean(self):
+        cleaned_data = super(StatementForm, self).clean()
+        if 'statement' in cleaned_data and 'format' in cleaned_data:
+            parse = PARSERS[cleaned_data['format']]
+            try:
+                cleaned_data['entries'] = list(parse(cleaned_data['statement']))
+            except StatementError as e:
+                raise forms.ValidationError(unicode(e))
+            budget = cleaned_data.get('category') and cleaned_data['category'].budget
+            if budget and any(budget.is_closed_on(day) for day, _ in cleaned_data['entries']):
+                raise forms.ValidationError(u"The statement has transactions in a closed period "
+                                            u"of %s, which ended %s." % (budget, budget.closed_through))
+        return cleaned_data
+
+
+class ImportStatement(BaseFormView, LoginRequiredMixin, TemplateView):
+    """
+    Upload a bank statement to import its transactions into a RealAcct.
+    
+    The statement is parsed here, so errors are shown on the form, and the
+    import itself is queued as an import_statement job for the worker.
+    """
+    
+    template_name = 'accounts/import_statement.hamlpy'
+    form_class = StatementForm
+    
+    @property
+    def realacct(self):
+        if not hasattr(self, '_realacct'):
+            self._realacct = get_object_or_404(RealAcct.objects.for_user(self.request.user),
+                                               pk=self.kwargs['realacct_pk'])
+        return self._realacct
+    
+    def get_form_kwargs(self):
+        kwargs = super(ImportStatement, self).get_form_kwargs()
+        kwargs.update(owner=self.request.user)
+        return kwargs
+    
+    def get_context_data(self, **kwargs):
+        context = {
+            'realacct': self.realacct,
+        }
+        context.update(super(ImportStatement, self).get_context_data(**kwargs))
+        return context
+    
+    def get_success_url(self):
+        return reverse('jobs:list')
+    
+    def form_valid(self, form):
+        entries = [(day.isoformat(), str(value)) for day, value in form.cleaned_data['entries']]
+        enqueue(self.request.user, 'import_statement', realacct=self.realacct.pk,
+                category=form.cleaned_data['category'].pk, entries=entries)
+        messages.success(self.request, u"Queued %d transactions for import" % len(entries))
+        return super(ImportStatement, self).form_valid(form)
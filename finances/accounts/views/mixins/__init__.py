@@ -15,3 +15,4 @@
 
 from realacct_list import RealAcctListMixin
 from realtxn_list import RealTxnListForRealAcctMixin
+from budget_list import BudgetListMixin
@@ -0,0 +1,37 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from shared.models import Budget, VirtualAcct
+
+
+class BudgetListMixin(object):
+    """
+    Add a list of the user's Budgets to context, with the current account
+    of every budget resolved in one query. A budget whose current period
+    has no account yet gets None rather than having one opened, so that
+    rendering the list never writes.
+    """
+    
+    def get_context_data(self, **kwargs):
+        budget_list = list(Budget.objects.for_user(self.request.user))
+        accounts = VirtualAcct.objects.current_for_budgets(budget_list)
+        for budget in budget_list:
+            budget._current_account_cache = accounts.get(budget.pk)
+        
+        context = {
+            'budget_list': budget_list,
+        }
+        context.update(super(BudgetListMixin, self).get_context_data(**kwargs))
+        return context
@@ -13,19 +13,75 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-from shared.models import RealAcct
+from django.db import connection
+from django.db.models import Count, Max
+
+from shared.controllers import PeriodLengthFactory, PERIOD_LENGTH_CHOICES
+from shared.models import RealAcct, VirtualAcct, VirtualTxn, Budget
+
+
+def _current_period_sql():
+    """
+    Returns the SQL condition, and its params, that selects the VirtualAccts
+    ('va') of each budget ('b') for that budget's current period.
+    """
+    conditions, params = [], []
+    for length, _ in PERIOD_LENGTH_CHOICES:
+        conditions.append('(b.period_length = %s AND va.period_start = %s)')
+        params.extend([length, PeriodLengthFactory(length).make_controller().current_period_start_date])
+    return '(%s)' % ' OR '.join(conditions), params
+
+
+def dashboard_realaccts(owner):
+    """
+    Returns the owner's RealAccts annotated with the dashboard figures, in
+    one grouped query:
+    
+    txn_count: the number of RealTxns on the account
+    last_activity: the date of the newest RealTxn on the account
+    budget_amount: the total period_budget_amount of the budgets whose
+        current VirtualAcct is on this account
+    budget_spent: the total debits (as a positive number) on those VirtualAccts
+    
+    The balance is read from the stored running balance.
+    """
+    qn = connection.ops.quote_name
+    current, current_params = _current_period_sql()
+    tables = {
+        'realacct': qn(RealAcct._meta.db_table),
+        'virtualacct': qn(VirtualAcct._meta.db_table),
+        'virtualtxn': qn(VirtualTxn._meta.db_table),
+        'budget': qn(Budget._meta.db_table),
+        'current': current,
+    }
+    budget_amount = (
+        'SELECT COALESCE(SUM(b.period_budget_amount), 0) FROM %(virtualacct)s va '
+        'INNER JOIN %(budget)s b ON va.parent_budget_id = b.id '
+        'WHERE va.real_acct_id = %(realacct)s.id AND %(current)s' % tables)
+    budget_spent = (
+        'SELECT COALESCE(-SUM(vt.value), 0) FROM %(virtualtxn)s vt '
+        'INNER JOIN %(virtualacct)s va ON vt.virtual_acct_id = va.id '
+        'INNER JOIN %(budget)s b ON va.parent_budget_id = b.id '
+        'WHERE va.real_acct_id = %(realacct)s.id AND vt.value < 0 AND %(current)s' % tables)
+    
+    return RealAcct.objects.for_user(owner).annotate(
+        txn_count=Count('realtxn'),
+        last_activity=Max('realtxn__date'),
+    ).extra(
+        select={'budget_amount': budget_amount, 'budget_spent': budget_spent},
+        select_params=current_params + current_params,
+    ).order_by('name')
 
 
 class RealAcctListMixin(object):
     """
-    Add a list of the user's RealAccts to context
+    Add a list of the user's RealAccts to context, annotated with the figures
+    the dashboard shows (see dashboard_realaccts).
     """
     
     def get_context_data(self, **kwargs):
         context = {
-            'realacct_list': RealAcct.objects.filter(
-                _owner=self.request.user
-            )
+            'realacct_list': dashboard_realaccts(self.request.user)
         }
         context.update(super(RealAcctListMixin, self).get_context_data(**kwargs))
         return context
@@ -17,11 +17,15 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.http import Http404
 
 from shared.models import RealAcct
+from shared.pagination import keyset_page
 
 
 class RealTxnListForRealAcctMixin(object):
     """
-    Add a list of the RealTxn objects listed against a RealAcct to context.
+    Add a page of the RealTxn objects listed against a RealAcct to context.
+    
+    Transactions are listed newest first and paged by keyset; the 'before'
+    and 'after' GET parameters hold the cursor of the page to show.
     """
     
     def get_context_data(self, **kwargs):
@@ -31,17 +35,21 @@ class RealTxnListForRealAcctMixin(object):
             raise AttributeError(u"Detail mixin %s must be called with "
                                  u"an object pk." % self.__class__.__name__)
         try:
-            realacct = RealAcct.objects.get(
-                pk=realacct_pk,
-                _owner=self.request.user
-            )
+            realacct = RealAcct.objects.for_user(self.request.user).get(pk=realacct_pk)
         except ObjectDoesNotExist:
             raise Http404(u"No %(verbose_name)s found matching the query" %
                           {'verbose_name': RealAcct._meta.verbose_name})  # @UndefinedVariable
         
+        realtxn_page = keyset_page(
+            realacct.realtxn_set.select_related('category'),
+            before=self.request.GET.get('before'),
+            after=self.request.GET.get('after'),
+        )
+        
         context = {
             'realacct': realacct,
-            'realtxn_list': realacct.realtxn_set.all(),
+            'realtxn_page': realtxn_page,
+            'realtxn_list': realtxn_page.object_list,
         }
         context.update(super(RealTxnListForRealAcctMixin, self).get_context_data(**kwargs))
         return context
@@ -15,12 +15,12 @@
 
 from django.views.generic.base import TemplateView
 
-from shared.views.mixins import LoginRequiredMixin
+from shared.views.mixins import LedgerCacheMixin, LoginRequiredMixin
 
 from accounts.views.mixins import RealTxnListForRealAcctMixin
 
 
-class ShowRealAcct(RealTxnListForRealAcctMixin, LoginRequiredMixin, TemplateView):
+class ShowRealAcct(LedgerCacheMixin, RealTxnListForRealAcctMixin, LoginRequiredMixin, TemplateView):
     """
     View the transactions listed against a RealAcct.
     """
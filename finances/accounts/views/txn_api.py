@@ -0,0 +1,235 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from hashlib import md5
+
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.views.generic.base import View
+
+from shared.cache import bump_ledger_version
+from shared.ledger import as_cents, as_decimal
+from shared.models import CENTS, Category, RealAcct, RealTxn, VirtualAcct, VirtualTxn
+from shared.pagination import PAGE_SIZE, keyset_page
+from shared.views.mixins import LoginRequiredMixin
+
+from accounts.allocation import allocate_splits, insert_splits
+from accounts.importers import DEFAULT_BATCH_SIZE, insert_realtxns
+
+MAX_PAGE_SIZE = 1000
+MAX_BATCH_SIZE = 10000
+
+# largest magnitude that fits the decimal fields of the ledger
+MAX_VALUE = Decimal('1e13')
+
+
+def _etag(request, realacct_pk):
+    """
+    Returns the ETag of a page of the account's transactions: the account's
+    change count and the query string. None for an account the user does
+    not own, so the view itself answers with a 404.
+    """
+    change_counts = list(RealAcct.objects.for_user(request.user).filter(pk=realacct_pk)
+                         .values_list('change_count', flat=True))
+    if not change_counts:
+        return None
+    return '%d-%s' % (change_counts[0], md5(request.get_full_path()).hexdigest()[:12])
+
+
+def _json(data, status=200):
+    return HttpResponse(json.dumps(data), content_type='application/json', status=status)
+
+
+def _value(value):
+    value = Decimal(value) if isinstance(value, basestring) else value
+    if not isinstance(value, Decimal) or value != value.quantize(CENTS) or abs(value) >= MAX_VALUE:
+        raise ValueError()
+    return value
+
+
+class RealTxnApi(LoginRequiredMixin, View):
+    """
+    The RealTxns on a RealAcct, with their VirtualTxn splits, as JSON.
+    
+    GET returns a keyset page of transactions newest first; the optional
+    parameters are a before or after cursor and limit (at most
+    MAX_PAGE_SIZE). Every page has an ETag derived from the account's change
+    count, so a client that sends it back in If-None-Match gets a 304, with
+    a single query, until the account's transactions change.
+    
+    POST takes {"transactions": [...]}, at most MAX_BATCH_SIZE of them, each
+    {"date": "YYYY-MM-DD", "value": "-12.50", "category": pk} with optional
+    "splits": [{"virtual_acct": pk, "value": "-12.50"}, ...] that must sum
+    to the value and be on VirtualAccts of this account. Transactions given
+    without splits are split by their category's AllocationRules, like
+    imported ones. Either every transaction is valid and the batch is
+    written with bulk inserts in one database transaction, or nothing is
+    written and the errors are returned by position with a 400.
+    """
+    
+    def get_realacct(self):
+        try:
+            return RealAcct.objects.for_user(self.request.user).get(pk=self.kwargs['realacct_pk'])
+        except RealAcct.DoesNotExist:
+            raise Http404(u"No RealAcct found matching the query")
+    
+    @method_decorator(condition(etag_func=_etag))
+    def get(self, request, realacct_pk):
+        try:
+            limit = int(request.GET.get('limit', PAGE_SIZE))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= MAX_PAGE_SIZE:
+            return HttpResponseBadRequest(u"limit must be from 1 to %d" % MAX_PAGE_SIZE)
+        realacct = self.get_realacct()
+        
+        page = keyset_page(RealTxn.objects.filter(real_account=realacct),
+                           before=request.GET.get('before'), after=request.GET.get('after'),
+                           page_size=limit)
+        splits = dict((txn.pk, []) for txn in page)
+        for pk, real_txn_id, virtual_acct_id, value in VirtualTxn.objects\
+                .filter(real_txn__in=list(splits)).order_by('pk')\
+                .values_list('pk', 'real_txn', 'virtual_acct', 'value'):
+            splits[real_txn_id].append({
+                'id': pk,
+                'virtual_acct': virtual_acct_id,
+                'value': str(as_decimal(value).quantize(CENTS)),
+            })
+        
+        return _json({
+            'realacct': realacct.pk,
+            'change_count': realacct.change_count,
+            'before': page.older_cursor,
+            'after': page.newer_cursor,
+            'transactions': [{
+                'id': txn.pk,
+                'date': txn.date.isoformat(),
+                'posted': txn.posted.isoformat(),
+                'value': str(as_decimal(txn.value).quantize(CENTS)),
+                'category': txn.category_id,
+                'splits': splits[txn.pk],
+            } for txn in page],
+        })
+    
+    def post(self, request, realacct_pk):
+        realacct = self.get_realacct()
+        try:
+            items = json.loads(request.body, parse_float=Decimal)['transactions']
+        except (ValueError, TypeError, KeyError):
+            return HttpResponseBadRequest(u"The body must be a JSON object with a transactions list")
+        if not isinstance(items, list) or not 0 < len(items) <= MAX_BATCH_SIZE:
+            return HttpResponseBadRequest(u"transactions must list 1 to %d transactions"
+                                          % MAX_BATCH_SIZE)
+        
+        entries, splits, errors = self.clean(realacct, items)
+        if errors:
+            return _json({'errors': errors}, status=400)
+        
+        realtxns, allocation, split_count = transaction.commit_on_success(self.create)(
+            realacct, entries, splits)
+        bump_ledger_version(realacct.owner_id)
+        return _json({
+            'created': len(realtxns),
+            'ids': [txn.pk for txn in realtxns],
+            'splits': split_count + allocation.virtualtxn_count,
+            'unsplit': allocation.unallocated_count,
+            'change_count': RealAcct.objects.get(pk=realacct.pk).change_count,
+        }, status=201)
+    
+    def clean(self, realacct, items):
+        """
+        Returns the (date, value, category pk) entries and {position: [(virtual
+        acct pk, value), ...]} splits of the items, and a dict of the errors
+        of each invalid item by position. Every category and VirtualAcct is
+        checked, along with the closed periods of their budgets, with one
+        query.
+        """
+        owner = self.request.user
+        is_pk = lambda value: isinstance(value, (int, long))
+        wanted_categories = set()
+        wanted_accounts = set()
+        for item in items:
+            if isinstance(item, dict):
+                if is_pk(item.get('category')):
+                    wanted_categories.add(item['category'])
+                item_splits = item.get('splits')
+                for split in item_splits if isinstance(item_splits, list) else ():
+                    if isinstance(split, dict) and is_pk(split.get('virtual_acct')):
+                        wanted_accounts.add(split['virtual_acct'])
+        # pk -> the end of the last closed period of its budget
+        categories = dict(Category.objects.for_user(owner).filter(pk__in=wanted_categories)
+                          .values_list('pk', 'budget__closed_through'))
+        accounts = dict(VirtualAcct.objects.for_user(owner)
+                        .filter(pk__in=wanted_accounts, real_acct=realacct)
+                        .values_list('pk', 'parent_budget__closed_through'))
+        known = lambda pks, value: is_pk(value) and value in pks
+        
+        entries, splits, errors = [], {}, {}
+        for position, item in enumerate(items):
+            item_errors = []
+            if not isinstance(item, dict):
+                errors[position] = [u"must be an object"]
+                continue
+            try:
+                day = datetime.strptime(item.get('date'), '%Y-%m-%d').date()
+            except (TypeError, ValueError):
+                item_errors.append(u"date must be YYYY-MM-DD")
+            try:
+                value = _value(item.get('value'))
+            except (TypeError, ValueError, InvalidOperation):
+                item_errors.append(u"value must be an amount in cents")
+            if not known(categories, item.get('category')):
+                item_errors.append(u"category must be one of your categories")
+            
+            item_splits = []
+            if item.get('splits') is not None:
+                try:
+                    for split in item['splits']:
+                        if not known(accounts, split['virtual_acct']):
+                            raise ValueError()
+                        item_splits.append((split['virtual_acct'], _value(split['value'])))
+                except (TypeError, ValueError, KeyError, InvalidOperation):
+                    item_errors.append(u"splits must list virtual_acct and value, with "
+                                       u"VirtualAccts of this account")
+                else:
+                    if not item_errors and sum(amount for _, amount in item_splits) != value:
+                        item_errors.append(u"splits must sum to the value")
+                    splits[position] = item_splits
+            
+            if not item_errors:
+                closed = [categories[item['category']]] + [accounts[pk] for pk, _ in item_splits]
+                if any(through is not None and day <= through for through in closed):
+                    item_errors.append(u"date is in a closed budget period")
+            
+            if item_errors:
+                errors[position] = item_errors
+            else:
+                entries.append((day, value, item['category']))
+        return entries, splits, errors
+    
+    def create(self, realacct, entries, splits):
+        realtxns = insert_realtxns(realacct, entries, DEFAULT_BATCH_SIZE)
+        explicit = [(realacct.owner_id, virtual_acct_id, txn.pk, txn.date, as_cents(value))
+                    for position, txn in enumerate(realtxns)
+                    for virtual_acct_id, value in splits.get(position, ())]
+        split_count = insert_splits(explicit, batch_size=DEFAULT_BATCH_SIZE)
+        allocation = allocate_splits([txn for position, txn in enumerate(realtxns)
+                                      if position not in splits],
+                                     batch_size=DEFAULT_BATCH_SIZE, skip_allocated=False)
+        return realtxns, allocation, split_count
@@ -0,0 +1,140 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+"""
+Budget burn-down: spend against period_budget_amount for every period of
+every Budget a user has, from the period of the budget's first transaction
+through the current period.
+
+RealTxn values reach a budget through their Category. The ledger is read
+with one query grouped by (budget, date), and the daily totals are bucketed
+into periods with the batch API of the period length controllers. Closed
+periods (see budgets.closing) never change, so they are read from their
+BudgetSnapshot rows instead, and only transactions after them are summed.
+"""
+
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy
+from django.db.models import Sum
+
+from shared.controllers import PeriodLengthFactory, local_date
+from shared.ledger import as_cents, from_cents
+from shared.models import CENTS, Budget, BudgetSnapshot, RealTxn
+
+BudgetPeriod = namedtuple('BudgetPeriod', ('start', 'end', 'spent', 'remaining', 'overspent'))
+BudgetBurndown = namedtuple('BudgetBurndown', ('budget', 'periods'))
+
+
+def _snapshot_period(snapshot):
+    spent = Decimal(snapshot.spent).quantize(CENTS)
+    remaining = Decimal(snapshot.budgeted).quantize(CENTS) - spent
+    return BudgetPeriod(snapshot.period_start, snapshot.period_end, spent, remaining, remaining < 0)
+
+
+def _burndowns_for_length(length, budgets, rows, snapshots):
+    """
+    Returns a BudgetBurndown for each of budgets, which all have the given
+    period length, from the (budget pk, date, total) rows for those budgets
+    dated after their closed periods, and the {budget pk: [BudgetSnapshot]}
+    of the closed periods.
+    """
+    controller = PeriodLengthFactory(length).make_controller()
+    current = int(controller.period_bounds([local_date(None, controller.tz)]).index[0])
+    positions = dict((budget.pk, i) for i, budget in enumerate(budgets))
+    # the first open period of each budget with closed periods
+    closed = [budget for budget in budgets if budget.closed_through is not None]
+    reopened = {}
+    if closed:
+        reopened = dict(zip([budget.pk for budget in closed], controller.period_bounds(
+            [budget.closed_through + timedelta(days=1) for budget in closed]).index))
+    
+    if rows:
+        budget_pks, dates, totals = zip(*rows)
+        index = controller.period_bounds(dates).index
+        first = min(int(index.min()), current)
+    else:
+        budget_pks, index, totals = (), numpy.array([], dtype='int64'), ()
+        first = current
+    if reopened:
+        first = min([first] + [int(i) for i in reopened.values()])
+    span = current - first + 1
+    
+    position = numpy.array([positions[pk] for pk in budget_pks], dtype='int64')
+    index = numpy.asarray(index, dtype='int64')
+    keep = index <= current
+    keys = position[keep] * span + (index[keep] - first)
+    # spending is the negative of the net value of the period's transactions,
+    # summed in integer cents (bincount would sum its weights as floats)
+    cents = numpy.array([as_cents(total) for total in totals], dtype='int64')
+    spent = numpy.zeros(len(budgets) * span, dtype='int64')
+    numpy.add.at(spent, keys, cents[keep])
+    spent = -spent.reshape(len(budgets), span)
+    active = numpy.zeros((len(budgets), span), dtype=bool)
+    active[position[keep], index[keep] - first] = True
+    
+    starts = controller.index_start_dates(numpy.arange(first, current + 2))
+    result = []
+    for i, budget in enumerate(budgets):
+        if budget.pk in reopened:
+            begin = int(reopened[budget.pk]) - first
+        else:
+            used = numpy.flatnonzero(active[i])
+            begin = used[0] if len(used) else span - 1
+        amount = Decimal(budget.period_budget_amount).quantize(CENTS)
+        periods = [_snapshot_period(snapshot) for snapshot in snapshots.get(budget.pk, ())]
+        for offset in range(begin, span):
+            spent_amount = from_cents(spent[i, offset])
+            remaining = amount - spent_amount
+            periods.append(BudgetPeriod(
+                starts[offset].astype(object),
+                (starts[offset + 1] - numpy.timedelta64(1, 'D')).astype(object),
+                spent_amount, remaining, remaining < 0))
+        result.append(BudgetBurndown(budget, periods))
+    return result
+
+
+def burndown(owner):
+    """
+    Returns a BudgetBurndown for each of the owner's budgets, in name order.
+    Each lists a BudgetPeriod for every period from the one containing the
+    budget's first transaction through the current period.
+    """
+    budgets = list(Budget.objects.filter(owner=owner).order_by('name'))
+    rows = RealTxn.objects.filter(owner=owner, closed=False)
+    snapshots = defaultdict(list)
+    closed = [budget for budget in budgets if budget.closed_through is not None]
+    if closed:
+        for snapshot in BudgetSnapshot.objects.filter(budget__in=[budget.pk for budget in closed])\
+                .order_by('period_start'):
+            snapshots[snapshot.budget_id].append(snapshot)
+        if len(closed) == len(budgets):
+            rows = rows.filter(date__gt=min(budget.closed_through for budget in closed))
+    rows = rows.order_by().values_list('category__budget', 'date').annotate(total=Sum('value'))
+    
+    by_length = {}
+    for budget in budgets:
+        by_length.setdefault(budget.period_length, ([], []))[0].append(budget)
+    lengths = dict((budget.pk, budget.period_length) for budget in budgets)
+    for budget_pk, day, total in rows:
+        by_length[lengths[budget_pk]][1].append((budget_pk, day, total))
+    
+    burndowns = {}
+    for length, (length_budgets, length_rows) in by_length.items():
+        for result in _burndowns_for_length(length, length_budgets, length_rows, snapshots):
+            burndowns[result.budget.pk] = result
+    return [burndowns[budget.pk] for budget in budgets]
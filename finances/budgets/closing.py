@@ -0,0 +1,205 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+Closing Budget periods.
+
+Once a period of a Budget has ended it can be closed: its figures are
+frozen into a BudgetSnapshot, with a VirtualAcctSnapshot for each of the
+budget's VirtualAccts in the period, and the period's RealTxns and
+VirtualTxns are marked closed, after which shared.signals refuses to write
+anything dated in the period. Historical views read the one snapshot row
+of a closed period instead of its transactions.
+
+A close reads the owner's open transactions with two grouped queries,
+however many periods it closes, and writes the snapshots with bulk_create.
+Periods are closed in order, so a budget's snapshots always cover every
+period from its first closed one through closed_through.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from shared.cache import bump_ledger_version
+from shared.controllers import local_date
+from shared.ledger import as_decimal
+from shared.models import (
+    CENTS,
+    Budget,
+    BudgetSnapshot,
+    RealTxn,
+    VirtualAcct,
+    VirtualAcctSnapshot,
+    VirtualTxn,
+)
+
+
+class ClosingResult(object):
+    """
+    Counts of one period close.
+    """
+    
+    def __init__(self):
+        self.budget_count = 0
+        self.period_count = 0
+        self.account_count = 0
+        self.realtxn_count = 0
+        self.virtualtxn_count = 0
+    
+    def __unicode__(self):
+        return (u"Closed %d periods of %d budgets (%d accounts, %d transactions, %d splits)"
+                % (self.period_count, self.budget_count, self.account_count,
+                   self.realtxn_count, self.virtualtxn_count))
+
+
+def last_ended_period_end(budget, through=None):
+    """
+    Returns the end of the last period of budget that ended before today,
+    or on or before through if that is earlier.
+    """
+    controller = budget.period_length_controller
+    day = local_date(None, controller.tz)
+    if through is not None:
+        day = min(day, local_date(through) + timedelta(days=1))
+    return controller.period_start_date(day) - timedelta(days=1)
+
+
+def close_periods(owner_id, through=None):
+    """
+    Closes every period of the owner's budgets that has ended (on or before
+    through, if given) and is not closed yet, in one database transaction,
+    then marks the owner's cached pages stale. Returns a ClosingResult.
+    """
+    result = transaction.commit_on_success(_close)(owner_id, through)
+    if result.period_count:
+        bump_ledger_version(owner_id)
+    return result
+
+
+def _close(owner_id, through):
+    result = ClosingResult()
+    ends = {}
+    budgets = {}
+    for budget in Budget.objects.filter(owner=owner_id):
+        end = last_ended_period_end(budget, through)
+        if budget.closed_through is None or end > budget.closed_through:
+            ends[budget.pk] = end
+            budgets[budget.pk] = budget
+    if not ends:
+        return result
+    
+    # Open transactions are only dated after their budget's closed_through,
+    # so everything read here is in a period being closed or a later one.
+    realtxn_days = defaultdict(list)
+    for budget_pk, day, total in RealTxn.objects\
+            .filter(owner=owner_id, closed=False, category__budget__in=list(ends),
+                    date__lte=max(ends.values())).order_by()\
+            .values_list('category__budget', 'date').annotate(total=Sum('value')):
+        realtxn_days[budget_pk].append((day, as_decimal(total)))
+    split_days = defaultdict(list)
+    for acct_pk, day, total in VirtualTxn.objects\
+            .filter(owner=owner_id, closed=False, virtual_acct__parent_budget__in=list(ends))\
+            .order_by().values_list('virtual_acct', 'date').annotate(total=Sum('value')):
+        split_days[acct_pk].append((day, as_decimal(total)))
+    accounts = defaultdict(list)
+    for account in VirtualAcct.objects.filter(owner=owner_id, parent_budget__in=list(ends)):
+        closed = budgets[account.parent_budget_id].closed_through
+        if (closed is None or account.period_start > closed) \
+                and account.period_start <= ends[account.parent_budget_id]:
+            accounts[account.parent_budget_id].append(account)
+    # the closing balance of each budget's last closed period opens the next
+    last_closed = Q()
+    for budget in budgets.values():
+        if budget.closed_through is not None:
+            last_closed |= Q(budget=budget.pk, period_end=budget.closed_through)
+    openings = {}
+    if last_closed:
+        openings = dict(BudgetSnapshot.objects.filter(last_closed)
+                        .values_list('budget', 'closing_balance'))
+    
+    closed_at = timezone.now()
+    snapshots = []
+    account_periods = []
+    for budget_pk, end in ends.items():
+        budget = budgets[budget_pk]
+        controller = budget.period_length_controller
+        if budget.closed_through is not None:
+            first = budget.closed_through + timedelta(days=1)
+        else:
+            days = [day for day, _ in realtxn_days[budget_pk]]
+            days += [account.period_start for account in accounts[budget_pk]]
+            if not days:
+                # nothing has ever been spent against the budget
+                del ends[budget_pk]
+                continue
+            first = min(days)
+        
+        opening = as_decimal(openings.get(budget_pk))
+        budgeted = as_decimal(budget.period_budget_amount).quantize(CENTS)
+        for start in controller.period_start_dates(first, end):
+            period_end = controller.period_end_date(start)
+            spent = -sum((total for day, total in realtxn_days[budget_pk]
+                          if start <= day <= period_end), Decimal('0.00'))
+            snapshots.append(BudgetSnapshot(
+                owner_id=owner_id, budget_id=budget_pk, period_start=start,
+                period_end=period_end, budgeted=budgeted, opening_balance=opening,
+                spent=spent, carry_over=budgeted - spent,
+                closing_balance=opening + budgeted - spent, closed_at=closed_at))
+            opening += budgeted - spent
+        for account in accounts[budget_pk]:
+            account_periods.append((account, controller.period_start_date(account.period_start),
+                                    controller.period_end_date(account.period_start)))
+    
+    BudgetSnapshot.objects.bulk_create(snapshots)
+    # bulk_create does not set primary keys, so read them back
+    snapshot_pks = dict(((budget_pk, start), pk) for pk, budget_pk, start in BudgetSnapshot.objects
+                        .filter(owner=owner_id, closed_at=closed_at)
+                        .values_list('pk', 'budget', 'period_start'))
+    account_snapshots = []
+    for account, start, period_end in account_periods:
+        in_period = later = Decimal('0.00')
+        for day, total in split_days[account.pk]:
+            if start <= day <= period_end:
+                in_period += total
+            elif day > period_end:
+                later += total
+        closing = as_decimal(account.running_balance) - later
+        account_snapshots.append(VirtualAcctSnapshot(
+            owner_id=owner_id, virtual_acct=account,
+            budget_snapshot_id=snapshot_pks[(account.parent_budget_id, start)],
+            period_start=start, period_end=period_end, opening_balance=closing - in_period,
+            spent=-in_period, closing_balance=closing, closed_at=closed_at))
+    VirtualAcctSnapshot.objects.bulk_create(account_snapshots)
+    
+    by_end = defaultdict(list)
+    for budget_pk, end in ends.items():
+        by_end[end].append(budget_pk)
+    for end, budget_pks in by_end.items():
+        Budget.objects.filter(pk__in=budget_pks).update(closed_through=end)
+        result.realtxn_count += RealTxn.objects.filter(
+            owner=owner_id, closed=False, category__budget__in=budget_pks, date__lte=end)\
+            .update(closed=True)
+        result.virtualtxn_count += VirtualTxn.objects.filter(
+            owner=owner_id, closed=False, virtual_acct__parent_budget__in=budget_pks,
+            date__lte=end).update(closed=True)
+    
+    result.budget_count = len(ends)
+    result.period_count = len(snapshots)
+    result.account_count = len(account_snapshots)
+    return result
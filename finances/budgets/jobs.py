@@ -0,0 +1,36 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+Job kinds for Budgets, run by the run_jobs worker; see shared.jobs.
+"""
+
+from datetime import datetime, timedelta
+
+from shared.jobs import job_kind
+
+from budgets.closing import close_periods
+
+
+# close_periods closes in one transaction, so the job cannot report
+# progress (and renew its lease) until it is done
+@job_kind('close_periods', lease=timedelta(hours=2))
+def close_periods_job(job, through=None):
+    """
+    Closes every ended period of the owner's budgets, or those that ended
+    on or before through (YYYY-MM-DD).
+    """
+    if through is not None:
+        through = datetime.strptime(through, '%Y-%m-%d').date()
+    return unicode(close_periods(job.owner_id, through))
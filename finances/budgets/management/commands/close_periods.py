@@ -0,0 +1,59 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+from datetime import datetime
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from shared.jobs import enqueue
+
+from budgets.closing import close_periods
+
+
+class Command(BaseCommand):
+    args = '[<username> ...]'
+    help = ('Closes every period of every Budget that has ended, freezing its figures into '
+            'snapshots. Closes the budgets of every user unless usernames are given. Meant to '
+            'be run daily, e.g. from cron.')
+    option_list = BaseCommand.option_list + (
+        make_option('--through', default=None,
+                    help='only close periods that ended on or before this date (YYYY-MM-DD)'),
+        make_option('--queue', action='store_true', default=False,
+                    help='queue a close_periods job per user for run_jobs instead'),
+    )
+    
+    def handle(self, *args, **options):
+        through = options['through']
+        if through is not None:
+            try:
+                through = datetime.strptime(through, '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Dates must be given as YYYY-MM-DD, not %r' % through)
+        
+        users = User.objects.order_by('pk')
+        if args:
+            users = users.filter(username__in=args)
+            if users.count() != len(set(args)):
+                missing = set(args) - set(users.values_list('username', flat=True))
+                raise CommandError('No user %s' % ', '.join(sorted(missing)))
+        
+        for user in users:
+            if options['queue']:
+                arguments = {'through': through.isoformat()} if through else {}
+                job = enqueue(user, 'close_periods', **arguments)
+                self.stdout.write('%s: queued job %d' % (user.username, job.pk))
+            else:
+                self.stdout.write('%s: %s' % (user.username, close_periods(user.pk, through)))
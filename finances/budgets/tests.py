@@ -13,6 +13,289 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-"""
-Nothing here yet.
-"""
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from StringIO import StringIO
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.contrib.auth.models import User
+from shared.controllers import MONTH_PERIOD, YEAR_PERIOD, local_date
+from shared.models import Budget, Category, RealAcct, RealTxn, VirtualTxn, BudgetSnapshot,\
+    AllocationRule, ClosedPeriodError
+from accounts.allocation import allocate
+from accounts.importers import insert_realtxns
+from budgets.burndown import burndown
+from budgets.closing import close_periods
+from budgets.views.manage_categories import CATEGORY_PAGE_SIZE
+
+
+class BurndownTests(TestCase):
+    """
+    Tests per-period spend for budgets of different period lengths.
+    """
+    
+    def setUp(self):
+        self.user = User.objects.create(username = 'testuser', email = 'email@domain.tld')
+        self.acct = RealAcct.objects.create(owner = self.user, name = 'chequing')
+    
+    def add_budget(self, name, length, txns):
+        budget = Budget.objects.create(owner = self.user, name = name, period_length = length,
+                                       period_budget_amount = '100.00')
+        category = Category.objects.create(owner = self.user, name = name, budget = budget)
+        for day, value in txns:
+            RealTxn.objects.create(owner = self.user, value = value, category = category,
+                                   real_account = self.acct, date = day)
+        return budget
+    
+    def test_burndown(self):
+        today = local_date()
+        self.add_budget('food', MONTH_PERIOD, [(date(today.year - 1, 11, 3), '-60.00'),
+                                               (date(today.year - 1, 11, 20), '-50.00'),
+                                               (date(today.year - 1, 12, 1), '-20.00'),
+                                               (date(today.year - 1, 12, 2), '5.00')])
+        self.add_budget('travel', YEAR_PERIOD, [(date(today.year - 2, 6, 1), '-80.00')])
+        self.add_budget('unused', MONTH_PERIOD, [])
+        
+        with self.assertNumQueries(2):
+            food, travel, unused = burndown(self.user)
+        
+        self.assertEqual(food.periods[0].start, date(today.year - 1, 11, 1))
+        self.assertEqual(food.periods[0].end, date(today.year - 1, 11, 30))
+        self.assertEqual(food.periods[0].spent, Decimal('110.00'))
+        self.assertEqual(food.periods[0].remaining, Decimal('-10.00'))
+        assert(food.periods[0].overspent)
+        self.assertEqual(food.periods[1].spent, Decimal('15.00'))
+        assert(not food.periods[1].overspent)
+        self.assertEqual(len(food.periods), 2 + today.month)
+        self.assertEqual(food.periods[-1].start, date(today.year, today.month, 1))
+        self.assertEqual(food.periods[-1].spent, Decimal('0.00'))
+        
+        self.assertEqual([period.spent for period in travel.periods],
+                         [Decimal('80.00'), Decimal('0.00'), Decimal('0.00')])
+        self.assertEqual(len(unused.periods), 1)
+        self.assertEqual(unused.periods[0].remaining, Decimal('100.00'))
+    
+    def test_large_amounts(self):
+        today = local_date()
+        day = date(today.year - 1, 3, 1)
+        self.add_budget('house', MONTH_PERIOD, [(day, '-4503599627370.49'), (day, '-0.01'),
+                                                (date(today.year - 1, 3, 2), '-0.07')])
+        [house] = burndown(self.user)
+        self.assertEqual(house.periods[0].spent, Decimal('4503599627370.57'))
+        self.assertEqual(house.periods[0].remaining, Decimal('-4503599627270.57'))
+
+
+class PeriodCloseTests(TestCase):
+    """
+    Tests that ended budget periods are frozen into snapshots, which the
+    burn-down and history then read, and that closed transactions can no
+    longer change.
+    """
+    
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'email@domain.tld', 'pass')
+        self.acct = RealAcct.objects.create(owner = self.user, name = 'chequing')
+        self.budget = Budget.objects.create(owner = self.user, name = 'food', period_budget_amount = '100.00')
+        self.category = Category.objects.create(owner = self.user, name = 'groceries', budget = self.budget)
+        self.year = local_date().year - 1
+        self.txns = [RealTxn.objects.create(owner = self.user, value = value, category = self.category,
+                                            real_account = self.acct, date = day)
+                     for day, value in [(date(self.year, 11, 3), '-60.00'),
+                                        (date(self.year, 11, 20), '-50.00'),
+                                        (date(self.year, 12, 1), '-20.00'),
+                                        (date(self.year, 12, 2), '5.00')]]
+        allocate(self.txns)
+    
+    def test_close(self):
+        before = burndown(self.user)
+        result = close_periods(self.user.pk)
+        today = local_date()
+        self.assertEqual(result.period_count, 1 + today.month)
+        self.assertEqual((result.account_count, result.realtxn_count, result.virtualtxn_count), (2, 4, 4))
+        
+        november, december = BudgetSnapshot.objects.filter(budget = self.budget)[:2]
+        self.assertEqual((november.opening_balance, november.spent, november.carry_over,
+                          november.closing_balance),
+                         (Decimal('0.00'), Decimal('110.00'), Decimal('-10.00'), Decimal('-10.00')))
+        self.assertEqual((december.opening_balance, december.spent, december.closing_balance),
+                         (Decimal('-10.00'), Decimal('15.00'), Decimal('75.00')))
+        account = november.account_snapshots.get()
+        self.assertEqual((account.opening_balance, account.spent, account.closing_balance),
+                         (Decimal('0.00'), Decimal('110.00'), Decimal('-110.00')))
+        self.assertEqual(Budget.objects.get(pk = self.budget.pk).closed_through,
+                         date(today.year, today.month, 1) - timedelta(days = 1))
+        
+        # closed periods come from the snapshots, with the same figures
+        with self.assertNumQueries(3):
+            self.assertEqual(burndown(self.user)[0].periods, before[0].periods)
+        self.assertEqual(close_periods(self.user.pk).period_count, 0)
+    
+    def test_closed_transactions(self):
+        close_periods(self.user.pk, through = date(self.year, 11, 30))
+        self.assertEqual(Budget.objects.get(pk = self.budget.pk).closed_through, date(self.year, 11, 30))
+        
+        self.assertRaises(ClosedPeriodError, RealTxn.objects.create, owner = self.user,
+                          value = '-1.00', category = self.category, real_account = self.acct,
+                          date = date(self.year, 11, 30))
+        self.assertRaises(ClosedPeriodError, self.txns[0].delete)
+        self.assertRaises(ClosedPeriodError, insert_realtxns, self.acct,
+                          [(date(self.year, 11, 5), Decimal('-1.00'), self.category.pk)])
+        # december is still open
+        self.txns[2].delete()
+        self.assertEqual(VirtualTxn.objects.filter(closed = False).count(), 1)
+    
+    def test_split_across_budgets(self):
+        savings = Budget.objects.create(owner = self.user, name = 'savings', period_length = YEAR_PERIOD,
+                                        period_budget_amount = '1000.00')
+        category = Category.objects.create(owner = self.user, name = 'transfers', budget = savings)
+        AllocationRule.objects.create(owner = self.user, category = category, budget = self.budget,
+                                      amount = '10.00')
+        txn, later = [RealTxn.objects.create(owner = self.user, value = '-30.00', category = category,
+                                             real_account = self.acct, date = day)
+                      for day in (date(self.year, 11, 10), date(self.year, 12, 10))]
+        allocate([txn, later])
+        close_periods(self.user.pk, through = date(self.year, 11, 30))
+        assert(not Budget.objects.get(pk = savings.pk).is_closed_on(date(self.year, 11, 10)))
+        
+        # the food split of txn is in a closed period, although savings is open
+        txn = RealTxn.objects.get(pk = txn.pk)
+        txn.date = date(self.year, 12, 15)
+        self.assertRaises(ClosedPeriodError, txn.save)
+        # and the food split of later cannot be moved into one
+        later.date = date(self.year, 11, 15)
+        self.assertRaises(ClosedPeriodError, later.save)
+        self.assertEqual(set(VirtualTxn.objects.filter(real_txn__in = [txn, later])
+                             .values_list('date', flat = True)),
+                         set([date(self.year, 11, 10), date(self.year, 12, 10)]))
+        
+        later.date = date(self.year, 12, 20)
+        later.save()
+        self.assertEqual(set(later.virtualtxn_set.values_list('date', flat = True)),
+                         set([date(self.year, 12, 20)]))
+    
+    def test_command_and_history(self):
+        call_command('close_periods', 'testuser', through = '%d-12-31' % self.year, stdout = StringIO())
+        self.client.login(username = 'testuser', password = 'pass')
+        [budget] = json.loads(self.client.get(reverse('budgets:history')).content)['budgets']
+        self.assertEqual(budget['closed_through'], '%d-12-31' % self.year)
+        [year] = budget['years']
+        self.assertEqual((year['year'], year['budgeted'], year['spent'], year['carry_over']),
+                         (self.year, '200.00', '125.00', '75.00'))
+        self.assertEqual([period['closing_balance'] for period in year['periods']], ['-10.00', '75.00'])
+
+
+class CategorySpendSeriesTests(TestCase):
+    """
+    Tests the monthly category totals endpoint.
+    """
+    
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'email@domain.tld', 'pass')
+        acct = RealAcct.objects.create(owner = self.user, name = 'chequing')
+        budget = Budget.objects.create(owner = self.user, name = 'food', period_length = MONTH_PERIOD,
+                                       period_budget_amount = '100.00')
+        self.food = Category.objects.create(owner = self.user, name = 'food', budget = budget)
+        self.rent = Category.objects.create(owner = self.user, name = 'rent', budget = budget)
+        for day, value, category in ((date(2012, 11, 3), '-60.00', self.food),
+                                     (date(2012, 11, 20), '-50.00', self.food),
+                                     (date(2013, 1, 1), '-900.00', self.rent)):
+            RealTxn.objects.create(owner = self.user, value = value, category = category,
+                                   real_account = acct, date = day)
+        self.client.login(username = 'testuser', password = 'pass')
+    
+    def get(self, **params):
+        response = self.client.get(reverse('budgets:category-spend'), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+    
+    def test_series(self):
+        data = self.get()
+        self.assertEqual(data['months'], ['2012-11', '2012-12', '2013-01'])
+        self.assertEqual(data['series'], [
+            {'category': self.food.pk, 'name': 'food', 'totals': ['-110.00', '0.00', '0.00']},
+            {'category': self.rent.pk, 'name': 'rent', 'totals': ['0.00', '0.00', '-900.00']},
+        ])
+    
+    def test_filters(self):
+        data = self.get(category = self.rent.pk, **{'from': '2012-12', 'to': '2013-02'})
+        self.assertEqual(data['months'], ['2012-12', '2013-01', '2013-02'])
+        self.assertEqual(data['series'], [
+            {'category': self.rent.pk, 'name': 'rent', 'totals': ['0.00', '-900.00', '0.00']},
+        ])
+        
+        response = self.client.get(reverse('budgets:category-spend'), {'from': '2012'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ManageCategoriesTests(TestCase):
+    """
+    Tests that the categories formset pages, filters and saves in bulk.
+    """
+    
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'email@domain.tld', 'pass')
+        self.food = Budget.objects.create(owner = self.user, name = 'food', period_length = MONTH_PERIOD,
+                                          period_budget_amount = '100.00')
+        self.rent = Budget.objects.create(owner = self.user, name = 'rent', period_length = MONTH_PERIOD,
+                                          period_budget_amount = '900.00')
+        Category.objects.bulk_create([Category(owner = self.user, name = 'category %03d' % n,
+                                               budget = self.food)
+                                      for n in range(CATEGORY_PAGE_SIZE + 10)])
+        self.categories = list(Category.objects.order_by('name'))
+        self.client.login(username = 'testuser', password = 'pass')
+    
+    def post_data(self, forms):
+        data = {
+            'form-TOTAL_FORMS': len(forms),
+            'form-INITIAL_FORMS': len([f for f in forms if 'id' in f]),
+            'form-MAX_NUM_FORMS': 1000,
+        }
+        for i, form in enumerate(forms):
+            for field, value in form.items():
+                data['form-%d-%s' % (i, field)] = value
+        return data
+    
+    def test_pages(self):
+        # the user, a count, the budgets and one page of categories
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('budgets:categories'))
+        self.assertEqual(len(response.context['form'].forms), CATEGORY_PAGE_SIZE + 1)
+        
+        response = self.client.get(reverse('budgets:categories'), {'page': 2})
+        self.assertEqual(len(response.context['form'].initial_forms), 10)
+        response = self.client.get(reverse('budgets:categories'), {'q': 'category 00'})
+        self.assertEqual(len(response.context['form'].initial_forms), 10)
+    
+    def test_bulk_save(self):
+        category = Category.objects.create(owner = self.user, name = 'used', budget = self.food)
+        RealTxn.objects.create(owner = self.user, value = '-1.00', category = category,
+                               real_account = RealAcct.objects.create(owner = self.user))
+        forms = [{'id': c.pk, 'name': c.name, 'budget': c.budget_id} for c in self.categories[:3]]
+        forms[0]['name'] = 'renamed'
+        forms[1]['budget'] = self.rent.pk
+        forms[2]['DELETE'] = 'on'
+        forms.append({'name': 'new', 'budget': self.rent.pk})
+        
+        with self.assertNumQueries(14):
+            response = self.client.post(reverse('budgets:categories'), self.post_data(forms))
+        self.assertEqual(response.status_code, 302)
+        
+        self.assertEqual(Category.objects.get(pk = self.categories[0].pk).name, 'renamed')
+        self.assertEqual(Category.objects.get(pk = self.categories[1].pk).budget, self.rent)
+        assert(not Category.objects.filter(pk = self.categories[2].pk).exists())
+        self.assertEqual(Category.objects.get(name = 'new').owner, self.user)
+        
+        # categories with transactions are kept
+        forms = [{'id': category.pk, 'name': 'used', 'budget': self.food.pk, 'DELETE': 'on'}]
+        response = self.client.post(reverse('budgets:categories') + '?q=used', self.post_data(forms))
+        self.assertEqual(response.status_code, 200)
+        assert(Category.objects.filter(pk = category.pk).exists())
+        
+        # a category from another page is not mistaken for one on this page
+        category.realtxn_set.all().delete()
+        count = Category.objects.count()
+        response = self.client.post(reverse('budgets:categories'), self.post_data(forms))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Category.objects.count(), count)
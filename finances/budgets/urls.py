@@ -15,9 +15,13 @@
 
 from django.conf.urls import patterns, url
 
-from budgets.views import CreateBudget, ManageCategories
+from budgets.views import CreateBudget, ManageCategories, BudgetBurndown, CategorySpendSeries,\
+    BudgetHistory
 
 urlpatterns = patterns('',
     url(r'^create/$', CreateBudget.as_view(), name='create'),
     url(r'^categories/$', ManageCategories.as_view(), name='categories'),
+    url(r'^burndown/$', BudgetBurndown.as_view(), name='burndown'),
+    url(r'^categories/spend\.json$', CategorySpendSeries.as_view(), name='category-spend'),
+    url(r'^history\.json$', BudgetHistory.as_view(), name='history'),
 )
@@ -16,3 +16,6 @@
 
 from create_budget import CreateBudget
 from manage_categories import ManageCategories
+from burndown import BudgetBurndown
+from category_spend import CategorySpendSeries
+from budget_history import BudgetHistory
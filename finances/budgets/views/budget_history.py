@@ -0,0 +1,88 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+import json
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.views.generic.base import View
+
+from shared.ledger import as_decimal
+from shared.models import CENTS, Budget, BudgetSnapshot
+from shared.views.mixins import LoginRequiredMixin
+
+
+def _amount(value):
+    return str(as_decimal(value).quantize(CENTS))
+
+
+class BudgetHistory(LoginRequiredMixin, View):
+    """
+    The closed periods of every Budget as JSON, totalled by calendar year
+    for year-over-year comparisons.
+    
+    Reads the BudgetSnapshot rows of the closed periods, never the ledger.
+    The optional GET parameter budget (a Budget pk, may be repeated) limits
+    the budgets. A period counts toward the year it starts in.
+    """
+    
+    def get(self, request):
+        try:
+            budget_pks = [int(pk) for pk in request.GET.getlist('budget')]
+        except ValueError:
+            return HttpResponseBadRequest(u"budget must be a pk")
+        
+        budgets = Budget.objects.for_user(request.user).order_by('name')
+        snapshots = BudgetSnapshot.objects.for_user(request.user).order_by('period_start')
+        if budget_pks:
+            budgets = budgets.filter(pk__in=budget_pks)
+            snapshots = snapshots.filter(budget__in=budget_pks)
+        
+        years = dict((budget.pk, OrderedDict()) for budget in budgets)
+        for snapshot in snapshots:
+            year = years[snapshot.budget_id].setdefault(snapshot.period_start.year, {
+                'budgeted': Decimal('0.00'),
+                'spent': Decimal('0.00'),
+                'carry_over': Decimal('0.00'),
+                'periods': [],
+            })
+            year['budgeted'] += as_decimal(snapshot.budgeted)
+            year['spent'] += as_decimal(snapshot.spent)
+            year['carry_over'] += as_decimal(snapshot.carry_over)
+            year['periods'].append({
+                'start': snapshot.period_start.isoformat(),
+                'end': snapshot.period_end.isoformat(),
+                'budgeted': _amount(snapshot.budgeted),
+                'opening_balance': _amount(snapshot.opening_balance),
+                'spent': _amount(snapshot.spent),
+                'carry_over': _amount(snapshot.carry_over),
+                'closing_balance': _amount(snapshot.closing_balance),
+            })
+        
+        data = {
+            'budgets': [{
+                'budget': budget.pk,
+                'name': budget.name,
+                'closed_through': budget.closed_through and budget.closed_through.isoformat(),
+                'years': [{
+                    'year': number,
+                    'budgeted': _amount(year['budgeted']),
+                    'spent': _amount(year['spent']),
+                    'carry_over': _amount(year['carry_over']),
+                    'periods': year['periods'],
+                } for number, year in years[budget.pk].items()],
+            } for budget in budgets],
+        }
+        return HttpResponse(json.dumps(data), content_type='application/json')
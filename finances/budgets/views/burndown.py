@@ -0,0 +1,34 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from django.views.generic.base import TemplateView
+
+from shared.views.mixins import LedgerCacheMixin, LoginRequiredMixin
+
+from budgets.burndown import burndown
+
+
+class BudgetBurndown(LedgerCacheMixin, LoginRequiredMixin, TemplateView):
+    """
+    Show spend against the budgeted amount for every period of every Budget.
+    """
+    template_name = 'budgets/burndown.hamlpy'
+    
+    def get_context_data(self, **kwargs):
+        context = {
+            'burndown_list': burndown(self.request.user),
+        }
+        context.update(super(BudgetBurndown, self).get_context_data(**kwargs))
+        return context
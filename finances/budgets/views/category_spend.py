@@ -0,0 +1,90 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+import json
+from collections import defaultdict
+from datetime import date, datetime
+
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.views.generic.base import View
+
+from shared.ledger import as_decimal
+from shared.models import CENTS, Category, CategoryMonthTotal
+from shared.views.mixins import LoginRequiredMixin
+
+MONTH_FORMAT = '%Y-%m'
+
+
+def _parse_month(value):
+    return datetime.strptime(value, MONTH_FORMAT).date()
+
+
+def _months(first, last):
+    """
+    Yields the first day of every month from first to last inclusive.
+    """
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        yield date(year, month, 1)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+class CategorySpendSeries(LoginRequiredMixin, View):
+    """
+    Monthly RealTxn totals per Category as JSON, for trend charts.
+    
+    Reads the CategoryMonthTotal rollups rather than the ledger. Optional
+    GET parameters: category (a Category pk, may be repeated), and from and
+    to (YYYY-MM) to bound the months. Every series has one total per month
+    in the range, with months that have no transactions as zero.
+    """
+    
+    def get(self, request):
+        try:
+            category_pks = [int(pk) for pk in request.GET.getlist('category')]
+            first = _parse_month(request.GET['from']) if 'from' in request.GET else None
+            last = _parse_month(request.GET['to']) if 'to' in request.GET else None
+        except ValueError:
+            return HttpResponseBadRequest(u"category must be a pk and from/to must be YYYY-MM")
+        
+        categories = Category.objects.for_user(request.user).order_by('name')
+        totals = CategoryMonthTotal.objects.for_user(request.user)
+        if category_pks:
+            categories = categories.filter(pk__in=category_pks)
+            totals = totals.filter(category__in=category_pks)
+        if first is not None:
+            totals = totals.filter(month__gte=first)
+        if last is not None:
+            totals = totals.filter(month__lte=last)
+        
+        by_category = defaultdict(dict)
+        for category_id, month, total in totals.values_list('category', 'month', 'total'):
+            by_category[category_id][month] = total
+        months = set(month for values in by_category.values() for month in values)
+        if first is None and months:
+            first = min(months)
+        if last is None and months:
+            last = max(months)
+        months = list(_months(first, last)) if first and last else []
+        
+        data = {
+            'months': [month.strftime(MONTH_FORMAT) for month in months],
+            'series': [{
+                'category': category.pk,
+                'name': category.name,
+                'totals': [str(as_decimal(by_category[category.pk].get(month)).quantize(CENTS))
+                           for month in months],
+            } for category in categories],
+        }
+        return HttpResponse(json.dumps(data), content_type='application/json')
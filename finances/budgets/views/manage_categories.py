@@ -13,52 +13,185 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-from django.views.generic.edit import BaseFormView
-from django.views.generic.base import TemplateView
-from django.core.urlresolvers import reverse_lazy
-from django.forms.models import modelformset_factory
+from django.views.generic.edit import FormView
+from django.core.paginator import Paginator, InvalidPage
+from django.core.urlresolvers import reverse
+from django.core.validators import EMPTY_VALUES
+from django.forms.models import modelformset_factory, BaseModelFormSet
+from django.http import Http404
 
+from shared.bulk import bulk_update
+from shared.cache import bump_ledger_version
 from shared.views.mixins import LoginRequiredMixin
-from shared.models import Category
+from shared.models import Budget, Category
 from django.db import transaction
 from django import forms
 
+CATEGORY_PAGE_SIZE = 50
+
+
+class PrefetchedChoiceField(forms.ModelChoiceField):
+    """
+    A ModelChoiceField that looks its value up in a dict of {pk: object}
+    loaded once per formset, rather than querying once per form.
+    """
+    
+    def __init__(self, objects, *args, **kwargs):
+        super(PrefetchedChoiceField, self).__init__(*args, **kwargs)
+        self.objects = objects
+    
+    def to_python(self, value):
+        if value in EMPTY_VALUES:
+            return None
+        try:
+            return self.objects[int(value)]
+        except (KeyError, ValueError, TypeError):
+            raise forms.ValidationError(self.error_messages['invalid_choice'])
+
 
 class CategoryForm(forms.ModelForm):
     def save(self, owner, commit=True, *args, **kwargs):
         instance = super(CategoryForm, self).save(commit=False, *args, **kwargs)
-        instance.owner = owner
+        if instance.pk is None:
+            instance.owner = owner
         if commit:
             instance.save()
         return instance
+    
+    def _get_validation_exclusions(self):
+        # the budget field only accepts the owner's budgets, so the model's
+        # check that the budget exists would only add a query per form
+        return super(CategoryForm, self)._get_validation_exclusions() + ['budget']
 
     class Meta:
         model = Category
         exclude = ('owner',)
 
+
+class BaseCategoryFormset(BaseModelFormSet):
+    """
+    Formset over one page of the owner's categories. Budgets are loaded
+    once for every form, and changes are saved in bulk by save_bulk().
+    """
+    
+    def __init__(self, owner, *args, **kwargs):
+        self.owner = owner
+        budgets = list(Budget.objects.for_user(owner).order_by('name'))
+        self.budgets = dict((budget.pk, budget) for budget in budgets)
+        self.budget_choices = [(u'', u'---------')] + [(budget.pk, unicode(budget))
+                                                        for budget in budgets]
+        super(BaseCategoryFormset, self).__init__(*args, **kwargs)
+    
+    def add_fields(self, form, index):
+        super(BaseCategoryFormset, self).add_fields(form, index)
+        if not hasattr(self, 'categories'):
+            self.categories = dict((category.pk, category) for category in self.get_queryset())
+        pk_name = self._pk_field.name
+        pk_field = form.fields[pk_name]
+        form.fields[pk_name] = PrefetchedChoiceField(
+            self.categories, pk_field.queryset, initial=pk_field.initial,
+            required=False, widget=pk_field.widget)
+        budget_field = form.fields['budget']
+        form.fields['budget'] = PrefetchedChoiceField(
+            self.budgets, Budget.objects.none(), label=budget_field.label,
+            required=budget_field.required)
+        form.fields['budget'].choices = self.budget_choices
+    
+    def _is_deleted(self, form):
+        return self.can_delete and self._should_delete_form(form)
+    
+    def clean(self):
+        super(BaseCategoryFormset, self).clean()
+        for form in self.initial_forms:
+            # Django gives a form whose category is not on this page the
+            # category at the form's position instead, and skips validating
+            # forms marked for deletion, so this must be checked here.
+            if self._pk_field.name in form.errors:
+                raise forms.ValidationError(u"The categories have changed since this page "
+                                            u"was loaded; please try again.")
+        deleted = [form.instance.pk for form in self.initial_forms if self._is_deleted(form)]
+        if not deleted:
+            return
+        in_use = Category.objects.filter(pk__in=deleted, realtxn__isnull=False)\
+            .values_list('name', flat=True).distinct()
+        if in_use:
+            raise forms.ValidationError(u"Categories with transactions cannot be deleted: %s"
+                                        % u", ".join(sorted(in_use)))
+    
+    @transaction.commit_on_success
+    def save_bulk(self):
+        """
+        Saves the formset with one bulk_create for new categories, one
+        bulk_update for edited ones and one DELETE for removed ones.
+        """
+        created, updated, deleted = [], [], []
+        for form in self.initial_forms:
+            if self._is_deleted(form):
+                deleted.append(form.instance.pk)
+            elif form.has_changed():
+                updated.append(form.save(self.owner, commit=False))
+        for form in self.extra_forms:
+            if form.has_changed() and not self._is_deleted(form):
+                created.append(form.save(self.owner, commit=False))
+        
+        Category.objects.bulk_create(created)
+        bulk_update(Category, updated, ['name', 'budget'])
+        if deleted:
+            Category.objects.for_user(self.owner).filter(pk__in=deleted).delete()
+        # bulk_create and bulk_update send no signals
+        bump_ledger_version(self.owner.pk)
+
+
 CategoriesFormset = modelformset_factory(
     Category,
     form=CategoryForm,
+    formset=BaseCategoryFormset,
     can_delete=True,
 )
 
 
-class ManageCategories(BaseFormView, LoginRequiredMixin, TemplateView):
+class ManageCategories(LoginRequiredMixin, FormView):
     """
-    Use a formset to add, edit, or delete categories.
+    Use a formset to add, edit, or delete categories, a page at a time.
+    
+    The 'q' GET parameter filters the categories by name and 'page' picks
+    the page of the (filtered) categories to edit.
     """
     template_name = 'budgets/manage_categories.hamlpy'
     form_class = CategoriesFormset
-    success_url = reverse_lazy('budgets:categories')
+    
+    def get_category_page(self):
+        if not hasattr(self, '_category_page'):
+            categories = Category.objects.for_user(self.request.user).order_by('name', 'pk')
+            if self.request.GET.get('q'):
+                categories = categories.filter(name__icontains=self.request.GET['q'])
+            paginator = Paginator(categories, CATEGORY_PAGE_SIZE, allow_empty_first_page=True)
+            try:
+                self._category_page = paginator.page(self.request.GET.get('page', 1))
+            except InvalidPage as e:
+                raise Http404(u"Invalid page: %s" % e)
+        return self._category_page
     
     def get_form_kwargs(self):
         kwargs = super(ManageCategories, self).get_form_kwargs()
-        kwargs.update(queryset=Category.objects.filter(owner=self.request.user))
+        kwargs.update(owner=self.request.user, queryset=self.get_category_page().object_list)
         return kwargs
     
+    def get_success_url(self):
+        url = reverse('budgets:categories')
+        if self.request.GET:
+            url += '?' + self.request.GET.urlencode()
+        return url
+    
+    def get_context_data(self, **kwargs):
+        context = {
+            'category_page': self.get_category_page(),
+            'query': self.request.GET.get('q', ''),
+            'querystring': self.request.GET.urlencode(),
+        }
+        context.update(super(ManageCategories, self).get_context_data(**kwargs))
+        return context
+    
     def form_valid(self, form):
-        with transaction.commit_on_success():
-            for f in form.forms:
-                if len(f.changed_data):
-                    _ = f.save(owner=self.request.user)
+        form.save_bulk()
         return super(ManageCategories, self).form_valid(form)
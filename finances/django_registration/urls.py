@@ -13,7 +13,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-from django.views.generic.simple import direct_to_template
+from django.views.generic.base import TemplateView
 from django.contrib.auth import views as auth_views
 from django.conf.urls import patterns, url
 from django.core.urlresolvers import reverse_lazy
@@ -30,8 +30,7 @@ urlpatterns = patterns('',
         name='registration_register'
     ),
     url(r'^register/closed/$',
-        direct_to_template,
-        {'template': 'registration/registration_closed.hamlpy'},
+        TemplateView.as_view(template_name='registration/registration_closed.hamlpy'),
         name='registration_disallowed'
     ),
     url(r'^login/$',
@@ -13,6 +13,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
+import os
+
 from django.core.urlresolvers import reverse_lazy
 
 # Django settings for finances project.
@@ -35,9 +37,57 @@ DATABASES = {
         'PASSWORD': '',                  # Not used with sqlite3.
         'HOST': '',                      # Set to empty string for localhost. Not used with sqlite3.
         'PORT': '',                      # Set to empty string for default. Not used with sqlite3.
+        'CONN_MAX_AGE': 600,             # Seconds a connection is kept across requests, see shared.sqlite.
     }
 }
 
+# Run on every new SQLite connection (see shared.sqlite): WAL lets page
+# views read while an import writes, and NORMAL is durable enough in WAL
+# mode. Sizes are in bytes, except a negative cache_size, in KiB; the busy
+# timeout is in milliseconds.
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 256 * 1024 * 1024),
+    ('cache_size', -64 * 1024),
+    ('busy_timeout', 5000),
+)
+
+# Read replicas, see shared.routers: GET requests read from one of these
+# aliases, while writes, and the reads of a client that wrote within the
+# last REPLICA_PIN_SECONDS, go to 'default'. To try it locally with SQLite
+# copies of the database, refreshed by `manage.py sync_replicas` (e.g.
+# every minute from cron; connections are not kept, so that each request
+# opens the latest copy), add:
+#     DATABASES['replica1'] = dict(DATABASES['default'], NAME='replica1.db', TEST_MIRROR='default',
+#                                  CONN_MAX_AGE=0)
+#     DATABASES['replica2'] = dict(DATABASES['default'], NAME='replica2.db', TEST_MIRROR='default',
+#                                  CONN_MAX_AGE=0)
+#     DATABASE_REPLICAS = ('replica1', 'replica2')
+DATABASE_REPLICAS = ()
+DATABASE_ROUTERS = ('shared.routers.ReplicaRouter',)
+# at least the longest a replica can lag behind
+REPLICA_PIN_SECONDS = 120
+
+# Rendered account and budget pages are cached per user and ledger version
+# (see shared.cache). The locmem cache is private to each process; when more
+# than one process serves the site, use the file based cache instead:
+#     'BACKEND': 'shared.cache.backends.LRUFileBasedCache',
+#     'LOCATION': '/var/tmp/finances_cache',
+CACHES = {
+    'default': {
+        'BACKEND': 'shared.cache.backends.LRULocMemCache',
+        'LOCATION': 'finances',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    }
+}
+
+# sessions are read from the cache, so a cached page is served with only the
+# ledger version query
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 PASSWORD_HASHERS = ['django.contrib.auth.hashers.PBKDF2PasswordHasher']
 
 # Local time zone for this installation. Choices can be found here:
@@ -118,6 +168,19 @@ TEMPLATE_LOADERS = (
 #     'django.template.loaders.eggs.Loader',
 )
 
+# HamlPy templates precompiled by "manage.py compile_templates"
+COMPILED_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                     'compiled_templates')
+
+# In production, load the precompiled templates and keep every parsed template
+# in memory, so no HAML is converted while serving requests. Templates that
+# were not precompiled are still converted, once per process.
+if not DEBUG:
+    TEMPLATE_LOADERS = (
+        ('django.template.loaders.cached.Loader',
+            ('shared.loaders.CompiledHamlLoader',) + TEMPLATE_LOADERS),
+    )
+
 TEMPLATE_CONTEXT_PREPROCESSORS = (
     'django.contrib.auth.context_processors.auth',
     'django.core.context_processors.debug',
@@ -129,12 +192,15 @@ TEMPLATE_CONTEXT_PREPROCESSORS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    # first, so that its latency figures cover every other middleware
+    'shared.request_stats.RequestStatsMiddleware',
+    # before anything reads the database
+    'shared.routers.ReplicaPinningMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
     # Uncomment the next line for simple clickjacking protection:
     # 'django.middleware.clickjacking.XFrameOptionsMiddleware',
 )
@@ -164,7 +230,6 @@ INSTALLED_APPS = (
     # to override django-registration urls and templates, look in the
     # django_registration app
     'registration',
-    'debug_toolbar',
     'django_registration',
     # shared components, mostly models
     'shared',
@@ -175,8 +240,10 @@ INSTALLED_APPS = (
 # django-registration settings
 ACCOUNT_ACTIVATION_DAYS = 7
 
-# needed by debug_toolbar middleware
-INTERNAL_IPS = ('127.0.0.1',)
+# JSON lines written by shared.request_stats.RequestStatsMiddleware, one per
+# request; read by "manage.py request_stats"
+REQUEST_STATS_LOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 'request_stats.log')
 
 # A sample logging configuration. The only tangible logging
 # performed by this configuration is to send an email to
@@ -191,11 +258,29 @@ LOGGING = {
             '()': 'django.utils.log.RequireDebugFalse'
         }
     },
+    'formatters': {
+        'message': {
+            'format': '%(message)s'
+        }
+    },
     'handlers': {
         'mail_admins': {
             'level': 'ERROR',
             'filters': ['require_debug_false'],
             'class': 'django.utils.log.AdminEmailHandler'
+        },
+        'request_stats': {
+            'level': 'INFO',
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': REQUEST_STATS_LOG,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+            'formatter': 'message'
+        },
+        'console': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler'
         }
     },
     'loggers': {
@@ -204,5 +289,16 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'shared.request_stats': {
+            'handlers': ['request_stats'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        # failed attempts of background jobs, with their tracebacks
+        'shared.jobs': {
+            'handlers': ['console'],
+            'level': 'ERROR',
+            'propagate': False,
+        },
     }
 }
@@ -19,6 +19,10 @@ from django.conf.urls import patterns, include, url
 from django.contrib import admin
 admin.autodiscover()
 
+# register the background job kinds of every app
+from shared import jobs
+jobs.autodiscover()
+
 # development serving of static files
 # TODO: before deployment, server static files properly
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
@@ -31,6 +35,7 @@ urlpatterns = patterns('',
     
     url(r'^accounts/', include('accounts.urls', namespace='accounts')),
     url(r'^budgets/', include('budgets.urls', namespace='budgets')),
+    url(r'^jobs/', include('shared.urls', namespace='jobs')),
     url(r'^register/', include('django_registration.urls', namespace='registration')),
 )
 
@@ -18,15 +18,29 @@ from django.contrib import admin
 from shared.models import (
             Budget,
             Category,
+            AllocationRule,
             RealAcct,
             VirtualAcct,
             RealTxn,
             VirtualTxn,
+            Job,
             )
 
-admin.site.register(Budget)
-admin.site.register(Category)
-admin.site.register(RealAcct)
-admin.site.register(VirtualAcct)
-admin.site.register(RealTxn)
-admin.site.register(VirtualTxn)
+
+class OwnedModelAdmin(admin.ModelAdmin):
+    def get_readonly_fields(self, request, obj=None):
+        # the owner of an OwnedModel cannot be changed once it is saved
+        readonly_fields = super(OwnedModelAdmin, self).get_readonly_fields(request, obj)
+        if obj is not None:
+            readonly_fields = tuple(readonly_fields) + ('owner',)
+        return readonly_fields
+
+
+admin.site.register(Budget, OwnedModelAdmin)
+admin.site.register(Category, OwnedModelAdmin)
+admin.site.register(AllocationRule, OwnedModelAdmin)
+admin.site.register(RealAcct, OwnedModelAdmin)
+admin.site.register(VirtualAcct, OwnedModelAdmin)
+admin.site.register(RealTxn, OwnedModelAdmin)
+admin.site.register(VirtualTxn, OwnedModelAdmin)
+admin.site.register(Job, OwnedModelAdmin)
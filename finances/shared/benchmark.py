@@ -0,0 +1,351 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+Times the ledger views through the Django test client, and the balance and
+report computations behind them, for a set of users (typically generated
+by shared.synthetic). For each case the latency percentiles and the number
+of queries are recorded, and a run can be compared with an earlier one to
+catch regressions between builds.
+
+Unless warm is set, the user's ledger version is bumped (untimed) before
+every request, so that pages are rendered rather than served from the
+ledger page cache. A case that fails is recorded with its error and not
+timed further.
+
+run_concurrency_benchmark measures instead how page views hold up while
+statements are imported into the same SQLite database, under a profile of
+connection pragmas (see shared.sqlite).
+"""
+
+import datetime
+import multiprocessing
+import random
+import timeit
+from collections import namedtuple
+from decimal import Decimal
+
+import numpy
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Count, Sum
+from django.test.client import Client
+from django.test.utils import override_settings
+
+from shared.cache import bump_ledger_version
+from shared.controllers import local_date
+from shared.models import Budget, Category, RealAcct
+
+from accounts.importers import import_statement
+from budgets.burndown import burndown
+
+PERCENTILES = (50, 90, 99)
+
+Case = namedtuple('Case', 'name run cleanup')
+
+CONCURRENCY_USERNAME = 'concurrency'
+CONCURRENCY_PASSWORD = 'concurrency'
+
+# the pragmas of each profile run_concurrency_benchmark can compare;
+# 'default' is SQLite's own configuration, with a rollback journal
+SQLITE_PROFILES = ('default', 'production')
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def _get(client, path, data=None):
+    def run():
+        response = client.get(path, data or {})
+        if response.status_code != 200:
+            raise BenchmarkError(u"GET %s returned %d" % (path, response.status_code))
+    return run
+
+
+def _create_budget(client, user):
+    path = reverse('budgets:create')
+    
+    def run():
+        response = client.post(path, {'name': 'benchmark budget', 'amount': '100.00', 'period': 20})
+        if response.status_code != 302:
+            raise BenchmarkError(u"POST %s returned %d" % (path, response.status_code))
+    
+    def cleanup():
+        Budget.objects.filter(owner=user, name='benchmark budget').delete()
+    return run, cleanup
+
+
+def cases(client, user):
+    """
+    Returns the Cases to time for user, whose client is logged in.
+    """
+    realaccts = list(RealAcct.objects.filter(owner=user).annotate(txns=Count('realtxn'))
+                     .order_by('-txns', 'pk'))
+    categories = list(Category.objects.filter(owner=user).values_list('pk', flat=True))
+    budgets = list(Budget.objects.filter(owner=user))
+    today = local_date()
+    
+    def balances():
+        for realacct in realaccts:
+            realacct.balance_as_of(today)
+    
+    def period_spend():
+        for budget in budgets:
+            budget.period_transactions().aggregate(total=Sum('value'))
+    
+    result = [
+        Case('dashboard', _get(client, reverse('accounts:index')), None),
+        Case('manage-categories', _get(client, reverse('budgets:categories')), None),
+        Case('create-budget', *_create_budget(client, user)),
+        Case('budget-burndown', _get(client, reverse('budgets:burndown')), None),
+        Case('balances', balances, None),
+        Case('burndown', lambda: burndown(user), None),
+        Case('period-spend', period_spend, None),
+    ]
+    if realaccts:
+        path = reverse('accounts:real-detail', kwargs={'realacct_pk': realaccts[0].pk})
+        result.insert(1, Case('show-realacct', _get(client, path), None))
+    if categories:
+        result.append(Case('category-spend', _get(client, reverse('budgets:category-spend'), {
+            'category': categories,
+            'from': (today - datetime.timedelta(days=365)).strftime('%Y-%m'),
+            'to': today.strftime('%Y-%m'),
+        }), None))
+    return result
+
+
+def _summary(seconds, queries):
+    milliseconds = numpy.array(seconds) * 1000
+    summary = {
+        'samples': len(seconds),
+        'mean_ms': round(float(milliseconds.mean()), 3),
+        'max_ms': round(float(milliseconds.max()), 3),
+        'queries_mean': round(float(numpy.mean(queries)), 2),
+        'queries_max': int(max(queries)),
+    }
+    for percentile in PERCENTILES:
+        summary['p%d_ms' % percentile] = round(float(numpy.percentile(milliseconds, percentile)), 3)
+    return summary
+
+
+def run_benchmark(users, password, iterations=20, warmup=2, warm=False, only=None):
+    """
+    Times every case (or the names in only) for each of users, warmup
+    untimed and then iterations timed runs per user. Returns a JSON-ready
+    dict of settings, per-case results and the errors of failed cases.
+    """
+    timings = {}
+    errors = {}
+    with override_settings(ALLOWED_HOSTS=['testserver'] + list(settings.ALLOWED_HOSTS)):
+        debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        try:
+            for user in users:
+                client = Client()
+                if not client.login(username=user.username, password=password):
+                    raise BenchmarkError(u"Could not log in as %s" % user.username)
+                for case in cases(client, user):
+                    if (only and case.name not in only) or case.name in errors:
+                        continue
+                    seconds, queries = timings.setdefault(case.name, ([], []))
+                    try:
+                        for i in range(warmup + iterations):
+                            if not warm:
+                                bump_ledger_version(user.pk)
+                            connection.queries = []
+                            started = timeit.default_timer()
+                            case.run()
+                            elapsed = timeit.default_timer() - started
+                            if i >= warmup:
+                                seconds.append(elapsed)
+                                queries.append(len(connection.queries))
+                            if case.cleanup is not None:
+                                case.cleanup()
+                    except Exception as e:
+                        errors[case.name] = u"%s: %s" % (type(e).__name__, e)
+                        del timings[case.name]
+        finally:
+            connection.use_debug_cursor = debug_cursor
+            connection.queries = []
+    
+    return {
+        'created': datetime.datetime.utcnow().isoformat() + 'Z',
+        'database': settings.DATABASES['default']['ENGINE'],
+        'cache': settings.CACHES['default']['BACKEND'],
+        'debug': settings.DEBUG,
+        'users': [user.username for user in users],
+        'iterations': iterations,
+        'warm': warm,
+        'cases': dict((name, _summary(seconds, queries))
+                      for name, (seconds, queries) in timings.items()),
+        'errors': errors,
+    }
+
+
+def regressions(results, baseline, threshold=1.2):
+    """
+    Returns a message for each case of results whose median latency is more
+    than threshold times, or whose query count is higher than, the same
+    case in baseline, and for each case that failed but did not before.
+    """
+    messages = [u"%s: %s" % (name, error) for name, error in sorted(results['errors'].items())
+                if name not in baseline.get('errors', {})]
+    for name in sorted(set(results['cases']) & set(baseline['cases'])):
+        new, old = results['cases'][name], baseline['cases'][name]
+        if new['p50_ms'] > old['p50_ms'] * threshold:
+            messages.append(u"%s: median %.1fms, was %.1fms" % (name, new['p50_ms'], old['p50_ms']))
+        if new['queries_max'] > old['queries_max']:
+            messages.append(u"%s: %d queries, was %d" % (name, new['queries_max'], old['queries_max']))
+    return messages
+
+
+def _profile_pragmas(profile):
+    if profile == 'default':
+        return (('journal_mode', 'DELETE'),)
+    return settings.SQLITE_PRAGMAS
+
+
+def _use_database(path, profile):
+    # in a forked process: drop the parent's connections, and open the
+    # database at path with the profile's pragmas from now on (renamed
+    # first, as the backend ignores closing an in-memory database)
+    connections[DEFAULT_DB_ALIAS].settings_dict['NAME'] = path
+    for alias in connections:
+        connections[alias].close()
+    settings.DATABASE_REPLICAS = ()
+    settings.SQLITE_PRAGMAS = _profile_pragmas(profile)
+
+
+def _entries(rng, count):
+    today = local_date()
+    return [(today - datetime.timedelta(days=rng.randint(0, 365)),
+             Decimal(rng.randint(-20000, 5000)) / 100) for i in range(count)]
+
+
+def _write(path, profile, seed_rows, import_rows, duration, ready, results):
+    rng = random.Random(1)
+    try:
+        _use_database(path, profile)
+        user = User.objects.create_user(CONCURRENCY_USERNAME, '', CONCURRENCY_PASSWORD)
+        budget = Budget.objects.create(owner=user, name='imports', period_budget_amount='500.00')
+        category = Category.objects.create(owner=user, name='imports', budget=budget)
+        realacct = RealAcct.objects.create(owner=user, name='imports')
+        if seed_rows:
+            import_statement(realacct, category, _entries(rng, seed_rows))
+    except Exception as e:
+        results.put(('failed', u"%s: %s" % (type(e).__name__, e)))
+        return
+    finally:
+        ready.set()
+    
+    seconds = []
+    errors = 0
+    deadline = timeit.default_timer() + duration
+    while timeit.default_timer() < deadline:
+        entries = _entries(rng, import_rows)
+        started = timeit.default_timer()
+        try:
+            import_statement(realacct, category, entries)
+        except Exception:
+            errors += 1
+        seconds.append(timeit.default_timer() - started)
+    results.put(('writer', seconds, errors))
+
+
+def _read(path, profile, duration, ready, results):
+    ready.wait()
+    try:
+        _use_database(path, profile)
+        user = User.objects.get(username=CONCURRENCY_USERNAME)
+        realacct = RealAcct.objects.filter(owner=user).order_by('-pk')[0]
+        client = Client()
+        with override_settings(ALLOWED_HOSTS=['testserver'] + list(settings.ALLOWED_HOSTS)):
+            if not client.login(username=CONCURRENCY_USERNAME, password=CONCURRENCY_PASSWORD):
+                raise BenchmarkError(u"Could not log in as %s" % CONCURRENCY_USERNAME)
+            view = _get(client, reverse('accounts:real-detail', kwargs={'realacct_pk': realacct.pk}))
+            seconds = []
+            errors = 0
+            deadline = timeit.default_timer() + duration
+            while timeit.default_timer() < deadline:
+                # render the page rather than serve it from the page cache
+                bump_ledger_version(user.pk)
+                started = timeit.default_timer()
+                try:
+                    view()
+                except Exception:
+                    errors += 1
+                seconds.append(timeit.default_timer() - started)
+    except Exception as e:
+        results.put(('failed', u"%s: %s" % (type(e).__name__, e)))
+        return
+    results.put(('reader', seconds, errors))
+
+
+def run_concurrency_benchmark(path, profile='production', readers=2, duration=20.0,
+                              import_rows=10000, seed_rows=10000, stall_ms=500):
+    """
+    Runs one process that imports statements of import_rows entries, one
+    after the other, and readers processes that view the account's page
+    (a light read, which only the database lock should hold up), against the SQLite database file at path with the
+    connection pragmas of profile (one of SQLITE_PROFILES), for duration
+    seconds. The writer first creates the CONCURRENCY_USERNAME user, with
+    seed_rows transactions, so path must hold the schema but not that
+    user; it keeps every imported row, so it should be a copy.
+    
+    Returns a JSON-ready dict of the read latency percentiles, the number
+    of reads slower than stall_ms, and the reads and imports that failed
+    (e.g. with "database is locked").
+    """
+    if profile not in SQLITE_PROFILES:
+        raise BenchmarkError(u"Unknown profile %s" % profile)
+    ready = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_write, args=(path, profile, seed_rows, import_rows,
+                                                              duration, ready, results))]
+    processes.extend(multiprocessing.Process(target=_read, args=(path, profile, duration, ready, results))
+                     for i in range(readers))
+    for process in processes:
+        process.start()
+    # drain the queue before joining, or a process may not exit
+    outcomes = [results.get() for process in processes]
+    for process in processes:
+        process.join()
+    failures = [outcome[1] for outcome in outcomes if outcome[0] == 'failed']
+    if failures:
+        raise BenchmarkError(failures[0])
+    
+    reads = numpy.array([elapsed for kind, seconds, errors in outcomes if kind == 'reader'
+                         for elapsed in seconds]) * 1000
+    imports = [(seconds, errors) for kind, seconds, errors in outcomes if kind == 'writer'][0]
+    result = {
+        'profile': profile,
+        'pragmas': [list(pragma) for pragma in _profile_pragmas(profile)],
+        'readers': readers,
+        'duration': duration,
+        'reads': len(reads),
+        'read_errors': sum(errors for kind, seconds, errors in outcomes if kind == 'reader'),
+        'stalled_reads': int((reads > stall_ms).sum()),
+        'imports': len(imports[0]),
+        'import_errors': imports[1],
+        'import_rows': import_rows,
+        'import_mean_ms': round(float(numpy.mean(imports[0]) * 1000), 3) if imports[0] else None,
+    }
+    for percentile in PERCENTILES:
+        result['p%d_ms' % percentile] = (round(float(numpy.percentile(reads, percentile)), 3)
+                                         if len(reads) else None)
+    result['max_ms'] = round(float(reads.max()), 3) if len(reads) else None
+    return result
@@ -0,0 +1,106 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+Bulk writes that Django does not provide.
+"""
+
+from django.db import connections, router, transaction
+from django.db.models import AutoField
+
+# rows per UPDATE; each row takes 2 parameters per field plus 1, and SQLite
+# allows 999 parameters per statement
+DEFAULT_UPDATE_BATCH_SIZE = 100
+
+
+def bulk_update(model, instances, fields, batch_size=DEFAULT_UPDATE_BATCH_SIZE):
+    """
+    Writes the named fields of every instance with one UPDATE per batch,
+    selecting each row's new value with a CASE on its primary key. Like
+    bulk_create, this does not call save() or send signals.
+    """
+    instances = list(instances)
+    if not instances:
+        return
+    connection = connections[router.db_for_write(model)]
+    qn = connection.ops.quote_name
+    pk_column = qn(model._meta.pk.column)
+    fields = [model._meta.get_field(name) for name in fields]
+    
+    cursor = connection.cursor()
+    for start in range(0, len(instances), batch_size):
+        batch = instances[start:start + batch_size]
+        assignments, params = [], []
+        for field in fields:
+            cases = []
+            for instance in batch:
+                cases.append('WHEN %s THEN %s')
+                params += [instance.pk, field.get_db_prep_save(getattr(instance, field.attname),
+                                                               connection=connection)]
+            assignments.append('%s = CASE %s %s END' % (qn(field.column), pk_column,
+                                                        ' '.join(cases)))
+        params += [instance.pk for instance in batch]
+        cursor.execute('UPDATE %s SET %s WHERE %s IN (%s)' % (
+            qn(model._meta.db_table), ', '.join(assignments), pk_column,
+            ', '.join(['%s'] * len(batch))), params)
+    transaction.commit_unless_managed(using=connection.alias)
+
+
+def bulk_insert(model, fields, rows, batch_size=None):
+    """
+    Inserts the list rows, tuples of database values for the named fields
+    of model (as get_db_prep_save() returns them), with one executemany per
+    batch_size rows, or one for all of them. Every other field takes its
+    default, and the primary key is numbered by the database unless it is
+    named. Unlike bulk_create this builds no model instances and no SQL per
+    batch, which is most of the time bulk_create takes over a large import.
+    Like bulk_create, it does not call save() or send signals.
+    """
+    if not rows:
+        return
+    connection = connections[router.db_for_write(model)]
+    qn = connection.ops.quote_name
+    named = [model._meta.get_field(name) for name in fields]
+    others = [field for field in model._meta.local_fields
+              if field not in named and not isinstance(field, AutoField)]
+    defaults = tuple(field.get_db_prep_save(field.get_default(), connection=connection)
+                     for field in others)
+    
+    columns = ', '.join(qn(field.column) for field in named + others)
+    placeholders = ', '.join(['%s'] * (len(named) + len(others)))
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (qn(model._meta.db_table), columns, placeholders)
+    batch_size = batch_size or len(rows)
+    cursor = connection.cursor()
+    for start in range(0, len(rows), batch_size):
+        cursor.executemany(sql, (row + defaults for row in rows[start:start + batch_size]))
+    transaction.commit_unless_managed(using=connection.alias)
+
+
+def build_instances(model, fields, rows):
+    """
+    Returns unsaved instances of model for rows, tuples of values for the
+    named fields; every other field takes its default. The instances are
+    built from values in field order, as querysets build the rows they
+    read, which is several times faster than by keyword.
+    """
+    attnames = [field.attname for field in model._meta.fields]
+    positions = [attnames.index(model._meta.get_field(name).attname) for name in fields]
+    template = [field.get_default() for field in model._meta.fields]
+    instances = []
+    for row in rows:
+        values = list(template)
+        for position, value in zip(positions, row):
+            values[position] = value
+        instances.append(model(*values))
+    return instances
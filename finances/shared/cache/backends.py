@@ -0,0 +1,188 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+Cache backends that evict the least recently used entries when full, and
+count hits and misses.
+
+Django's own locmem and file based backends cull an arbitrary fraction of
+their entries when full, which throws away hot pages along with cold ones.
+Use them in CACHES like any other backend:
+
+    'BACKEND': 'shared.cache.backends.LRULocMemCache'
+
+LRULocMemCache is private to each process, so it only suits a single
+process server. Use LRUFileBasedCache when several processes serve the
+site, since a ledger version bumped in one must be seen by all of them.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+try:
+    from django.utils.six.moves import cPickle as pickle
+except ImportError:
+    import pickle
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.synch import RWLock
+
+# hit and miss counts, keyed by cache name, shared by every instance of
+# the same cache in this process
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class CountingCacheMixin(object):
+    """
+    Counts cache gets that found a value (hits) and that did not (misses).
+    """
+    
+    def _count(self, hit):
+        with _stats_lock:
+            counts = _stats.setdefault(self._stats_name, {'hits': 0, 'misses': 0})
+            counts['hits' if hit else 'misses'] += 1
+    
+    def stats(self):
+        """
+        Returns a dict of the hits and misses counted in this process.
+        """
+        with _stats_lock:
+            return dict(_stats.get(self._stats_name, {'hits': 0, 'misses': 0}))
+    
+    def reset_stats(self):
+        with _stats_lock:
+            _stats.pop(self._stats_name, None)
+
+
+# LRU ordered stores, keyed by name like LocMemCache's
+_caches = {}
+_expire_info = {}
+_locks = {}
+
+
+class LRULocMemCache(CountingCacheMixin, LocMemCache):
+    """
+    LocMemCache that keeps its entries in order of use and evicts the least
+    recently used one when it is full.
+    """
+    
+    def __init__(self, name, params):
+        LocMemCache.__init__(self, name, params)
+        self._cache = _caches.setdefault(name, OrderedDict())
+        self._expire_info = _expire_info.setdefault(name, {})
+        self._lock = _locks.setdefault(name, RWLock())
+        self._stats_name = 'locmem:%s' % name
+    
+    def _get(self, key, default):
+        # every hit reorders the store, so even reads take the writer lock
+        with self._lock.writer():
+            exp = self._expire_info.get(key)
+            if exp is None:
+                return default
+            if exp <= time.time():
+                self._delete(key)
+                return default
+            pickled = self._cache.pop(key)
+            self._cache[key] = pickled
+        try:
+            return pickle.loads(pickled)
+        except pickle.PickleError:
+            return default
+    
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        missing = object()
+        value = self._get(key, missing)
+        self._count(value is not missing)
+        return default if value is missing else value
+    
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        value = self._get(key, None)
+        if value is None:
+            raise ValueError("Key '%s' not found" % key)
+        new_value = value + delta
+        with self._lock.writer():
+            if key in self._cache:
+                self._cache[key] = pickle.dumps(new_value, pickle.HIGHEST_PROTOCOL)
+        return new_value
+    
+    def _set(self, key, value, timeout=None):
+        # re-setting a key moves it to the most recently used end
+        self._cache.pop(key, None)
+        LocMemCache._set(self, key, value, timeout)
+    
+    def _cull(self):
+        if self._cull_frequency == 0:
+            self.clear()
+            return
+        while self._cache and len(self._cache) >= self._max_entries:
+            self._delete(next(iter(self._cache)))
+
+
+class LRUFileBasedCache(CountingCacheMixin, FileBasedCache):
+    """
+    FileBasedCache that evicts the least recently used entries when it is
+    full, using each file's modification time as its last use.
+    """
+    
+    def __init__(self, dir, params):
+        FileBasedCache.__init__(self, dir, params)
+        self._stats_name = 'file:%s' % dir
+    
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        fname = self._key_to_file(key)
+        try:
+            with open(fname, 'rb') as f:
+                exp = pickle.load(f)
+                if exp < time.time():
+                    self._delete(fname)
+                else:
+                    value = pickle.load(f)
+                    os.utime(fname, None)
+                    self._count(True)
+                    return value
+        except (IOError, OSError, EOFError, pickle.PickleError):
+            pass
+        self._count(False)
+        return default
+    
+    def _cull(self):
+        entries = []
+        for root, _, files in os.walk(self._dir):
+            for name in files:
+                fname = os.path.join(root, name)
+                try:
+                    entries.append((os.path.getmtime(fname), fname))
+                except OSError:
+                    pass
+        if len(entries) < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            doomed = entries
+        else:
+            entries.sort()
+            doomed = entries[:len(entries) - self._max_entries + 1]
+        for _, fname in doomed:
+            try:
+                self._delete(fname)
+            except (IOError, OSError):
+                pass
@@ -0,0 +1,83 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+Per-user ledger versions for caching rendered pages.
+
+Every page that shows a user's ledger is cached under a key that includes
+the user's current ledger version. Any write to the user's transactions,
+accounts, budgets or categories bumps the version (see shared.signals), so
+stale pages are never looked up again and simply age out of the cache.
+
+The versions are LedgerVersion rows rather than cache entries: the cache
+may be private to each process, and a bump made by the run_jobs worker or a
+management command must reach every web process. A bump is part of the
+writer's transaction, so the new version is seen together with the write.
+"""
+
+import hashlib
+import time
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from shared.controllers import local_date
+
+
+def _fresh_version():
+    # Used when a user has no version yet. User pks can be reused, so this
+    # must not repeat a version that pages may still be cached under; start
+    # from the clock rather than from zero.
+    return int(time.time() * 1000000)
+
+
+def ledger_version(user_id):
+    """
+    Returns the current ledger version of the user with pk user_id.
+    """
+    # imported on use, since django.core.cache imports shared.cache.backends
+    # (and so this package) while it sets up the default cache
+    from shared.models import LedgerVersion
+    from shared.routers import primary_reads
+    # a replica may not have the latest bump yet
+    with primary_reads():
+        versions = list(LedgerVersion.objects.filter(user=user_id).values_list('version', flat=True))
+    return versions[0] if versions else 0
+
+
+def bump_ledger_version(user_id):
+    """
+    Marks every page cached for the user with pk user_id as stale.
+    """
+    from shared.models import LedgerVersion
+    if LedgerVersion.objects.filter(user=user_id).update(version=F('version') + 1):
+        return
+    sid = transaction.savepoint()
+    try:
+        LedgerVersion.objects.create(user_id=user_id, version=_fresh_version())
+        transaction.savepoint_commit(sid)
+    except IntegrityError:
+        # created by a concurrent writer
+        transaction.savepoint_rollback(sid)
+        LedgerVersion.objects.filter(user=user_id).update(version=F('version') + 1)
+
+
+def ledger_cache_key(user_id, name):
+    """
+    Returns the cache key for the page called name (e.g. the request path)
+    as rendered for user_id at the current ledger version. The current date
+    is part of the key since pages show figures for the current period.
+    """
+    return 'ledger-page:%s:%s:%s:%s' % (user_id, ledger_version(user_id), local_date(),
+                                        hashlib.md5(name.encode('utf-8')).hexdigest())
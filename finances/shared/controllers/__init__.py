@@ -19,4 +19,5 @@ from period_length import (
     MONTH_PERIOD,
     YEAR_PERIOD,
     PERIOD_LENGTH_CHOICES,
+    local_date,
 )
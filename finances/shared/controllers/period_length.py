@@ -13,6 +13,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
+import threading
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import numpy
+from django.utils import timezone
+
 WEEK_PERIOD = 10
 MONTH_PERIOD = 20
 YEAR_PERIOD = 30
@@ -24,10 +31,98 @@ PERIOD_LENGTH_CHOICES = (
 )
 
 
+# (period length, time zone name) -> shared controller, see PeriodLengthFactory
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+# time zone name -> (UTC transition times, UTC offsets), see _utc_offsets
+_offset_tables = {}
+
+
+def local_date(value=None, tz=None):
+    """
+    Returns value as a date in time zone tz (default: the current time zone).
+    Aware datetimes are converted to local time first, naive datetimes are
+    truncated, and dates are returned unchanged. If value is None, returns
+    today's local date.
+    """
+    if value is None:
+        value = timezone.now()
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value, tz)
+        return value.date()
+    return value
+
+
+PeriodBounds = namedtuple('PeriodBounds', ('index', 'start', 'end'))
+
+
+def _utc_offsets(utc_seconds, tz):
+    """
+    Returns the UTC offset in seconds of time zone tz at each of the given
+    UTC instants (in seconds since the epoch), using the transition table
+    of the pytz time zone where there is one.
+    """
+    transitions = getattr(tz, '_utc_transition_times', None)
+    if not transitions:
+        offset = tz.utcoffset(datetime(2000, 1, 1))
+        return numpy.int64(offset.days * 86400 + offset.seconds)
+    
+    key = str(tz)
+    if key not in _offset_tables:
+        _offset_tables[key] = (
+            numpy.array(transitions, dtype='M8[s]').astype('int64'),
+            numpy.array([info[0].days * 86400 + info[0].seconds
+                         for info in tz._transition_info], dtype='int64'),
+        )
+    times, offsets = _offset_tables[key]
+    i = numpy.searchsorted(times, utc_seconds, side='right') - 1
+    return offsets[numpy.clip(i, 0, len(offsets) - 1)]
+
+
+def local_datetime64(timezone_dates, tz=None):
+    """
+    Returns an array of datetime64[D] local dates, like local_date() for a
+    whole sequence at once.
+    
+    timezone_dates may be a sequence of dates or datetimes, or a datetime64
+    array. Arrays with a unit of days are taken as local dates already; any
+    finer unit is taken as UTC instants, which are shifted into time zone tz
+    (default: the current time zone), accounting for daylight saving time,
+    before being truncated.
+    """
+    if isinstance(timezone_dates, numpy.ndarray) and timezone_dates.dtype.kind == 'M':
+        values = timezone_dates
+    else:
+        timezone_dates = list(timezone_dates)
+        if timezone_dates and isinstance(timezone_dates[0], datetime) \
+                and timezone.is_aware(timezone_dates[0]):
+            timezone_dates = [d.astimezone(timezone.utc).replace(tzinfo=None)
+                              for d in timezone_dates]
+            values = numpy.array(timezone_dates, dtype='M8[s]')
+        elif timezone_dates and isinstance(timezone_dates[0], datetime):
+            # naive datetimes are already local
+            return numpy.array(timezone_dates, dtype='M8[s]').astype('M8[D]')
+        else:
+            return numpy.array(timezone_dates, dtype='M8[D]')
+    
+    if values.dtype == numpy.dtype('M8[D]'):
+        return values
+    if tz is None:
+        tz = timezone.get_current_timezone()
+    utc_seconds = values.astype('M8[s]').astype('int64')
+    return ((utc_seconds + _utc_offsets(utc_seconds, tz)) // 86400).astype('M8[D]')
+
+
 class PeriodLengthFactory(object):
     """
     Factory class for period length controllers.
     
+    Controllers hold no per-object state, so make_controller() returns one
+    shared controller per period length and time zone for the whole process
+    rather than a new one for every caller.
+    
     Each controller will implement the following methods:
     
     current_period_start_date(self):
@@ -38,56 +133,171 @@ class PeriodLengthFactory(object):
     
     in_current_period(self, timezone_date):
         Returns True if the given timezone_date is in the current period, otherwise returns False
+    
+    period_start_date(self, timezone_date):
+        Returns the start date of the period containing timezone_date.
+    
+    period_end_date(self, timezone_date):
+        Returns the end date (inclusive) of the period containing timezone_date.
+    
+    period_start_dates(self, first, last):
+        Yields the start date of every period from the one containing first
+        through the one containing last.
+    
+    period_bounds(self, timezone_dates):
+        Returns a PeriodBounds of numpy arrays giving the period index, start
+        date and end date (inclusive) for each of timezone_dates.
+    
+    index_start_dates(self, index):
+        Returns the start dates of the periods with the given indices.
     """
     def __init__(self, length, *args, **kwargs):
         self.length = int(length)
         super(PeriodLengthFactory, self).__init__(*args, **kwargs)
     
     def make_controller(self):
+        key = (self.length, timezone.get_current_timezone_name())
+        try:
+            return _controllers[key]
+        except KeyError:
+            pass
+        
         if self.length == WEEK_PERIOD:
-            return WeekPeriodController()
+            controller_class = WeekPeriodController
         elif self.length == MONTH_PERIOD:
-            return MonthPeriodController()
+            controller_class = MonthPeriodController
         elif self.length == YEAR_PERIOD:
-            return YearPeriodController()
+            controller_class = YearPeriodController
         else:
             raise NotImplementedError()
+        with _controllers_lock:
+            return _controllers.setdefault(key, controller_class(timezone.get_current_timezone()))
 
 
-class WeekPeriodController(object):
-    @property
-    def current_period_start_date(self):
-        raise NotImplementedError()
+class PeriodController(object):
+    """
+    Base class for period length controllers. Subclasses implement
+    period_start_date() and next_period_start_date() for a local date; the
+    rest of the controller API is built on those two.
     
-    @property
-    def current_period_end_date(self):
+    For batches, subclasses also implement period_index() and
+    index_start_dates() with numpy datetime64 arithmetic. Period indices
+    count periods from the one containing 1970-01-01, so they can be
+    compared across batches.
+    
+    Dates are taken in time zone tz. The bounds of the current period are
+    cached for the local calendar day and recomputed on the first call
+    after local midnight.
+    """
+    
+    def __init__(self, tz=None):
+        self.tz = tz or timezone.get_default_timezone()
+        self._current = None
+    
+    def _current_bounds(self):
+        today = local_date(None, self.tz)
+        current = self._current
+        if current is None or current[0] != today:
+            current = (today, self.period_start_date(today), self.period_end_date(today))
+            self._current = current
+        return current
+    
+    def period_start_date(self, timezone_date):
         raise NotImplementedError()
     
-    def in_current_period(self, timezone_date):
+    def next_period_start_date(self, timezone_date):
+        """
+        Returns the start date of the period after the one containing
+        timezone_date.
+        """
         raise NotImplementedError()
-
-
-class MonthPeriodController(object):
+    
+    def period_end_date(self, timezone_date):
+        return self.next_period_start_date(timezone_date) - timedelta(days=1)
+    
+    def period_start_dates(self, first, last):
+        start = self.period_start_date(first)
+        last = local_date(last, self.tz)
+        while start <= last:
+            yield start
+            start = self.next_period_start_date(start)
+    
     @property
     def current_period_start_date(self):
-        raise NotImplementedError()
+        return self._current_bounds()[1]
     
     @property
     def current_period_end_date(self):
-        raise NotImplementedError()
+        return self._current_bounds()[2]
     
     def in_current_period(self, timezone_date):
+        _, start, end = self._current_bounds()
+        return start <= local_date(timezone_date, self.tz) <= end
+    
+    def period_index(self, days):
+        """
+        Returns the period index of each date in a datetime64[D] array.
+        """
         raise NotImplementedError()
+    
+    def index_start_dates(self, index):
+        raise NotImplementedError()
+    
+    def period_bounds(self, timezone_dates):
+        index = self.period_index(local_datetime64(timezone_dates, self.tz))
+        return PeriodBounds(
+            index,
+            self.index_start_dates(index),
+            self.index_start_dates(index + 1) - numpy.timedelta64(1, 'D'),
+        )
 
 
-class YearPeriodController(object):
-    @property
-    def current_period_start_date(self):
-        raise NotImplementedError()
+class WeekPeriodController(PeriodController):
+    """
+    Weeks start on Monday.
+    """
     
-    @property
-    def current_period_end_date(self):
-        raise NotImplementedError()
+    def period_start_date(self, timezone_date):
+        timezone_date = local_date(timezone_date, self.tz)
+        return timezone_date - timedelta(days=timezone_date.weekday())
     
-    def in_current_period(self, timezone_date):
-        raise NotImplementedError()
+    def next_period_start_date(self, timezone_date):
+        return self.period_start_date(timezone_date) + timedelta(days=7)
+    
+    # 1970-01-01 was a Thursday, so week 0 starts on 1969-12-29
+    def period_index(self, days):
+        return (days.astype('int64') + 3) // 7
+    
+    def index_start_dates(self, index):
+        return (numpy.asarray(index, dtype='int64') * 7 - 3).astype('M8[D]')
+
+
+class MonthPeriodController(PeriodController):
+    def period_start_date(self, timezone_date):
+        return local_date(timezone_date, self.tz).replace(day=1)
+    
+    def next_period_start_date(self, timezone_date):
+        timezone_date = local_date(timezone_date, self.tz)
+        if timezone_date.month == 12:
+            return date(timezone_date.year + 1, 1, 1)
+        return date(timezone_date.year, timezone_date.month + 1, 1)
+    
+    def period_index(self, days):
+        return days.astype('M8[M]').astype('int64')
+    
+    def index_start_dates(self, index):
+        return numpy.asarray(index, dtype='int64').astype('M8[M]').astype('M8[D]')
+
+
+class YearPeriodController(PeriodController):
+    def period_start_date(self, timezone_date):
+        return date(local_date(timezone_date, self.tz).year, 1, 1)
+    
+    def next_period_start_date(self, timezone_date):
+        return date(local_date(timezone_date, self.tz).year + 1, 1, 1)
+    
+    def period_index(self, days):
+        return days.astype('M8[Y]').astype('int64')
+    
+    def index_start_dates(self, index):
+        return numpy.asarray(index, dtype='int64').astype('M8[Y]').astype('M8[D]')
@@ -0,0 +1,237 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+Checks a user's ledger against its invariants, and rebuilds the balances
+stored alongside it from the transactions.
+
+Checked for every RealTxn:
+- its VirtualTxn splits sum to its value (or it has no splits at all);
+- each split's VirtualAcct belongs to the RealTxn's RealAcct;
+- each split carries the RealTxn's date (rewritten when rebuilding).
+
+Checked (and, when rebuilding, rewritten) for every stored figure:
+- RealAcct and VirtualAcct running balances;
+- RealAcct and VirtualAcct balance checkpoints;
+- CategoryMonthTotal rows.
+
+Everything is done per owner, so owners can be checked in parallel. The
+transactions are read in keyset chunks and the stored figures are compared
+with aggregates computed by the database, so memory use is bounded by the
+chunk size and the number of accounts, not by the size of the ledger.
+"""
+
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+
+from shared.cache import bump_ledger_version
+from shared.ledger import as_decimal, month_start
+from shared.models import (
+    CENTS,
+    RealAcct,
+    VirtualAcct,
+    RealTxn,
+    VirtualTxn,
+    RealAcctCheckpoint,
+    VirtualAcctCheckpoint,
+    CategoryMonthTotal,
+)
+from shared.pagination import keyset_chunks
+
+DEFAULT_CHUNK_SIZE = 500
+
+# kind is one of the keys of VIOLATION_KINDS; subject is the pk (or key) of
+# the row at fault
+Violation = namedtuple('Violation', 'kind subject detail')
+
+VIOLATION_KINDS = {
+    'split-sum': u"RealTxn splits do not sum to its value",
+    'split-account': u"VirtualTxn is on a VirtualAcct of another RealAcct",
+    'virtualtxn-date': u"VirtualTxn date differs from its RealTxn's",
+    'realacct-balance': u"RealAcct running balance is wrong",
+    'virtualacct-balance': u"VirtualAcct running balance is wrong",
+    'realacct-checkpoint': u"RealAcct checkpoint is wrong",
+    'virtualacct-checkpoint': u"VirtualAcct checkpoint is wrong",
+    'category-month-total': u"CategoryMonthTotal is wrong",
+}
+
+# stored figures that rebuild_ledger() can rewrite
+REBUILDABLE_KINDS = frozenset(kind for kind in VIOLATION_KINDS if not kind.startswith('split-'))
+
+
+class LedgerReport(object):
+    """
+    The violations found in one owner's ledger.
+    """
+    
+    def __init__(self, owner_id):
+        self.owner_id = owner_id
+        self.realtxn_count = 0
+        self.unsplit_count = 0
+        self.violations = []
+        self.rebuilt = False
+    
+    def add(self, kind, subject, detail):
+        self.violations.append(Violation(kind, subject, detail))
+    
+    def counts(self):
+        counts = defaultdict(int)
+        for violation in self.violations:
+            counts[violation.kind] += 1
+        return dict(counts)
+
+
+def _cents(value):
+    return as_decimal(value).quantize(CENTS)
+
+
+def _check_splits(owner_id, report, chunk_size, rebuild):
+    realtxns = RealTxn.objects.filter(owner=owner_id).only('id', 'date', 'value', 'real_account')
+    for chunk in keyset_chunks(realtxns, chunk_size):
+        report.realtxn_count += len(chunk)
+        totals = defaultdict(Decimal)
+        splits = VirtualTxn.objects.filter(real_txn__in=[txn.pk for txn in chunk])\
+            .values_list('pk', 'real_txn', 'value', 'date', 'virtual_acct__real_acct')
+        txns = dict((txn.pk, txn) for txn in chunk)
+        for pk, real_txn_id, value, day, realacct_id in splits:
+            txn = txns[real_txn_id]
+            totals[real_txn_id] += as_decimal(value)
+            if realacct_id != txn.real_account_id:
+                report.add('split-account', pk, u"VirtualTxn %s of RealTxn %s is on RealAcct %s, "
+                           u"not %s" % (pk, real_txn_id, realacct_id, txn.real_account_id))
+            if day != txn.date:
+                report.add('virtualtxn-date', pk, u"VirtualTxn %s is dated %s but its RealTxn %s "
+                           u"is dated %s" % (pk, day, real_txn_id, txn.date))
+                if rebuild:
+                    VirtualTxn.objects.filter(pk=pk).update(date=txn.date)
+        for txn in chunk:
+            if txn.pk not in totals:
+                report.unsplit_count += 1
+            elif _cents(totals[txn.pk]) != _cents(txn.value):
+                report.add('split-sum', txn.pk, u"RealTxn %s is %s but its splits sum to %s"
+                           % (txn.pk, _cents(txn.value), _cents(totals[txn.pk])))
+
+
+def _compare(report, kind, stored, expected, fix):
+    """
+    Reports every key whose stored figure differs from the expected one
+    (missing figures count as zero), calling fix(key, figure) for each.
+    """
+    for key in set(stored) | set(expected):
+        have = _cents(stored.get(key))
+        want = _cents(expected.get(key))
+        if have != want:
+            report.add(kind, key, u"%s is %s, should be %s" % (key, have, want))
+            if fix is not None:
+                fix(key, want)
+
+
+def _checkpoint_balances(checkpoints, daily_totals):
+    """
+    Returns {checkpoint pk: balance} for checkpoints given as (pk, account
+    pk, period start), from {account pk: {date: total}}.
+    """
+    running = {}
+    for acct_id, totals in daily_totals.items():
+        dates = sorted(totals)
+        sums = [Decimal('0.00')]
+        for day in dates:
+            sums.append(sums[-1] + as_decimal(totals[day]))
+        running[acct_id] = (dates, sums)
+    
+    balances = {}
+    for pk, acct_id, period_start in checkpoints:
+        dates, sums = running.get(acct_id, ([], [Decimal('0.00')]))
+        balances[pk] = sums[bisect_left(dates, period_start)]
+    return balances
+
+
+def _update(model, field):
+    def fix(pk, value):
+        model.objects.filter(pk=pk).update(**{field: value})
+    return fix
+
+
+def _check_stored(owner_id, report, rebuild):
+    real_daily = defaultdict(dict)
+    month_totals = defaultdict(Decimal)
+    rows = RealTxn.objects.filter(owner=owner_id).values_list('real_account', 'category', 'date')\
+        .annotate(total=Sum('value')).order_by()
+    for realacct_id, category_id, day, total in rows:
+        total = as_decimal(total)
+        real_daily[realacct_id][day] = real_daily[realacct_id].get(day, Decimal('0.00')) + total
+        month_totals[(category_id, month_start(day))] += total
+    
+    virtual_daily = defaultdict(dict)
+    rows = VirtualTxn.objects.filter(owner=owner_id).values_list('virtual_acct', 'date')\
+        .annotate(total=Sum('value')).order_by()
+    for acct_id, day, total in rows:
+        virtual_daily[acct_id][day] = as_decimal(total)
+    
+    for kind, model, checkpoint_model, daily in (
+            ('realacct', RealAcct, RealAcctCheckpoint, real_daily),
+            ('virtualacct', VirtualAcct, VirtualAcctCheckpoint, virtual_daily)):
+        stored = dict(model.objects.filter(owner=owner_id).values_list('pk', 'running_balance'))
+        expected = dict((pk, sum(totals.values())) for pk, totals in daily.items())
+        _compare(report, kind + '-balance', stored, expected,
+                 _update(model, 'running_balance') if rebuild else None)
+        
+        checkpoints = list(checkpoint_model.objects.filter(acct__owner=owner_id)
+                           .values_list('pk', 'acct', 'period_start', 'balance'))
+        stored = dict((pk, balance) for pk, _, _, balance in checkpoints)
+        expected = _checkpoint_balances([checkpoint[:3] for checkpoint in checkpoints], daily)
+        _compare(report, kind + '-checkpoint', stored, expected,
+                 _update(checkpoint_model, 'balance') if rebuild else None)
+    
+    stored = dict(((category_id, month), total) for category_id, month, total in
+                  CategoryMonthTotal.objects.filter(owner=owner_id)
+                  .values_list('category', 'month', 'total'))
+    
+    def fix_month_total(key, total):
+        category_id, month = key
+        updated = CategoryMonthTotal.objects.filter(owner=owner_id, category=category_id,
+                                                    month=month).update(total=total)
+        if not updated:
+            CategoryMonthTotal.objects.create(owner_id=owner_id, category_id=category_id,
+                                              month=month, total=total)
+    
+    _compare(report, 'category-month-total', stored, month_totals,
+             fix_month_total if rebuild else None)
+
+
+def _check(owner_id, report, chunk_size, rebuild):
+    _check_splits(owner_id, report, chunk_size, rebuild)
+    _check_stored(owner_id, report, rebuild)
+
+
+def check_ledger(owner_id, chunk_size=DEFAULT_CHUNK_SIZE, rebuild=False):
+    """
+    Checks the ledger of the owner with pk owner_id and returns a
+    LedgerReport. With rebuild, every stored figure that is wrong is also
+    rewritten from the transactions, in one database transaction; the
+    split violations can only be reported.
+    """
+    report = LedgerReport(owner_id)
+    if rebuild:
+        transaction.commit_on_success(_check)(owner_id, report, chunk_size, rebuild=True)
+        report.rebuilt = True
+        if any(violation.kind in REBUILDABLE_KINDS for violation in report.violations):
+            bump_ledger_version(owner_id)
+    else:
+        _check(owner_id, report, chunk_size, rebuild=False)
+    return report
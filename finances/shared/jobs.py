@@ -0,0 +1,197 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+A database-backed queue for ledger work too heavy to do inside a request.
+
+Views queue a Job with enqueue() and return at once; the run_jobs
+management command runs queued jobs in worker processes. A job kind is a
+function registered with @job_kind in an app's jobs module, called as
+function(job, **arguments); it returns a message describing the result and
+may call report_progress() as it goes. Job kinds must leave the ledger
+unchanged when they raise, i.e. do their writes in database transactions,
+because a failed job is retried (after RETRY_DELAY, doubling each time)
+until it has been attempted max_attempts times.
+
+Jobs of one owner never run at the same time, so no two jobs touch a
+user's ledger at once: a job is only claimed while no other job of its
+owner holds an unexpired lease. Any number of workers may run.
+"""
+
+import json
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.importlib import import_module
+from django.utils.module_loading import module_has_submodule
+
+from shared.integrity import REBUILDABLE_KINDS, check_ledger
+from shared.models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 3
+
+# how long a claimed job may go without reporting progress before another
+# worker may take it over, unless its kind sets a longer lease
+LEASE = timedelta(minutes=10)
+
+# delay before the first retry of a failed job
+RETRY_DELAY = timedelta(seconds=30)
+
+# queued jobs considered per claim, oldest first
+CLAIM_CANDIDATES = 20
+
+JOB_KINDS = {}
+
+
+def job_kind(name, max_attempts=DEFAULT_MAX_ATTEMPTS, lease=LEASE):
+    """
+    Registers the decorated function as the job kind name. A kind that
+    does its work in one database transaction, and so cannot report
+    progress along the way, needs a lease longer than its longest run.
+    """
+    def register(function):
+        function.max_attempts = max_attempts
+        function.lease = lease
+        JOB_KINDS[name] = function
+        return function
+    return register
+
+
+def autodiscover():
+    """
+    Imports the jobs module of every installed app, so that its job kinds
+    are registered.
+    """
+    for app in settings.INSTALLED_APPS:
+        module = import_module(app)
+        if module_has_submodule(module, 'jobs'):
+            import_module('%s.jobs' % app)
+
+
+def enqueue(owner, kind, **arguments):
+    """
+    Queues a job of the given kind for owner, to be called with arguments,
+    which must be serializable as JSON. Returns the Job.
+    """
+    function = JOB_KINDS.get(kind)
+    max_attempts = getattr(function, 'max_attempts', DEFAULT_MAX_ATTEMPTS)
+    return Job.objects.create(owner=owner, kind=kind, arguments=json.dumps(arguments),
+                              max_attempts=max_attempts)
+
+
+def _lease(kind):
+    return getattr(JOB_KINDS.get(kind), 'lease', LEASE)
+
+
+def report_progress(job, progress, total=None, message=None):
+    """
+    Records how far job has got, and extends its lease. Outside a database
+    transaction the progress is visible to the owner at once.
+    """
+    job.progress = progress
+    fields = {'progress': progress, 'lease_expires': timezone.now() + _lease(job.kind)}
+    if total is not None:
+        job.progress_total = fields['progress_total'] = total
+    if message is not None:
+        job.message = fields['message'] = message
+    Job.objects.filter(pk=job.pk).update(**fields)
+
+
+def _claimable(now):
+    return Q(status=Job.QUEUED, run_after__lte=now) | Q(status=Job.RUNNING, lease_expires__lte=now)
+
+
+def _busy_owners(now):
+    return Job.objects.filter(status=Job.RUNNING, lease_expires__gt=now).values('owner')
+
+
+@transaction.commit_on_success
+def _claim(pk, owner_id, worker, now, lease):
+    # Locking the owner row serializes the claims of one owner where the
+    # database supports it; SQLite serializes every write instead. Either
+    # way the UPDATE below sees any job of the owner claimed before it.
+    list(User.objects.select_for_update().filter(pk=owner_id).values_list('pk', flat=True))
+    return Job.objects.filter(_claimable(now), pk=pk).exclude(owner__in=_busy_owners(now))\
+        .update(status=Job.RUNNING, worker=worker, lease_expires=now + lease,
+                attempts=F('attempts') + 1) == 1
+
+
+def claim_job(worker):
+    """
+    Marks the oldest job that can run now as running in worker, and returns
+    it; returns None if there is none. A job can run once its run_after has
+    passed, unless another job of its owner is running.
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(_claimable(now)).exclude(owner__in=_busy_owners(now))\
+        .order_by('run_after', 'pk').values_list('pk', 'owner', 'kind')[:CLAIM_CANDIDATES]
+    owner_ids = set()
+    for pk, owner_id, kind in candidates:
+        if owner_id in owner_ids:
+            continue
+        owner_ids.add(owner_id)
+        if _claim(pk, owner_id, worker, now, _lease(kind)):
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run_job(job):
+    """
+    Runs a claimed job, and marks it done, queued for a retry, or failed.
+    Returns the job.
+    """
+    function = JOB_KINDS.get(job.kind)
+    try:
+        if function is None:
+            raise LookupError(u"Unknown job kind %r" % job.kind)
+        message = function(job, **json.loads(job.arguments))
+    except Exception:
+        transaction.rollback_unless_managed()
+        logger.exception(u"Job %d (%s) failed on attempt %d", job.pk, job.kind, job.attempts)
+        job.message = traceback.format_exc().strip().splitlines()[-1]
+        if function is not None and job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_after = timezone.now() + RETRY_DELAY * 2 ** (job.attempts - 1)
+        else:
+            job.status = Job.FAILED
+            job.finished = timezone.now()
+    else:
+        job.status = Job.DONE
+        job.message = message or u''
+        job.progress = job.progress_total
+        job.finished = timezone.now()
+    job.lease_expires = None
+    job.save()
+    return job
+
+
+# check_ledger rebuilds in one transaction, so the job cannot report
+# progress (and renew its lease) until it is done
+@job_kind('rebuild_ledger', lease=timedelta(hours=2))
+def rebuild_ledger(job):
+    """
+    Rewrites every stored balance, checkpoint and month total of the job's
+    owner that does not match the transactions.
+    """
+    report = check_ledger(job.owner_id, rebuild=True)
+    fixed = sum(count for kind, count in report.counts().items() if kind in REBUILDABLE_KINDS)
+    return u"Checked %d transactions and rebuilt %d stored figures" % (report.realtxn_count, fixed)
@@ -0,0 +1,199 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+"""
+Helpers for keeping the stored running balances on RealAcct and VirtualAcct
+current.
+
+Balances are never recomputed from the ledger on read. Instead every write
+to RealTxn or VirtualTxn is turned into a delta which is applied to the
+account row with a single UPDATE. The signal receivers in shared.signals use
+these for single-row saves; bulk code paths (which bypass signals) should
+collect their deltas and call adjust_balances() and shift_checkpoints() once
+per batch.
+
+A transaction's state is described by an (account pk, date, value) tuple, or
+None when the transaction does not exist.
+
+The monthly category totals in CategoryMonthTotal are kept current the same
+way, from (owner pk, category pk, date, value) rollup states.
+
+Bulk code paths sum their deltas in integer cents (see as_cents()), which is
+many times faster than adding up Decimals.
+"""
+
+from bisect import bisect_left
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction, IntegrityError
+from django.db.models import F
+
+
+def as_decimal(value):
+    """
+    Returns value as a Decimal. Model instances can hold the value of a
+    DecimalField as a string or float until they are reloaded.
+    """
+    if value is None:
+        return Decimal('0.00')
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value))
+
+
+def as_cents(value):
+    """
+    Returns value, as as_decimal() takes it, as an int number of cents,
+    rounded half to even.
+    """
+    value = as_decimal(value)
+    text = str(value)
+    if text[-3:-2] != '.':
+        text = str(value.quantize(Decimal('0.01')))
+    return int(text.replace('.', ''))
+
+
+def from_cents(cents):
+    """
+    Returns an int number of cents as a Decimal with two decimal places.
+    """
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def format_cents(cents):
+    """
+    Returns an int number of cents as a decimal string, e.g. u'-12.34', the
+    form in which the database backends take a DecimalField value.
+    """
+    return u'%s%d.%02d' % ('-' if cents < 0 else '', abs(cents) // 100, abs(cents) % 100)
+
+
+def adjust_balances(model, deltas):
+    """
+    Applies a dict of {account pk: delta} to the running_balance of the
+    given account model. Zero deltas are skipped.
+    """
+    for pk, delta in deltas.items():
+        if pk is None or not delta:
+            continue
+        model.objects.filter(pk=pk).update(
+            running_balance=F('running_balance') + delta
+        )
+
+
+def bump_change_counts(queryset):
+    """
+    Increments the change_count of every account in queryset, in one
+    UPDATE.
+    """
+    queryset.update(change_count=F('change_count') + 1)
+
+
+def shift_checkpoints(model, deltas):
+    """
+    Applies a dict of {(account pk, date): delta} to every checkpoint of
+    the given checkpoint model that starts after date, since those are
+    the checkpoints that include a transaction on that date.
+    """
+    for (pk, date), delta in deltas.items():
+        if pk is None or not delta:
+            continue
+        model.objects.filter(acct=pk, period_start__gt=date).update(
+            balance=F('balance') + delta
+        )
+
+
+def adjust_rollups(model, deltas):
+    """
+    Applies a dict of {(owner pk, category pk, month): delta} to the total
+    of the given rollup model, creating the row for a month that has no
+    total yet.
+    """
+    for (owner_id, category_id, month), delta in deltas.items():
+        if not delta:
+            continue
+        rows = model.objects.filter(owner=owner_id, category=category_id, month=month)
+        if rows.update(total=F('total') + delta):
+            continue
+        sid = transaction.savepoint()
+        try:
+            model.objects.create(owner_id=owner_id, category_id=category_id,
+                                 month=month, total=delta)
+            transaction.savepoint_commit(sid)
+        except IntegrityError:
+            # another writer created the row first
+            transaction.savepoint_rollback(sid)
+            rows.update(total=F('total') + delta)
+
+
+def month_start(date):
+    return date.replace(day=1)
+
+
+def shift_checkpoints_by_day(checkpoint_model, acct_id, daily_totals):
+    """
+    Adds the {date: total in cents} in daily_totals to each checkpoint of
+    the account that starts after the date, with one UPDATE per affected
+    checkpoint rather than one per date as shift_checkpoints() would. For
+    bulk writes.
+    """
+    checkpoints = list(checkpoint_model.objects.filter(acct=acct_id)
+                       .values_list('pk', 'period_start'))
+    if not checkpoints:
+        return
+    
+    dates = sorted(daily_totals)
+    running = [0]
+    for day in dates:
+        running.append(running[-1] + daily_totals[day])
+    for pk, period_start in checkpoints:
+        delta = running[bisect_left(dates, period_start)]
+        if delta:
+            checkpoint_model.objects.filter(pk=pk).update(
+                balance=F('balance') + from_cents(delta))
+
+
+def _deltas(old, new, key):
+    deltas = defaultdict(Decimal)
+    if old is not None:
+        deltas[key(old)] -= as_decimal(old[-1])
+    if new is not None:
+        deltas[key(new)] += as_decimal(new[-1])
+    return dict((k, delta) for k, delta in deltas.items() if delta)
+
+
+def balance_deltas(old, new):
+    """
+    Returns a dict of {account pk: delta} for a transaction that moved from
+    state old to state new.
+    """
+    return _deltas(old, new, lambda state: state[0])
+
+
+def checkpoint_deltas(old, new):
+    """
+    Returns a dict of {(account pk, date): delta} for a transaction that
+    moved from state old to state new.
+    """
+    return _deltas(old, new, lambda state: (state[0], state[1]))
+
+
+def rollup_deltas(old, new):
+    """
+    Returns a dict of {(owner pk, category pk, month): delta} for a
+    transaction that moved from rollup state old to rollup state new.
+    """
+    return _deltas(old, new, lambda state: (state[0], state[1], month_start(state[2])))
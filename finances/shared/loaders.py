@@ -0,0 +1,65 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+Template loading for precompiled HamlPy templates.
+
+The compile_templates management command converts every .hamlpy template to
+a plain Django template ahead of time, written under the same name to
+settings.COMPILED_TEMPLATE_DIR. CompiledHamlLoader serves those files, so
+when it is put ahead of the HamlPy loaders no HAML is parsed at runtime.
+"""
+
+import os
+
+from django.conf import settings
+from django.template.loaders import filesystem
+from django.template.loaders.app_directories import app_template_dirs
+
+from hamlpy.hamlpy import VALID_EXTENSIONS
+
+
+def is_haml_template(template_name):
+    return os.path.splitext(template_name)[1][1:] in VALID_EXTENSIONS
+
+
+def haml_template_sources():
+    """
+    Yields (template name, path) for every HamlPy template in TEMPLATE_DIRS
+    and the installed apps' template directories. Where several directories
+    have a template of the same name, only the one Django would load is
+    given.
+    """
+    seen = set()
+    for template_dir in tuple(settings.TEMPLATE_DIRS) + app_template_dirs:
+        for root, _, files in os.walk(template_dir):
+            for filename in sorted(files):
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, template_dir).replace(os.sep, '/')
+                if is_haml_template(name) and name not in seen:
+                    seen.add(name)
+                    yield name, path
+
+
+class CompiledHamlLoader(filesystem.Loader):
+    """
+    Loads HamlPy templates precompiled by the compile_templates command.
+    Templates that have not been compiled are left to the loaders after it.
+    """
+    
+    def get_template_sources(self, template_name, template_dirs=None):
+        if not is_haml_template(template_name):
+            return []
+        return super(CompiledHamlLoader, self).get_template_sources(
+            template_name, [settings.COMPILED_TEMPLATE_DIR])
@@ -0,0 +1,90 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+import json
+import os
+import shutil
+import tempfile
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from shared.benchmark import (BenchmarkError, CONCURRENCY_USERNAME, PERCENTILES, SQLITE_PROFILES,
+                              run_concurrency_benchmark)
+
+
+class Command(BaseCommand):
+    help = ('Imports statements into a copy of the SQLite database while other processes '
+            'view pages, under each profile of connection pragmas (default: SQLite\'s own '
+            'configuration, then the production SQLITE_PRAGMAS), and writes the read '
+            'latencies, the reads stalled behind the imports and the failed reads and '
+            'imports to a JSON file.')
+    option_list = BaseCommand.option_list + (
+        make_option('--profile', action='append', dest='profiles', choices=SQLITE_PROFILES,
+                    help='only run this profile (may be repeated)'),
+        make_option('--output', default='concurrency.json',
+                    help='JSON results file (default: concurrency.json)'),
+        make_option('--readers', type='int', default=2,
+                    help='processes viewing pages (default: 2)'),
+        make_option('--seconds', type='float', default=20.0,
+                    help='how long each profile runs (default: 20)'),
+        make_option('--import-rows', type='int', default=10000,
+                    help='entries per imported statement (default: 10000)'),
+        make_option('--seed-rows', type='int', default=10000,
+                    help='transactions imported before the readers start (default: 10000)'),
+        make_option('--stall-ms', type='float', default=500,
+                    help='reads slower than this count as stalled (default: 500)'),
+    )
+    
+    def handle(self, *args, **options):
+        if options['readers'] < 1 or options['seconds'] <= 0 or options['import_rows'] < 1:
+            raise CommandError('--readers, --seconds and --import-rows must be positive')
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Only SQLite databases can be benchmarked')
+        if User.objects.filter(username=CONCURRENCY_USERNAME).exists():
+            raise CommandError('User %s already exists' % CONCURRENCY_USERNAME)
+        
+        results = {}
+        # next to the database, on the disk it syncs to
+        directory = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(primary.settings_dict['NAME'])))
+        try:
+            for profile in options['profiles'] or SQLITE_PROFILES:
+                # a fresh copy per profile, which the benchmark may fill
+                path = os.path.join(directory, '%s.db' % profile)
+                primary.cursor().execute('VACUUM INTO %s', [path])
+                # the benchmark's processes are forked from this one
+                for alias in connections:
+                    connections[alias].close()
+                try:
+                    results[profile] = run_concurrency_benchmark(
+                        path, profile, readers=options['readers'], duration=options['seconds'],
+                        import_rows=options['import_rows'], seed_rows=options['seed_rows'],
+                        stall_ms=options['stall_ms'])
+                except BenchmarkError as e:
+                    raise CommandError(unicode(e))
+        finally:
+            shutil.rmtree(directory)
+        with open(options['output'], 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        
+        if int(options.get('verbosity', 1)) > 0:
+            columns = (['reads'] + ['p%d_ms' % percentile for percentile in PERCENTILES] +
+                       ['max_ms', 'stalled_reads', 'read_errors', 'imports', 'import_errors'])
+            self.stdout.write('%-12s %s' % ('profile', ' '.join('%13s' % column for column in columns)))
+            for profile, result in sorted(results.items()):
+                self.stdout.write('%-12s %s' % (profile, ' '.join('%13s' % result[column]
+                                                                  for column in columns)))
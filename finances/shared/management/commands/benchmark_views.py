@@ -0,0 +1,90 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+import json
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from shared.benchmark import BenchmarkError, PERCENTILES, run_benchmark, regressions
+from shared.synthetic import DEFAULT_PREFIX, DEFAULT_PASSWORD
+
+
+class Command(BaseCommand):
+    args = '[<username> ...]'
+    help = ('Times the ledger views and report computations for the given users (default: '
+            'every user named with the generate_ledgers prefix), and writes latency '
+            'percentiles and query counts to a JSON file.')
+    option_list = BaseCommand.option_list + (
+        make_option('--output', default='benchmark.json',
+                    help='JSON results file (default: benchmark.json)'),
+        make_option('--baseline',
+                    help='JSON results of an earlier run; fails on any regression against it'),
+        make_option('--threshold', type='float', default=1.2,
+                    help='slowdown of the median counted as a regression (default: 1.2)'),
+        make_option('--iterations', type='int', default=20,
+                    help='timed runs of each case per user (default: 20)'),
+        make_option('--warmup', type='int', default=2,
+                    help='untimed runs of each case per user first (default: 2)'),
+        make_option('--warm', action='store_true', default=False,
+                    help='let the ledger page cache serve repeated requests'),
+        make_option('--case', action='append', dest='cases',
+                    help='only time this case (may be repeated)'),
+        make_option('--prefix', default=DEFAULT_PREFIX,
+                    help='username prefix of the generated users (default: %s)' % DEFAULT_PREFIX),
+        make_option('--password', default=DEFAULT_PASSWORD,
+                    help='password of every user (default: %s)' % DEFAULT_PASSWORD),
+    )
+    
+    def handle(self, *args, **options):
+        if options['iterations'] < 1 or options['warmup'] < 0:
+            raise CommandError('--iterations must be positive and --warmup not negative')
+        if args:
+            users = list(User.objects.filter(username__in=args).order_by('username'))
+        else:
+            users = list(User.objects.filter(username__startswith=options['prefix'])
+                         .order_by('username'))
+        if not users:
+            raise CommandError('No users to benchmark; run generate_ledgers first')
+        
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+        
+        try:
+            results = run_benchmark(users, options['password'], iterations=options['iterations'],
+                                    warmup=options['warmup'], warm=options['warm'],
+                                    only=options['cases'])
+        except BenchmarkError as e:
+            raise CommandError(unicode(e))
+        with open(options['output'], 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        
+        if int(options.get('verbosity', 1)) > 0:
+            columns = ['p%d_ms' % percentile for percentile in PERCENTILES] + ['max_ms', 'queries_max']
+            self.stdout.write('%-20s %s' % ('case', ' '.join('%11s' % column for column in columns)))
+            for name, summary in sorted(results['cases'].items()):
+                self.stdout.write('%-20s %s' % (name, ' '.join('%11s' % summary[column]
+                                                               for column in columns)))
+            for name, error in sorted(results['errors'].items()):
+                self.stdout.write('%-20s failed: %s' % (name, error))
+        
+        if baseline is not None:
+            found = regressions(results, baseline, options['threshold'])
+            for message in found:
+                self.stderr.write(message)
+            if found:
+                raise CommandError('%d regressions against %s' % (len(found), options['baseline']))
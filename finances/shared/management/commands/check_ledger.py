@@ -0,0 +1,98 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+import multiprocessing
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+
+from shared.integrity import DEFAULT_CHUNK_SIZE, VIOLATION_KINDS, REBUILDABLE_KINDS, check_ledger
+
+
+def _close_connections():
+    # a forked worker must not share the parent's database connections
+    for connection in connections.all():
+        connection.close()
+
+
+def _check(args):
+    return check_ledger(*args)
+
+
+class Command(BaseCommand):
+    args = '[<username> ...]'
+    help = ('Checks that every RealTxn is split into VirtualTxns that sum to its value, '
+            'on VirtualAccts of its RealAcct, and that the stored balances, checkpoints '
+            'and monthly category totals match the transactions. Checks every user '
+            'unless usernames are given, spread over a pool of processes.')
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', type='int', default=None,
+                    help='worker processes (default: one per CPU; 1 checks in this process)'),
+        make_option('--chunk-size', type='int', default=DEFAULT_CHUNK_SIZE,
+                    help='RealTxns read per query (default: %d)' % DEFAULT_CHUNK_SIZE),
+        make_option('--rebuild', action='store_true', default=False,
+                    help='rewrite every wrong balance, checkpoint and total from the transactions'),
+    )
+    
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        processes = options['processes'] or multiprocessing.cpu_count()
+        if processes < 1 or options['chunk_size'] < 1:
+            raise CommandError('--processes and --chunk-size must be positive')
+        
+        users = User.objects.all()
+        if args:
+            users = users.filter(username__in=args)
+            if users.count() != len(set(args)):
+                missing = set(args) - set(users.values_list('username', flat=True))
+                raise CommandError('No user %s' % ', '.join(sorted(missing)))
+        # biggest ledgers first, so no worker is left with one at the end
+        owners = users.annotate(txns=Count('realtxn')).order_by('-txns', 'pk').values_list('pk', 'txns')
+        work = [(owner_id, options['chunk_size'], options['rebuild']) for owner_id, _ in owners]
+        
+        if processes == 1:
+            reports = (check_ledger(*item) for item in work)
+            pool = None
+        else:
+            _close_connections()
+            pool = multiprocessing.Pool(processes, initializer=_close_connections)
+            reports = pool.imap_unordered(_check, work)
+        
+        unfixed = 0
+        try:
+            for report in reports:
+                for violation in report.violations:
+                    if not (report.rebuilt and violation.kind in REBUILDABLE_KINDS):
+                        unfixed += 1
+                    if verbosity > 1:
+                        self.stdout.write('user %s: %s: %s' % (report.owner_id, violation.kind,
+                                                               violation.detail))
+                if verbosity > 0 and (report.violations or verbosity > 1):
+                    counts = report.counts()
+                    self.stdout.write('user %s: %d RealTxns (%d unsplit), %s' % (
+                        report.owner_id, report.realtxn_count, report.unsplit_count,
+                        ', '.join('%d %s' % (counts[kind], VIOLATION_KINDS[kind])
+                                  for kind in sorted(counts)) or 'no violations'))
+                    if report.rebuilt and set(counts) & REBUILDABLE_KINDS:
+                        self.stdout.write('user %s: stored balances rebuilt' % report.owner_id)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        
+        if unfixed:
+            raise CommandError('%d ledger violations found' % unfixed)
@@ -0,0 +1,62 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+import codecs
+import os
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand, CommandError
+
+from hamlpy import hamlpy
+
+from shared.loaders import haml_template_sources, is_haml_template
+
+
+class Command(NoArgsCommand):
+    help = ('Compiles every HamlPy template to a plain Django template, for '
+            'shared.loaders.CompiledHamlLoader. Run it on each deployment.')
+    option_list = NoArgsCommand.option_list + (
+        make_option('--output',
+                    help='directory to write to (default: settings.COMPILED_TEMPLATE_DIR)'),
+    )
+    
+    def handle_noargs(self, **options):
+        output = options['output'] or settings.COMPILED_TEMPLATE_DIR
+        verbosity = int(options.get('verbosity', 1))
+        
+        written = set()
+        for name, path in haml_template_sources():
+            with codecs.open(path, 'r', settings.FILE_CHARSET) as source:
+                try:
+                    html = hamlpy.Compiler().process(source.read())
+                except Exception as e:
+                    raise CommandError('Could not compile %s: %s' % (path, e))
+            target = os.path.join(output, *name.split('/'))
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            with codecs.open(target, 'w', settings.FILE_CHARSET) as compiled:
+                compiled.write(html)
+            written.add(target)
+            if verbosity > 1:
+                self.stdout.write('%s -> %s' % (path, target))
+        
+        # drop templates whose source has since been removed
+        for root, _, files in os.walk(output):
+            for filename in files:
+                target = os.path.join(root, filename)
+                if is_haml_template(target) and target not in written:
+                    os.remove(target)
+        
+        self.stdout.write('Compiled %d templates to %s' % (len(written), output))
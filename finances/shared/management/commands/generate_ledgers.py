@@ -0,0 +1,72 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import NoArgsCommand, CommandError
+
+from shared.synthetic import DEFAULT_PREFIX, DEFAULT_PASSWORD, DEFAULT_CHUNK_SIZE, generate_ledgers
+
+from accounts.importers import DEFAULT_BATCH_SIZE
+
+
+class Command(NoArgsCommand):
+    help = ('Generates synthetic users with realistic ledgers, for benchmarking. '
+            'Users are named <prefix>1, <prefix>2, ...')
+    option_list = NoArgsCommand.option_list + (
+        make_option('--users', type='int', default=1, help='users to create (default: 1)'),
+        make_option('--accounts', type='int', default=2, help='RealAccts per user (default: 2)'),
+        make_option('--budgets', type='int', default=5, help='Budgets per user (default: 5)'),
+        make_option('--categories', type='int', default=12,
+                    help='Categories per user, spread over the budgets (default: 12)'),
+        make_option('--txns', type='int', default=1000, help='RealTxns per user (default: 1000)'),
+        make_option('--days', type='int', default=730,
+                    help='days before today the transactions are spread over (default: 730)'),
+        make_option('--prefix', default=DEFAULT_PREFIX,
+                    help='username prefix (default: %s)' % DEFAULT_PREFIX),
+        make_option('--password', default=DEFAULT_PASSWORD,
+                    help='password of every user (default: %s)' % DEFAULT_PASSWORD),
+        make_option('--seed', type='int', default=None, help='random seed, for repeatable ledgers'),
+        make_option('--chunk-size', type='int', default=DEFAULT_CHUNK_SIZE,
+                    help='RealTxns imported per database transaction (default: %d)' % DEFAULT_CHUNK_SIZE),
+        make_option('--batch-size', type='int', default=DEFAULT_BATCH_SIZE,
+                    help='rows per INSERT statement (default: as many as the database allows)'),
+    )
+    
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        for name in ('users', 'accounts', 'budgets', 'categories', 'days', 'chunk_size'):
+            if options[name] < 1:
+                raise CommandError('--%s must be positive' % name.replace('_', '-'))
+        if options['txns'] < 0:
+            raise CommandError('--txns must not be negative')
+        
+        usernames = ['%s%d' % (options['prefix'], n + 1) for n in range(options['users'])]
+        taken = list(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        if taken:
+            raise CommandError('Users %s already exist; use another --prefix'
+                               % ', '.join(sorted(taken)))
+        
+        def progress(username):
+            if verbosity > 1:
+                self.stdout.write('Generated %s' % username)
+        
+        result = generate_ledgers(
+            options['users'], accounts=options['accounts'], budgets=options['budgets'],
+            categories=options['categories'], txns=options['txns'], days=options['days'],
+            prefix=options['prefix'], password=options['password'], seed=options['seed'],
+            chunk_size=options['chunk_size'], batch_size=options['batch_size'], progress=progress)
+        if verbosity > 0:
+            self.stdout.write(unicode(result))
@@ -0,0 +1,69 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+import glob
+import os
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shared.request_stats import read_records, endpoint_summaries, repeated_queries
+
+
+def _log_files(path):
+    # the rotated files (path.1 is the newest) and then the current one
+    rotated = [name for name in glob.glob(path + '.*') if name.rsplit('.', 1)[1].isdigit()]
+    rotated.sort(key=lambda name: -int(name.rsplit('.', 1)[1]))
+    return rotated + ([path] if os.path.exists(path) else [])
+
+
+class Command(BaseCommand):
+    args = '[<log file> ...]'
+    help = ('Reports the slowest views and the most repeated queries (N+1 patterns) '
+            'from the request stats log written by shared.request_stats.RequestStatsMiddleware '
+            '(default: settings.REQUEST_STATS_LOG and its rotated files).')
+    option_list = BaseCommand.option_list + (
+        make_option('--top', type='int', default=10,
+                    help='views and queries to list (default: 10)'),
+        make_option('--min-repeats', type='int', default=5,
+                    help='runs of one statement in a request counted as N+1 (default: 5)'),
+    )
+    
+    def handle(self, *args, **options):
+        paths = list(args) or _log_files(settings.REQUEST_STATS_LOG)
+        if not paths:
+            raise CommandError('No request stats log at %s' % settings.REQUEST_STATS_LOG)
+        for path in paths:
+            if not os.path.exists(path):
+                raise CommandError('No such file: %s' % path)
+        
+        records = list(read_records(paths))
+        self.stdout.write('%d requests in %s' % (len(records), ', '.join(paths)))
+        
+        self.stdout.write('\nSlowest views, by 95th percentile latency:')
+        self.stdout.write('%-40s %8s %9s %9s %9s %8s %8s %8s' % (
+            'view', 'requests', 'p50 ms', 'p95 ms', 'max ms', 'queries', 'sql ms', 'tmpl ms'))
+        for summary in endpoint_summaries(records)[:options['top']]:
+            self.stdout.write('%-40s %8d %9.1f %9.1f %9.1f %8.1f %8.1f %8.1f' % (
+                summary['view'], summary['requests'], summary['p50_ms'], summary['p95_ms'],
+                summary['max_ms'], summary['queries'], summary['sql_ms'], summary['template_ms']))
+        
+        self.stdout.write('\nStatements run %d or more times in one request:' % options['min_repeats'])
+        offenders = repeated_queries(records, options['min_repeats'])[:options['top']]
+        if not offenders:
+            self.stdout.write('none')
+        for offender in offenders:
+            self.stdout.write('%-40s %5d times in %d requests\n    %s' % (
+                offender['view'], offender['repeats'], offender['requests'], offender['sql']))
@@ -0,0 +1,81 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+import logging
+import os
+import socket
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections
+
+from shared.jobs import autodiscover, claim_job, run_job
+
+logger = logging.getLogger(__name__)
+
+
+def close_connections():
+    for connection in connections.all():
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = ('Runs queued background jobs (statement imports, allocation, ledger rebuilds) '
+            'one at a time, polling for new ones. Any number of workers may run at once; '
+            'jobs of one user never run concurrently.')
+    option_list = BaseCommand.option_list + (
+        make_option('--once', action='store_true', default=False,
+                    help='exit once no job is ready to run instead of polling'),
+        make_option('--poll', type='float', default=2.0,
+                    help='seconds to wait between polls of an empty queue (default: 2)'),
+        make_option('--max-jobs', type='int', default=None,
+                    help='exit after running this many jobs'),
+        make_option('--worker', default=None,
+                    help='name recorded on the jobs this worker runs (default: host:pid)'),
+    )
+    
+    def handle(self, *args, **options):
+        if options['poll'] <= 0 or (options['max_jobs'] is not None and options['max_jobs'] < 1):
+            raise CommandError('--poll and --max-jobs must be positive')
+        verbosity = int(options.get('verbosity', 1))
+        worker = options['worker'] or '%s:%d' % (socket.gethostname(), os.getpid())
+        autodiscover()
+        
+        ran = 0
+        while options['max_jobs'] is None or ran < options['max_jobs']:
+            try:
+                job = claim_job(worker)
+            except DatabaseError:
+                # the database went away or is locked; keep the worker
+                # alive and try again with a fresh connection
+                logger.exception(u"Worker %s could not claim a job", worker)
+                close_connections()
+                time.sleep(options['poll'])
+                continue
+            if job is None:
+                if options['once']:
+                    break
+                # don't hold a connection open while idle
+                close_connections()
+                time.sleep(options['poll'])
+                continue
+            
+            started = time.time()
+            job = run_job(job)
+            ran += 1
+            if verbosity > 0:
+                self.stdout.write('job %d (%s) for user %d %s in %.2fs: %s' % (
+                    job.pk, job.kind, job.owner_id, job.get_status_display().lower(),
+                    time.time() - started, job.message))
@@ -0,0 +1,48 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Replaces each SQLite replica in DATABASE_REPLICAS with a consistent copy of the '
+            'default database, for trying the replica router locally. Readers of the '
+            'default database are not blocked while it is copied.')
+    
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Only SQLite replicas can be copied; other databases '
+                               'replicate on the server.')
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('DATABASE_REPLICAS is empty')
+        
+        for alias in settings.DATABASE_REPLICAS:
+            name = settings.DATABASES[alias]['NAME']
+            if os.path.abspath(name) == os.path.abspath(primary.settings_dict['NAME']):
+                self.stdout.write('%s: same file as %s' % (alias, DEFAULT_DB_ALIAS))
+                continue
+            # VACUUM INTO writes a transactionally consistent copy; the
+            # rename swaps it in whole for the next connection to open
+            copy = '%s.sync' % name
+            if os.path.exists(copy):
+                os.remove(copy)
+            primary.cursor().execute('VACUUM INTO %s', [copy])
+            os.rename(copy, name)
+            connections[alias].close()
+            self.stdout.write('%s: copied to %s' % (alias, name))
@@ -13,22 +13,99 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-from django.db import models
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.exceptions import FieldError, PermissionDenied, ValidationError
+from django.db import models, transaction, IntegrityError
+from django.db.models import Q, Sum
+from django.db.models.fields.related import ReverseSingleRelatedObjectDescriptor
+from django.db.models.query import QuerySet
+from django.utils import timezone
 from django.contrib.auth.models import User
 
-from shared.controllers import PeriodLengthFactory, MONTH_PERIOD
+from shared.controllers import PeriodLengthFactory, MONTH_PERIOD, local_date
+from shared.ledger import as_decimal
+from shared.routers import primary_reads
 
 CHARFIELD_MAX_LENGTH = 200
 
+CENTS = Decimal('0.01')
+
+# RealAccts are not tied to a Budget, so their balances are checkpointed monthly
+REAL_ACCT_PERIOD_LENGTH = MONTH_PERIOD
+
+
+class ClosedPeriodError(ValidationError):
+    """
+    Raised on an attempt to write a transaction dated in a closed period of
+    a Budget, or to change or delete one that was closed with it.
+    """
+
+
+class OwnedQuerySet(QuerySet):
+    def for_user(self, user):
+        """
+        Returns the rows owned by user (none for an anonymous user), with
+        the model's OWNER_SELECT_RELATED relations joined in, so a view gets
+        authorization and related objects from the same query.
+        """
+        if user is None or not user.is_authenticated():
+            return self.none()
+        queryset = self.filter(owner=user.pk)
+        if self.model.OWNER_SELECT_RELATED:
+            queryset = queryset.select_related(*self.model.OWNER_SELECT_RELATED)
+        return queryset
+
+
+class OwnedManager(models.Manager):
+    """
+    Default manager of every OwnedModel.
+    """
+    
+    def get_query_set(self):
+        return OwnedQuerySet(self.model, using=self._db)
+    
+    def for_user(self, user):
+        return self.get_query_set().for_user(user)
+
+
+class OwnerDescriptor(ReverseSingleRelatedObjectDescriptor):
+    """
+    Lets the owner of an OwnedModel be assigned once, when the instance is
+    created. An instance loaded from the database already has its owner.
+    """
+    
+    def __set__(self, instance, value):
+        assigned = instance.__dict__.get('_owner_assigned')
+        if assigned or getattr(instance, self.field.attname, None) is not None:
+            raise FieldError(u"The owner of %s cannot be changed." % instance._meta.object_name)
+        super(OwnerDescriptor, self).__set__(instance, value)
+        instance._owner_assigned = True
+
+
+class OwnerField(models.ForeignKey):
+    def contribute_to_class(self, cls, name):
+        super(OwnerField, self).contribute_to_class(cls, name)
+        setattr(cls, self.name, OwnerDescriptor(self))
+
 
 class OwnedModel(models.Model):
     """
     Abstract class to move owner attribute into a common parent class.
     
-    Owner should be set at instantiation, and not be changed afterward.
+    Owner should be set at instantiation, and not be changed afterward;
+    assigning it again raises FieldError. Views should fetch rows through
+    objects.for_user(request.user), which checks ownership in the query
+    itself.
     """
     
-    owner = models.ForeignKey(User)
+    owner = OwnerField(User)
+    
+    objects = OwnedManager()
+    
+    # relations joined in by for_user()
+    OWNER_SELECT_RELATED = ()
     
     class Meta:
         abstract = True
@@ -37,14 +114,16 @@ class OwnedModel(models.Model):
         """
         Returns True if the given request can be processed.
         """
-        raise NotImplementedError()
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_authenticated() and self.owner_id == user.pk
     
     def assert_is_allowed(self, request):
         """
         Raises a PermissionDenied exception if the requesting user is not
         permitted to perform the action.
         """
-        raise NotImplementedError()
+        if not self.is_allowed(request):
+            raise PermissionDenied()
 
 
 class NamedModel(models.Model):
@@ -58,6 +137,90 @@ class NamedModel(models.Model):
         abstract = True
 
 
+class CheckpointedModel(models.Model):
+    """
+    Abstract class for accounts whose balance is recorded in a checkpoint
+    row at the start of every period, so that the balance as of any date
+    is one checkpoint plus the transactions since it.
+    
+    Subclasses provide period_length_controller, transactions(), and a
+    'checkpoints' reverse relation, and set TXN_DATE_FIELD to the lookup
+    for the date of their transactions.
+    """
+    
+    TXN_DATE_FIELD = 'date'
+    
+    class Meta:
+        abstract = True
+    
+    def transactions(self):
+        raise NotImplementedError()
+    
+    def balance_as_of(self, timezone_date):
+        """
+        Returns the balance of this account at the end of timezone_date.
+        """
+        timezone_date = local_date(timezone_date)
+        checkpoint = self.checkpoint_for(timezone_date)
+        since = self.transactions().filter(**{
+            self.TXN_DATE_FIELD + '__gte': checkpoint.period_start,
+            self.TXN_DATE_FIELD + '__lte': timezone_date,
+        }).aggregate(total=Sum('value'))['total']
+        return (as_decimal(checkpoint.balance) + as_decimal(since)).quantize(CENTS)
+    
+    def checkpoint_for(self, timezone_date):
+        """
+        Returns the checkpoint at the start of the period containing
+        timezone_date, creating it and any missing checkpoints before it
+        from the nearest earlier checkpoint.
+        
+        The balances written are sums of what is read, so this reads the
+        primary database rather than a replica that may lag behind it.
+        """
+        with primary_reads():
+            return self._checkpoint_for(timezone_date)
+    
+    def _checkpoint_for(self, timezone_date):
+        controller = self.period_length_controller
+        period_start = controller.period_start_date(timezone_date)
+        
+        previous = list(self.checkpoints.filter(
+            period_start__lte=period_start).order_by('-period_start')[:1])
+        if previous and previous[0].period_start == period_start:
+            return previous[0]
+        
+        txns = self.transactions().filter(**{self.TXN_DATE_FIELD + '__lt': period_start})
+        if previous:
+            first = previous[0].period_start
+            balance = as_decimal(previous[0].balance)
+            txns = txns.filter(**{self.TXN_DATE_FIELD + '__gte': first})
+        else:
+            first = txns.aggregate(first=models.Min(self.TXN_DATE_FIELD))['first'] or period_start
+            balance = Decimal('0.00')
+        daily_totals = sorted(txns.order_by().values_list(self.TXN_DATE_FIELD)
+                              .annotate(total=Sum('value')))
+        
+        checkpoints = []
+        i = 0
+        for start in controller.period_start_dates(first, period_start):
+            while i < len(daily_totals) and daily_totals[i][0] < start:
+                balance += as_decimal(daily_totals[i][1])
+                i += 1
+            if not previous or start > previous[0].period_start:
+                checkpoints.append(self.checkpoints.model(
+                    acct=self, period_start=start, balance=balance))
+        
+        sid = transaction.savepoint()
+        try:
+            self.checkpoints.model.objects.bulk_create(checkpoints)
+            transaction.savepoint_commit(sid)
+        except IntegrityError:
+            # another request filled in these periods first
+            transaction.savepoint_rollback(sid)
+            return self.checkpoints.get(period_start=period_start)
+        return checkpoints[-1]
+
+
 class Budget(NamedModel, OwnedModel):
     """
     A Budget represents an overall behaviour of a budget. It contains
@@ -69,10 +232,15 @@ class Budget(NamedModel, OwnedModel):
     
     period_budget_amount = models.DecimalField(max_digits=15, decimal_places=2)
     period_length = models.IntegerField(default=MONTH_PERIOD)
+    # the end of the last period frozen into a BudgetSnapshot, see budgets.closing
+    closed_through = models.DateField(null=True, blank=True, editable=False)
     
-    def __init__(self, *args, **kwargs):
-        super(Budget, self).__init__(*args, **kwargs)
-        self.period_length_controller = PeriodLengthFactory(self.period_length).make_controller()
+    @property
+    def period_length_controller(self):
+        """
+        Returns the shared controller for this budget's period length.
+        """
+        return PeriodLengthFactory(self.period_length).make_controller()
     
     def __unicode__(self):
         return self.name
@@ -82,8 +250,15 @@ class Budget(NamedModel, OwnedModel):
         """
         Returns the VirtualAcct that should be used for this budget in the
         current period. Uses the @property decorator.
+        
+        The account is found by its (parent_budget, period_start) key. If the
+        current period has no account yet, one is opened against the same
+        RealAcct as the budget's most recent account. Returns None if the
+        budget has never had an account.
         """
-        raise NotImplementedError()
+        if not hasattr(self, '_current_account_cache'):
+            self._current_account_cache = VirtualAcct.objects.current_for_budget(self)
+        return self._current_account_cache
     
     @property
     def current_period_start_date(self):
@@ -104,6 +279,41 @@ class Budget(NamedModel, OwnedModel):
         Returns True if the given timezone_date is in the current period, otherwise returns False
         """
         return self.period_length_controller.in_current_period(timezone_date)
+    
+    def is_closed_on(self, timezone_date):
+        """
+        Returns True if timezone_date is in a period of this budget that has
+        been closed.
+        """
+        return self.closed_through is not None and local_date(timezone_date) <= self.closed_through
+    
+    def period_dates(self, timezone_date=None):
+        """
+        Returns the (start, end) dates, both inclusive, of the period
+        containing timezone_date (default: the current period).
+        """
+        controller = self.period_length_controller
+        if timezone_date is None:
+            return controller.current_period_start_date, controller.current_period_end_date
+        return controller.period_start_date(timezone_date), controller.period_end_date(timezone_date)
+    
+    def period_transactions(self, timezone_date=None):
+        """
+        Returns the RealTxns counted against this budget (through their
+        Category) in the period containing timezone_date (default: the
+        current period), as a range scan of the (owner, date) index.
+        """
+        return RealTxn.objects.filter(owner=self.owner_id, category__budget=self,
+                                      date__range=self.period_dates(timezone_date))
+    
+    def period_splits(self, timezone_date=None):
+        """
+        Returns the VirtualTxns on this budget's VirtualAccts in the period
+        containing timezone_date (default: the current period), as a range
+        scan of the (owner, date) index.
+        """
+        return VirtualTxn.objects.filter(owner=self.owner_id, virtual_acct__parent_budget=self,
+                                         date__range=self.period_dates(timezone_date))
 
 
 class Category(NamedModel, OwnedModel):
@@ -115,17 +325,66 @@ class Category(NamedModel, OwnedModel):
     
     budget = models.ForeignKey(Budget)
     
+    OWNER_SELECT_RELATED = ('budget',)
+    
     def __unicode__(self):
         return self.name
 
 
-class RealAcct(OwnedModel, NamedModel):
+class AllocationRule(OwnedModel):
+    """
+    Sends part of every RealTxn in a Category to the VirtualAcct of another
+    Budget, either a fixed amount or a percentage.
+    
+    Fixed amounts are taken first and percentages are of what is left after
+    them; whatever the rules do not allocate stays with the Category's own
+    Budget. Rules are applied in order of priority. See accounts.allocation.
+    """
+    
+    category = models.ForeignKey(Category, related_name='allocation_rules')
+    budget = models.ForeignKey(Budget)
+    amount = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+    percentage = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    priority = models.PositiveIntegerField(default=0)
+    
+    OWNER_SELECT_RELATED = ('category', 'budget')
+    
+    class Meta:
+        ordering = ['priority', 'id']
+    
+    def __unicode__(self):
+        if self.amount is not None:
+            return u"%s to %s" % (self.amount, self.budget)
+        return u"%s%% to %s" % (self.percentage, self.budget)
+    
+    def clean(self):
+        if (self.amount is None) == (self.percentage is None):
+            raise ValidationError(u"Give either an amount or a percentage.")
+        if self.amount is not None and self.amount <= 0:
+            raise ValidationError(u"The amount must be positive.")
+        if self.percentage is not None and not 0 < self.percentage <= 100:
+            raise ValidationError(u"The percentage must be more than 0 and at most 100.")
+
+
+class RealAcct(OwnedModel, NamedModel, CheckpointedModel):
     """
     Represents a real-world bank account. RealTxn class objects can be listed
     against such an account. Furthermore, VirtualAcct class objects can be
     associated with this account so that they are included in the account balance
+    
+    The balance is stored on the account row in running_balance and is kept
+    current by the RealTxn signal handlers in shared.signals, so reading it
+    never sums the ledger.
+    
+    change_count goes up whenever a RealTxn on the account, or a VirtualTxn
+    split of one, is written, so clients can tell whether the account's
+    transactions changed without reading them (see accounts.views.txn_api).
     """
     
+    running_balance = models.DecimalField(max_digits=15, decimal_places=2,
+                                          default=Decimal('0.00'), editable=False)
+    change_count = models.PositiveIntegerField(default=0, editable=False)
+    
     def __unicode__(self):
         return self.name
     
@@ -135,28 +394,116 @@ class RealAcct(OwnedModel, NamedModel):
         Returns the balance of this account. The account balance is an
         aggregate of all the VirtualAccts associated with this RealAcct
         """
-        raise NotImplementedError()
+        return Decimal(self.running_balance).quantize(CENTS)
+    
+    @property
+    def period_length_controller(self):
+        return PeriodLengthFactory(REAL_ACCT_PERIOD_LENGTH).make_controller()
+    
+    def transactions(self):
+        return self.realtxn_set.all()
+
+
+class VirtualAcctManager(OwnedManager):
+    def current_for_budget(self, budget):
+        """
+        Returns the VirtualAcct for the budget's current period, opening one
+        if needed (see Budget.current_account).
+        """
+        period_start = budget.current_period_start_date
+        try:
+            return self.get(parent_budget=budget, period_start=period_start)
+        except self.model.DoesNotExist:
+            pass
+        
+        previous = list(self.filter(parent_budget=budget, period_start__lt=period_start)
+                        .order_by('-period_start')[:1])
+        if not previous:
+            return None
+        sid = transaction.savepoint()
+        try:
+            account = self.create(owner_id=budget.owner_id, name=previous[0].name,
+                                  parent_budget=budget, real_acct_id=previous[0].real_acct_id,
+                                  period_start=period_start)
+            transaction.savepoint_commit(sid)
+            return account
+        except IntegrityError:
+            # opened by a concurrent request
+            transaction.savepoint_rollback(sid)
+            return self.get(parent_budget=budget, period_start=period_start)
+    
+    def current_for_budgets(self, budgets):
+        """
+        Returns a dict of {budget pk: VirtualAcct} for the current periods of
+        the given budgets using one query. Budgets without an account for
+        their current period are left out.
+        """
+        budget_pks = defaultdict(list)
+        for budget in budgets:
+            budget_pks[budget.current_period_start_date].append(budget.pk)
+        if not budget_pks:
+            return {}
+        
+        query = Q()
+        for period_start, pks in budget_pks.items():
+            query |= Q(period_start=period_start, parent_budget__in=pks)
+        return dict((account.parent_budget_id, account) for account in self.filter(query))
 
 
-class VirtualAcct(OwnedModel, NamedModel):
+class VirtualAcct(OwnedModel, NamedModel, CheckpointedModel):
     """
     Represents a sub-division of a real account (RealAcct). Is associated with
     a RealAcct class object to represent a portion of that account's aggregate balance.
+    
+    Each VirtualAcct covers one period of its parent Budget, starting on
+    period_start, and (parent_budget, period_start) is unique.
+    
+    Like RealAcct, the balance is stored in running_balance and kept current
+    by the VirtualTxn signal handlers in shared.signals. Balances are
+    checkpointed at the boundaries of the parent Budget's periods.
     """
     
     parent_budget = models.ForeignKey(Budget)
     real_acct = models.ForeignKey(RealAcct)
+    period_start = models.DateField()
+    running_balance = models.DecimalField(max_digits=15, decimal_places=2,
+                                          default=Decimal('0.00'), editable=False)
+    
+    objects = VirtualAcctManager()
+    
+    OWNER_SELECT_RELATED = ('parent_budget', 'real_acct')
+    
+    class Meta:
+        unique_together = (('parent_budget', 'period_start'),)
     
     def __unicode__(self):
         return self.name
     
+    def save(self, *args, **kwargs):
+        """
+        Defaults period_start to the start of the parent Budget's current
+        period.
+        """
+        if self.period_start is None:
+            self.period_start = self.parent_budget.current_period_start_date
+        super(VirtualAcct, self).save(*args, **kwargs)
+    
     @property
     def balance(self):
         """
-        Calculates the balance of this account from the VirtualTxn objects
-        associated with it. Uses  the @property decorator.
+        Returns the balance of this account, which is the sum of the
+        VirtualTxn objects associated with it. Uses  the @property decorator.
         """
-        raise NotImplementedError()
+        return Decimal(self.running_balance).quantize(CENTS)
+    
+    TXN_DATE_FIELD = 'date'
+    
+    @property
+    def period_length_controller(self):
+        return self.parent_budget.period_length_controller
+    
+    def transactions(self):
+        return self.virtualtxn_set.all()
 
 
 class RealTxn(OwnedModel):
@@ -170,6 +517,18 @@ class RealTxn(OwnedModel):
     real_account = models.ForeignKey(RealAcct)
     value = models.DecimalField(max_digits=15, decimal_places=2)
     category = models.ForeignKey(Category)
+    date = models.DateField(default=local_date)
+    posted = models.DateTimeField(default=timezone.now, editable=False)
+    # set when the period of the category's budget is closed; see shared.signals
+    closed = models.BooleanField(default=False, editable=False)
+    
+    OWNER_SELECT_RELATED = ('real_account', 'category')
+    
+    class Meta:
+        # account listings are ordered and paged by (date, id), which also
+        # serves (real_account, date) range scans; per-user period queries
+        # scan (owner, date)
+        index_together = [['real_account', 'date', 'id'], ['owner', 'date']]
     
     def __unicode__(self):
         return self.name
@@ -186,6 +545,214 @@ class VirtualTxn(OwnedModel):
     virtual_acct = models.ForeignKey(VirtualAcct)
     value = models.DecimalField(max_digits=15, decimal_places=2)
     real_txn = models.ForeignKey(RealTxn)
+    # a copy of real_txn.date, so that splits can be range-scanned by date
+    # without a join; kept in step by save() and the RealTxn signal handlers
+    date = models.DateField(editable=False)
+    # set when the period of the account is closed; see shared.signals
+    closed = models.BooleanField(default=False, editable=False)
+    
+    OWNER_SELECT_RELATED = ('virtual_acct', 'real_txn')
+    
+    class Meta:
+        index_together = [['virtual_acct', 'date'], ['owner', 'date']]
     
     def __unicode__(self):
         return self.name
+    
+    def save(self, *args, **kwargs):
+        """
+        Copies the date of the RealTxn being split.
+        """
+        self.date = self.real_txn.date
+        super(VirtualTxn, self).save(*args, **kwargs)
+
+
+
+class BalanceCheckpoint(models.Model):
+    """
+    Abstract class for the balance of an account at the start of a period,
+    i.e. the sum of every transaction on the account dated before
+    period_start.
+    
+    Checkpoints are created on demand by CheckpointedModel.checkpoint_for
+    and shifted by the signal handlers in shared.signals whenever a
+    transaction dated before them changes.
+    """
+    
+    period_start = models.DateField()
+    balance = models.DecimalField(max_digits=15, decimal_places=2)
+    
+    class Meta:
+        abstract = True
+
+
+class RealAcctCheckpoint(BalanceCheckpoint):
+    acct = models.ForeignKey(RealAcct, related_name='checkpoints')
+    
+    class Meta:
+        unique_together = (('acct', 'period_start'),)
+
+
+class VirtualAcctCheckpoint(BalanceCheckpoint):
+    acct = models.ForeignKey(VirtualAcct, related_name='checkpoints')
+    
+    class Meta:
+        unique_together = (('acct', 'period_start'),)
+
+
+class CategoryMonthTotal(OwnedModel):
+    """
+    The sum of every RealTxn value in a Category dated in one calendar
+    month, so spending trends can be read without aggregating the ledger.
+    
+    Rows are kept current by the signal handlers in shared.signals (and by
+    bulk imports) rather than recomputed; a month with no transactions has
+    no row.
+    """
+    
+    category = models.ForeignKey(Category, related_name='month_totals')
+    month = models.DateField()
+    total = models.DecimalField(max_digits=15, decimal_places=2)
+    
+    class Meta:
+        unique_together = (('owner', 'category', 'month'),)
+        ordering = ['month']
+
+
+class PeriodSnapshot(OwnedModel):
+    """
+    Abstract class for the figures of one closed period, frozen when the
+    period is closed (see budgets.closing) so that historical views read
+    one row instead of the period's transactions. Snapshots are written
+    once and never changed; saving one again raises FieldError.
+    
+    spent is the negative of the net value of the period's transactions, and
+    closing_balance is opening_balance less spent, plus whatever else the
+    subclass counts in.
+    """
+    
+    period_start = models.DateField()
+    period_end = models.DateField()
+    opening_balance = models.DecimalField(max_digits=15, decimal_places=2)
+    spent = models.DecimalField(max_digits=15, decimal_places=2)
+    closing_balance = models.DecimalField(max_digits=15, decimal_places=2)
+    closed_at = models.DateTimeField(default=timezone.now, editable=False)
+    
+    class Meta:
+        abstract = True
+    
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise FieldError(u"%s rows cannot be changed." % self._meta.object_name)
+        super(PeriodSnapshot, self).save(*args, **kwargs)
+
+
+class BudgetSnapshot(PeriodSnapshot):
+    """
+    A closed period of a Budget. spent counts the RealTxns of the budget's
+    categories, as the burn-down does; budgeted is the budget's
+    period_budget_amount when the period was closed. carry_over is
+    budgeted less spent, what the period leaves over (negative when
+    overspent), and is carried from opening_balance into closing_balance,
+    which opens the next period.
+    """
+    
+    budget = models.ForeignKey(Budget, related_name='snapshots')
+    budgeted = models.DecimalField(max_digits=15, decimal_places=2)
+    carry_over = models.DecimalField(max_digits=15, decimal_places=2)
+    
+    OWNER_SELECT_RELATED = ('budget',)
+    
+    class Meta:
+        unique_together = (('budget', 'period_start'),)
+        ordering = ['period_start']
+
+
+class VirtualAcctSnapshot(PeriodSnapshot):
+    """
+    A VirtualAcct in a closed period of its Budget: its balance before the
+    period, its VirtualTxn splits dated in the period as spent, and its
+    balance at the end of the period.
+    """
+    
+    virtual_acct = models.OneToOneField(VirtualAcct, related_name='snapshot')
+    budget_snapshot = models.ForeignKey(BudgetSnapshot, related_name='account_snapshots')
+    
+    OWNER_SELECT_RELATED = ('virtual_acct',)
+
+
+class Job(OwnedModel):
+    """
+    A piece of heavy ledger work (an import, an allocation, a rebuild of
+    the stored balances) queued to run in the run_jobs worker instead of a
+    request. kind names the function that does the work and arguments are
+    its keyword arguments as JSON; see shared.jobs.
+    
+    A job is claimed by setting it running with a lease, which the worker
+    extends as the job reports progress. A running job whose lease has
+    expired belonged to a worker that died, and can be claimed again.
+    """
+    
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+    
+    kind = models.CharField(max_length=CHARFIELD_MAX_LENGTH)
+    arguments = models.TextField(default='{}')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    lease_expires = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=CHARFIELD_MAX_LENGTH, blank=True)
+    progress = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    # the result of a finished job, or the last error of a failed attempt
+    message = models.TextField(blank=True)
+    created = models.DateTimeField(default=timezone.now, editable=False)
+    finished = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        index_together = [['status', 'run_after'], ['owner', 'status']]
+    
+    def __unicode__(self):
+        return u"%s %s" % (self.kind, self.get_status_display().lower())
+    
+    @property
+    def is_active(self):
+        return self.status in (self.QUEUED, self.RUNNING)
+    
+    @property
+    def percent_done(self):
+        if self.status == self.DONE:
+            return 100
+        if not self.progress_total:
+            return 0
+        return min(100, 100 * self.progress // self.progress_total)
+
+
+
+class LedgerVersion(models.Model):
+    """
+    The version of a user's ledger that their cached pages are keyed on (see
+    shared.cache). It is kept in the database rather than in the cache, so
+    that writes made by other processes, such as the run_jobs worker and
+    management commands, make the pages cached by every web process stale.
+    """
+    user = models.OneToOneField(User, primary_key=True, related_name='+')
+    version = models.BigIntegerField()
+    
+    def __unicode__(self):
+        return u"%s: %s" % (self.user_id, self.version)
+
+
+# connect the receivers that keep running balances current, and the ones
+# that configure database connections
+from shared import signals, sqlite
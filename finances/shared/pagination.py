@@ -0,0 +1,135 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+"""
+Keyset (cursor) pagination over transaction querysets.
+
+Rows are ordered newest first by (date, id), and a page is fetched by
+filtering on the (date, id) of the last row the client saw rather than by
+OFFSET, so every page is a bounded range scan on the (account, date, id)
+index no matter how far back it is.
+"""
+
+from datetime import datetime
+
+from django.db.models import Q
+
+PAGE_SIZE = 50
+
+
+def encode_cursor(obj, date_field='date'):
+    """
+    Returns the cursor for a row, as 'YYYY-MM-DD.id'.
+    """
+    return '%s.%d' % (getattr(obj, date_field).isoformat(), obj.pk)
+
+
+def decode_cursor(value):
+    """
+    Returns the (date, id) tuple for a cursor, or None if value is empty or
+    not a valid cursor.
+    """
+    try:
+        day, pk = value.split('.')
+        return datetime.strptime(day, '%Y-%m-%d').date(), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def keyset_filter(queryset, cursor, older=True, date_field='date'):
+    """
+    Returns queryset restricted to the rows strictly older (or newer) than
+    cursor, ordered newest first (or oldest first).
+    """
+    day, pk = cursor
+    if older:
+        queryset = queryset.filter(Q(**{date_field + '__lt': day}) |
+                                   Q(**{date_field: day, 'pk__lt': pk}))
+        return queryset.order_by('-' + date_field, '-pk')
+    queryset = queryset.filter(Q(**{date_field + '__gt': day}) |
+                               Q(**{date_field: day, 'pk__gt': pk}))
+    return queryset.order_by(date_field, 'pk')
+
+
+class KeysetPage(object):
+    """
+    One page of rows ordered newest first, with the cursors needed to link
+    to the next older and newer pages.
+    """
+    
+    def __init__(self, object_list, has_older, has_newer, date_field='date'):
+        self.object_list = object_list
+        self.has_older = has_older
+        self.has_newer = has_newer
+        self.date_field = date_field
+    
+    def __iter__(self):
+        return iter(self.object_list)
+    
+    def __len__(self):
+        return len(self.object_list)
+    
+    @property
+    def older_cursor(self):
+        if self.has_older and self.object_list:
+            return encode_cursor(self.object_list[-1], self.date_field)
+        return None
+    
+    @property
+    def newer_cursor(self):
+        if self.has_newer and self.object_list:
+            return encode_cursor(self.object_list[0], self.date_field)
+        return None
+
+
+def keyset_page(queryset, before=None, after=None, page_size=PAGE_SIZE, date_field='date'):
+    """
+    Returns the KeysetPage of queryset just older than the cursor string
+    before, or just newer than the cursor string after. With neither,
+    returns the newest page.
+    """
+    before = decode_cursor(before)
+    after = decode_cursor(after)
+    
+    if after is not None:
+        rows = list(keyset_filter(queryset, after, older=False,
+                                  date_field=date_field)[:page_size + 1])
+        has_newer = len(rows) > page_size
+        rows = rows[:page_size]
+        rows.reverse()
+        return KeysetPage(rows, True, has_newer, date_field)
+    
+    if before is not None:
+        queryset = keyset_filter(queryset, before, older=True, date_field=date_field)
+    else:
+        queryset = queryset.order_by('-' + date_field, '-pk')
+    rows = list(queryset[:page_size + 1])
+    return KeysetPage(rows[:page_size], len(rows) > page_size, before is not None, date_field)
+
+
+def keyset_chunks(queryset, chunk_size=500, date_field='date'):
+    """
+    Yields every row of queryset oldest first, as lists of at most
+    chunk_size rows. Each chunk is a separate keyset query, so only one
+    chunk is held in memory at a time.
+    """
+    chunk = list(queryset.order_by(date_field, 'pk')[:chunk_size])
+    while chunk:
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1]
+        chunk = list(keyset_filter(queryset, (getattr(last, date_field), last.pk),
+                                   older=False, date_field=date_field)[:chunk_size])
@@ -0,0 +1,247 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+Request instrumentation cheap enough to leave on in production.
+
+RequestStatsMiddleware logs one JSON object per request to the
+'shared.request_stats' logger (see REQUEST_STATS_LOG in the settings),
+with the view name, response status, total latency, the number of SQL
+queries and the time spent in them, and the time spent rendering the
+template of a TemplateResponse. It also records the SQL statement run most
+often in the request, which is how N+1 query patterns show up. The
+request_stats command reads the log back and reports the slowest views and
+the worst repeated queries.
+
+Django has no hook around query execution, so for the length of each
+request the middleware has every connection wrap its cursors in
+_StatsCursor, which only counts and times statements. If the connection
+would otherwise have used a debug cursor (with DEBUG on, say), that cursor
+is kept underneath so connection.queries is still filled in.
+"""
+
+import json
+import logging
+import time
+from collections import defaultdict
+from timeit import default_timer
+
+import numpy
+from django.conf import settings
+from django.db import connections
+from django.db.backends import util
+
+logger = logging.getLogger(__name__)
+
+# longest SQL statement kept in a record
+SQL_SAMPLE_LENGTH = 300
+
+
+class _StatsCursor(object):
+    def __init__(self, cursor, stats):
+        self.cursor = cursor
+        self.stats = stats
+    
+    def execute(self, sql, params=()):
+        started = default_timer()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.stats.add_query(sql, default_timer() - started)
+    
+    def executemany(self, sql, param_list):
+        started = default_timer()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.stats.add_query(sql, default_timer() - started)
+    
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+    
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+class RequestStats(object):
+    """
+    The figures collected for one request.
+    """
+    
+    def __init__(self):
+        self.started = default_timer()
+        self.view = None
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.render_started = None
+        self.template_seconds = 0.0
+        self.statements = defaultdict(int)
+        self._connections = []
+    
+    def add_query(self, sql, seconds):
+        self.queries += 1
+        self.sql_seconds += seconds
+        self.statements[sql] += 1
+    
+    def rendered(self, response):
+        self.template_seconds += default_timer() - self.render_started
+    
+    def install(self):
+        for connection in connections.all():
+            debug = connection.use_debug_cursor or (connection.use_debug_cursor is None
+                                                    and settings.DEBUG)
+            self._connections.append((connection, connection.use_debug_cursor,
+                                      connection.__dict__.get('make_debug_cursor')))
+            connection.make_debug_cursor = self._cursor_factory(connection, debug)
+            connection.use_debug_cursor = True
+    
+    def _cursor_factory(self, connection, debug):
+        make_debug_cursor = type(connection).make_debug_cursor
+        
+        def make_cursor(cursor):
+            if debug:
+                cursor = make_debug_cursor(connection, cursor)
+            else:
+                cursor = util.CursorWrapper(cursor, connection)
+            return _StatsCursor(cursor, self)
+        return make_cursor
+    
+    def uninstall(self):
+        for connection, use_debug_cursor, make_debug_cursor in self._connections:
+            connection.use_debug_cursor = use_debug_cursor
+            if make_debug_cursor is None:
+                del connection.make_debug_cursor
+            else:
+                connection.make_debug_cursor = make_debug_cursor
+        self._connections = []
+    
+    def record(self, request, response):
+        record = {
+            'time': round(time.time(), 3),
+            'view': self.view,
+            'method': request.method,
+            'status': response.status_code,
+            'total_ms': round((default_timer() - self.started) * 1000, 2),
+            'sql_ms': round(self.sql_seconds * 1000, 2),
+            'template_ms': round(self.template_seconds * 1000, 2),
+            'queries': self.queries,
+        }
+        if self.statements:
+            sql, count = max(self.statements.items(), key=lambda item: item[1])
+            if count > 1:
+                record['repeated'] = count
+                record['repeated_sql'] = sql[:SQL_SAMPLE_LENGTH]
+        return record
+
+
+class RequestStatsMiddleware(object):
+    """
+    Logs a RequestStats record for every request, at INFO level. Nothing is
+    collected while the logger is disabled. Should be the first middleware,
+    so the latency includes every other middleware.
+    """
+    
+    def process_request(self, request):
+        if logger.isEnabledFor(logging.INFO):
+            request._stats = RequestStats()
+            request._stats.install()
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = getattr(request, '_stats', None)
+        if stats is not None:
+            match = getattr(request, 'resolver_match', None)
+            if match is not None and match.url_name:
+                stats.view = match.view_name
+            else:
+                stats.view = '%s.%s' % (view_func.__module__, getattr(view_func, '__name__',
+                                                                       type(view_func).__name__))
+    
+    def process_template_response(self, request, response):
+        stats = getattr(request, '_stats', None)
+        if stats is not None:
+            stats.render_started = default_timer()
+            response.add_post_render_callback(stats.rendered)
+        return response
+    
+    def process_response(self, request, response):
+        stats = getattr(request, '_stats', None)
+        if stats is not None:
+            stats.uninstall()
+            logger.info(json.dumps(stats.record(request, response), sort_keys=True))
+            del request._stats
+        return response
+
+
+def read_records(paths):
+    """
+    Yields the records logged by RequestStatsMiddleware in the given files,
+    skipping lines that are not records.
+    """
+    for path in paths:
+        with open(path) as records:
+            for line in records:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and 'total_ms' in record:
+                    yield record
+
+
+def endpoint_summaries(records):
+    """
+    Returns a dict per view of its request count, total latency percentiles
+    and mean query count, SQL time and template time, slowest (by 95th
+    percentile latency) first.
+    """
+    by_view = defaultdict(lambda: defaultdict(list))
+    for record in records:
+        figures = by_view[record.get('view') or '(unresolved)']
+        for name in ('total_ms', 'sql_ms', 'template_ms', 'queries'):
+            figures[name].append(record.get(name, 0))
+    
+    summaries = []
+    for view, figures in by_view.items():
+        total = numpy.array(figures['total_ms'], dtype='float64')
+        summaries.append({
+            'view': view,
+            'requests': len(total),
+            'p50_ms': float(numpy.percentile(total, 50)),
+            'p95_ms': float(numpy.percentile(total, 95)),
+            'max_ms': float(total.max()),
+            'queries': float(numpy.mean(figures['queries'])),
+            'sql_ms': float(numpy.mean(figures['sql_ms'])),
+            'template_ms': float(numpy.mean(figures['template_ms'])),
+        })
+    summaries.sort(key=lambda summary: (-summary['p95_ms'], summary['view']))
+    return summaries
+
+
+def repeated_queries(records, min_repeats=5):
+    """
+    Returns a dict per (view, statement) run at least min_repeats times in
+    one request, giving the most times it was run in a request and how many
+    requests ran it that often, worst first.
+    """
+    offenders = {}
+    for record in records:
+        if record.get('repeated', 0) < min_repeats:
+            continue
+        key = (record.get('view') or '(unresolved)', record['repeated_sql'])
+        offender = offenders.setdefault(key, {'view': key[0], 'sql': key[1], 'repeats': 0,
+                                              'requests': 0})
+        offender['repeats'] = max(offender['repeats'], record['repeated'])
+        offender['requests'] += 1
+    return sorted(offenders.values(), key=lambda offender: (-offender['repeats'],
+                                                           -offender['requests'], offender['view']))
@@ -0,0 +1,127 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+Routing of reads to replica databases.
+
+GET and HEAD requests read from one of the aliases in
+settings.DATABASE_REPLICAS, picked at random per request: the replicas are
+copied one after the other, so each holds its own snapshot, and one page
+must not mix them. The related objects of an instance are read from the
+database the instance came from. Every write, and every read outside such
+a request (the run_jobs worker, management commands), goes to the
+primary, DEFAULT_DB_ALIAS.
+
+Replicas lag behind the primary, so a user must not read from them right
+after writing: once a request has written (or used a method other than
+GET and HEAD), its remaining reads go to the primary, and the response
+sets a cookie that keeps the browser's reads on the primary for
+settings.REPLICA_PIN_SECONDS. Code that writes what it has just read must
+read inside primary_reads(), and views whose output is cached must read
+after primary_for_request().
+"""
+
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS
+from django.dispatch import receiver
+
+PIN_COOKIE = 'read_primary'
+
+READ_METHODS = ('GET', 'HEAD')
+
+_state = threading.local()
+
+
+def _replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+def _reset():
+    _state.replica = None
+    _state.wrote = False
+    _state.primary_reads = 0
+
+
+@contextmanager
+def primary_reads():
+    """
+    Sends the reads in the block to the primary, for code that writes
+    figures derived from what it reads, such as balance checkpoints.
+    """
+    _state.primary_reads = getattr(_state, 'primary_reads', 0) + 1
+    try:
+        yield
+    finally:
+        _state.primary_reads -= 1
+
+
+def primary_for_request():
+    """
+    Sends the remaining reads of the current request to the primary, for
+    views whose output outlives the request, such as cached pages. Unlike a
+    write, this does not pin the client to the primary.
+    """
+    _state.replica = None
+
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        replica = getattr(_state, 'replica', None)
+        if replica is None or _state.wrote or _state.primary_reads:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db is not None:
+            return instance._state.db
+        return replica
+    
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        # every alias holds the same data
+        return True
+    
+    def allow_syncdb(self, db, model):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinningMiddleware(object):
+    """
+    Lets a GET or HEAD request read from the replicas unless the client
+    wrote within the last REPLICA_PIN_SECONDS, and sets the cookie that
+    says so on any response to a request that wrote.
+    """
+    
+    def process_request(self, request):
+        _reset()
+        replicas = _replicas()
+        if replicas and request.method in READ_METHODS and PIN_COOKIE not in request.COOKIES:
+            _state.replica = random.choice(replicas)
+    
+    def process_response(self, request, response):
+        if _replicas() and (getattr(_state, 'wrote', False) or request.method not in READ_METHODS):
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True)
+        return response
+
+
+@receiver(request_finished)
+def end_replica_reads(sender, **kwargs):
+    # a streamed response reads until it is closed, which sends this
+    _reset()
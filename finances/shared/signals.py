@@ -0,0 +1,248 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+"""
+Signal receivers that keep RealAcct and VirtualAcct running balances and
+balance checkpoints in step with their transactions as they are created,
+edited and deleted, along with the RealAcct change counts and the monthly
+CategoryMonthTotal rollups of RealTxn values, and that bump the owner's
+ledger version (see shared.cache) on any write that changes what their
+pages show.
+
+Transactions in a closed Budget period (see budgets.closing) are frozen:
+writing a transaction dated in one, or changing or deleting one closed
+with it, raises ClosedPeriodError before anything is written.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db.models import F, Q
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from shared.cache import bump_ledger_version
+from shared.controllers import local_date
+from shared.ledger import (
+    adjust_balances,
+    adjust_rollups,
+    balance_deltas,
+    bump_change_counts,
+    checkpoint_deltas,
+    rollup_deltas,
+    shift_checkpoints,
+)
+from shared.models import (
+    ClosedPeriodError,
+    Budget,
+    Category,
+    RealAcct,
+    VirtualAcct,
+    RealTxn,
+    VirtualTxn,
+    RealAcctCheckpoint,
+    VirtualAcctCheckpoint,
+    CategoryMonthTotal,
+)
+
+# transaction model -> (account foreign key, date lookup, account model, checkpoint model)
+LEDGER_FIELDS = {
+    RealTxn: ('real_account', 'date', RealAcct, RealAcctCheckpoint),
+    VirtualTxn: ('virtual_acct', 'date', VirtualAcct, VirtualAcctCheckpoint),
+}
+
+
+def _saved_state(sender, instance):
+    """
+    Returns the (account pk, date, value) tuple currently stored for
+    instance, or None if it has not been saved yet. For a RealTxn the
+    owner and category pks are read along with it and remembered as its
+    rollup state. Raises ClosedPeriodError if the stored row is closed.
+    """
+    if instance.pk is None:
+        return None
+    fk_name, date_lookup = LEDGER_FIELDS[sender][:2]
+    fields = [fk_name, date_lookup, 'value', 'closed']
+    if sender is RealTxn:
+        fields += ['owner', 'category']
+    rows = list(sender.objects.filter(pk=instance.pk).values_list(*fields)[:1])
+    if not rows:
+        return None
+    if rows[0][3]:
+        raise ClosedPeriodError(u"This %s is in a closed budget period." % sender._meta.object_name)
+    if sender is RealTxn:
+        acct_id, day, value, closed, owner_id, category_id = rows[0]
+        instance._rollup_saved_state = (owner_id, category_id, day, value)
+    return rows[0][:3]
+
+
+def _check_open(sender, instance):
+    """
+    Raises ClosedPeriodError if instance is dated in a closed period of the
+    Budget it counts against.
+    """
+    budgets = Budget.objects.filter(closed_through__gte=local_date(instance.date))
+    if sender is RealTxn:
+        budgets = budgets.filter(category=instance.category_id)
+    else:
+        budgets = budgets.filter(virtualacct=instance.virtual_acct_id)
+    if budgets.exists():
+        raise ClosedPeriodError(u"%s is in a closed budget period." % local_date(instance.date))
+    if sender is RealTxn and instance.pk is not None:
+        _check_splits_open(instance)
+
+
+def _check_splits_open(real_txn):
+    """
+    Raises ClosedPeriodError if saving real_txn would move one of its splits
+    (which are dated with it) that is closed, or that is dated, or would
+    be dated, in a closed period of its own Budget. The splits can count
+    against other budgets than the RealTxn's category's.
+    """
+    day = local_date(real_txn.date)
+    moved = VirtualTxn.objects.filter(real_txn=real_txn.pk).exclude(date=day)
+    if moved.filter(Q(closed=True) | Q(virtual_acct__parent_budget__closed_through__gte=day) |
+                    Q(virtual_acct__parent_budget__closed_through__gte=F('date'))).exists():
+        raise ClosedPeriodError(u"Moving this RealTxn to %s would change a closed budget period." % day)
+
+
+def _rollup_state(instance):
+    return (instance.owner_id, instance.category_id, local_date(instance.date), instance.value)
+
+
+def _current_state(sender, instance):
+    if sender is RealTxn:
+        return (instance.real_account_id, local_date(instance.date), instance.value)
+    return (instance.virtual_acct_id, local_date(instance.date), instance.value)
+
+
+def _apply(sender, instance, old, new):
+    """
+    Applies the change from state old to state new to the database, and to
+    the account instance cached on the transaction (if any) so that it does
+    not read a stale balance. The change count of the RealAccts involved is
+    bumped whether or not their balance changed.
+    """
+    fk_name, _, account_model, checkpoint_model = LEDGER_FIELDS[sender]
+    deltas = balance_deltas(old, new)
+    adjust_balances(account_model, deltas)
+    shift_checkpoints(checkpoint_model, checkpoint_deltas(old, new))
+    
+    account_pks = set(state[0] for state in (old, new) if state is not None)
+    if sender is RealTxn:
+        bump_change_counts(RealAcct.objects.filter(pk__in=account_pks))
+    else:
+        bump_change_counts(RealAcct.objects.filter(virtualacct__in=account_pks))
+    
+    cache_name = sender._meta.get_field(fk_name).get_cache_name()
+    account = getattr(instance, cache_name, None)
+    if account is not None and account.pk in deltas:
+        account.running_balance = account.balance + deltas[account.pk]
+
+
+def _move_splits(real_txn, old_date, new_date):
+    """
+    Moves a RealTxn's splits, and their checkpoint contributions, to its
+    new date when the date of the RealTxn changes. The VirtualAcct balances
+    are unaffected.
+    """
+    deltas = defaultdict(Decimal)
+    for acct_id, value in real_txn.virtualtxn_set.values_list('virtual_acct', 'value'):
+        moved = checkpoint_deltas((acct_id, old_date, value), (acct_id, new_date, value))
+        for key, delta in moved.items():
+            deltas[key] += delta
+    shift_checkpoints(VirtualAcctCheckpoint, deltas)
+    real_txn.virtualtxn_set.update(date=new_date)
+
+
+@receiver(pre_save, sender=RealTxn)
+@receiver(pre_save, sender=VirtualTxn)
+def refuse_closed_period(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _check_open(sender, instance)
+
+
+@receiver(pre_save, sender=RealTxn)
+@receiver(pre_save, sender=VirtualTxn)
+@receiver(pre_delete, sender=RealTxn)
+@receiver(pre_delete, sender=VirtualTxn)
+def remember_saved_state(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance._ledger_saved_state = _saved_state(sender, instance)
+
+
+@receiver(post_save, sender=RealTxn)
+@receiver(post_save, sender=VirtualTxn)
+def apply_saved_txn(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = instance.__dict__.pop('_ledger_saved_state', None)
+    new = _current_state(sender, instance)
+    _apply(sender, instance, old, new)
+    if sender is RealTxn and old is not None and old[1] != new[1]:
+        _move_splits(instance, old[1], new[1])
+
+
+@receiver(post_delete, sender=RealTxn)
+@receiver(post_delete, sender=VirtualTxn)
+def apply_deleted_txn(sender, instance, **kwargs):
+    old = instance.__dict__.pop('_ledger_saved_state', None)
+    if old is None:
+        old = _current_state(sender, instance)
+    _apply(sender, instance, old, None)
+
+
+@receiver(post_save, sender=RealTxn)
+def apply_saved_rollup(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = instance.__dict__.pop('_rollup_saved_state', None)
+    adjust_rollups(CategoryMonthTotal, rollup_deltas(old, _rollup_state(instance)))
+
+
+@receiver(post_delete, sender=RealTxn)
+def apply_deleted_rollup(sender, instance, **kwargs):
+    old = instance.__dict__.pop('_rollup_saved_state', None)
+    if old is None:
+        old = _rollup_state(instance)
+    adjust_rollups(CategoryMonthTotal, rollup_deltas(old, None))
+
+
+
+# Connected last, so that in autocommit mode the version is bumped after the
+# balance updates above are written.
+@receiver(post_save, sender=RealTxn)
+@receiver(post_save, sender=VirtualTxn)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Budget)
+@receiver(post_save, sender=RealAcct)
+@receiver(post_delete, sender=RealTxn)
+@receiver(post_delete, sender=VirtualTxn)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Budget)
+@receiver(post_delete, sender=RealAcct)
+def bump_owner_ledger_version(sender, instance, **kwargs):
+    bump_ledger_version(instance.owner_id)
+
+
+@receiver(post_save, sender=User)
+def bump_new_user_ledger_version(sender, instance, created=False, raw=False, **kwargs):
+    # user pks can be reused (e.g. between test cases), so a new user must
+    # never see a version that pages of a previous user were cached under
+    if created and not raw:
+        bump_ledger_version(instance.pk)
@@ -0,0 +1,80 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+Production configuration of database connections.
+
+Every new SQLite connection runs the PRAGMA statements in
+settings.SQLITE_PRAGMAS. The profile in settings puts the database in WAL
+mode, so that page views read a snapshot while an import is writing,
+instead of waiting on the database lock (see `manage.py
+benchmark_concurrency`). Replicas (settings.DATABASE_REPLICAS) keep their
+journal mode: sync_replicas replaces their files whole, which would strand
+a -wal file written for the old copy.
+
+Django 1.5 closes every connection at the end of each request. Here a
+connection is instead kept for the next request until it is older than
+the CONN_MAX_AGE of its database, in seconds (None: no limit; 0, the
+default: closed after every request), like CONN_MAX_AGE in later Django
+versions.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DatabaseError, close_connection, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    connection.opened_at = time.time()
+    if connection.vendor != 'sqlite':
+        return
+    replica = connection.alias in getattr(settings, 'DATABASE_REPLICAS', ())
+    for name, value in getattr(settings, 'SQLITE_PRAGMAS', ()):
+        if not (replica and name == 'journal_mode'):
+            # on the sqlite3 connection itself, so that the statements are
+            # not counted among the queries of whatever opened it
+            connection.connection.execute('PRAGMA %s = %s' % (name, value))
+
+
+def release_connection(connection):
+    """
+    Ends a request's use of connection: rolls back whatever it left
+    uncommitted, then keeps the connection open for the next request, or
+    closes it if it is older than CONN_MAX_AGE. A connection in a
+    transaction managed by its caller (e.g. a TestCase) is left alone.
+    """
+    if connection.connection is None or connection.is_managed():
+        return
+    max_age = connection.settings_dict.get('CONN_MAX_AGE', 0)
+    if max_age is not None and time.time() >= getattr(connection, 'opened_at', 0) + max_age:
+        connection.close()
+        return
+    try:
+        connection._rollback()
+    except DatabaseError:
+        connection.close()
+
+
+def release_connections(**kwargs):
+    for alias in connections:
+        release_connection(connections[alias])
+
+
+request_finished.disconnect(close_connection)
+request_finished.connect(release_connections)
@@ -0,0 +1,161 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+Generates synthetic ledgers for benchmarking (see shared.benchmark and the
+generate_ledgers command).
+
+Each user gets RealAccts, Budgets of mixed period lengths and Categories
+spread over those budgets. Every budget is tied to one RealAcct, so that
+the default split of each RealTxn lands on a VirtualAcct of its own
+account. Transactions are mostly small purchases with the occasional
+income, dated over the given number of days up to today, and are written
+through accounts.importers.import_statement a chunk at a time, so balances,
+checkpoints, category totals and VirtualTxn splits are all kept current
+and memory use does not grow with the size of the ledger.
+"""
+
+import random
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+
+from shared.controllers import WEEK_PERIOD, MONTH_PERIOD, YEAR_PERIOD, local_date
+from shared.models import CENTS, Budget, Category, RealAcct
+
+from accounts.importers import DEFAULT_BATCH_SIZE, import_statement
+
+DEFAULT_PREFIX = 'bench'
+DEFAULT_PASSWORD = 'bench'
+DEFAULT_CHUNK_SIZE = 10000
+
+# monthly budgets are the common case
+PERIOD_LENGTHS = (MONTH_PERIOD,) * 6 + (WEEK_PERIOD,) * 3 + (YEAR_PERIOD,)
+
+CATEGORY_NAMES = ('income', 'groceries', 'rent', 'utilities', 'transit', 'dining',
+                  'clothing', 'health', 'gifts', 'travel', 'books', 'insurance')
+
+# share of transactions that are income, in the first category
+INCOME_SHARE = 0.05
+
+
+class GeneratedLedgers(object):
+    """
+    Counts of the rows written by generate_ledgers().
+    """
+    
+    def __init__(self):
+        self.usernames = []
+        self.realacct_count = 0
+        self.budget_count = 0
+        self.category_count = 0
+        self.realtxn_count = 0
+        self.virtualtxn_count = 0
+    
+    def __unicode__(self):
+        return (u"Generated %d users with %d RealAccts, %d Budgets, %d Categories, "
+                u"%d RealTxns and %d VirtualTxns"
+                % (len(self.usernames), self.realacct_count, self.budget_count,
+                   self.category_count, self.realtxn_count, self.virtualtxn_count))
+
+
+def _value(rng, income):
+    if income:
+        value = rng.uniform(500, 3000)
+    else:
+        value = -min(rng.lognormvariate(3, 1), 5000)
+    return Decimal(str(value)).quantize(CENTS)
+
+
+def _weighted_choice(rng, choices, weights):
+    point = rng.uniform(0, sum(weights))
+    for choice, weight in zip(choices, weights):
+        point -= weight
+        if point <= 0:
+            return choice
+    return choices[-1]
+
+
+def _generate_user(username, password, accounts, budgets, categories, txns, days,
+                   rng, chunk_size, batch_size, result):
+    user = User.objects.create(username=username, email='%s@example.com' % username,
+                               password=password)
+    realaccts = [RealAcct.objects.create(owner=user, name='account %d' % (n + 1))
+                 for n in range(accounts)]
+    budget_rows = [Budget.objects.create(owner=user, name='budget %d' % (n + 1),
+                                         period_length=rng.choice(PERIOD_LENGTHS),
+                                         period_budget_amount=rng.randrange(50, 2000))
+                   for n in range(budgets)]
+    category_rows = []
+    for n in range(categories):
+        name = CATEGORY_NAMES[n % len(CATEGORY_NAMES)]
+        if n >= len(CATEGORY_NAMES):
+            name = '%s %d' % (name, n // len(CATEGORY_NAMES) + 1)
+        budget = budget_rows[n % budgets]
+        category_rows.append(Category.objects.create(owner=user, name=name, budget=budget))
+    # each budget is spent from one account
+    account_for = dict((budget.pk, realaccts[n % accounts]) for n, budget in enumerate(budget_rows))
+    weights = [rng.paretovariate(1.5) for _ in category_rows[1:]]
+    
+    today = local_date()
+    remaining = txns
+    while remaining:
+        count = min(chunk_size, remaining)
+        remaining -= count
+        entries = defaultdict(list)
+        for _ in range(count):
+            income = rng.random() < INCOME_SHARE or len(category_rows) == 1
+            if income:
+                category = category_rows[0]
+            else:
+                category = _weighted_choice(rng, category_rows[1:], weights)
+            day = today - timedelta(days=rng.randrange(days))
+            entries[category].append((day, _value(rng, income)))
+        for category, category_entries in entries.items():
+            category_entries.sort()
+            imported = import_statement(account_for[category.budget_id], category,
+                                        category_entries, batch_size)
+            result.realtxn_count += imported.realtxn_count
+            result.virtualtxn_count += imported.virtualtxn_count
+    
+    result.usernames.append(username)
+    result.realacct_count += len(realaccts)
+    result.budget_count += len(budget_rows)
+    result.category_count += len(category_rows)
+
+
+def generate_ledgers(users, accounts=2, budgets=5, categories=12, txns=1000, days=730,
+                     prefix=DEFAULT_PREFIX, password=DEFAULT_PASSWORD, seed=None,
+                     chunk_size=DEFAULT_CHUNK_SIZE, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Creates users named prefix1, prefix2, ... with the given password, each
+    with the given numbers of RealAccts, Budgets, Categories and RealTxns,
+    and returns a GeneratedLedgers. The same seed generates the same
+    ledgers. Each chunk of a user's transactions is imported in its own
+    database transaction; progress, if given, is called with each username
+    once that user's ledger is written.
+    """
+    rng = random.Random(seed)
+    password = make_password(password)
+    result = GeneratedLedgers()
+    for n in range(users):
+        username = '%s%d' % (prefix, n + 1)
+        _generate_user(username, password, accounts, budgets, categories, txns, days,
+                       rng, chunk_size, batch_size, result)
+        if progress is not None:
+            progress(username)
+    return result
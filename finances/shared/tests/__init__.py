@@ -13,4 +13,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-from models import *
\ No newline at end of file
+from models import *
+from pagination_tests import PaginationTests
+from cache_tests import CacheBackendTests, LedgerVersionTests
+from template_tests import CompiledTemplateTests
+from integrity_tests import LedgerIntegrityTests
+from benchmark_tests import BenchmarkTests
+from request_stats_tests import RequestStatsTests
+from job_tests import JobQueueTests
+from router_tests import ReplicaRouterTests
+from sqlite_tests import SQLiteProfileTests, ConcurrencyBenchmarkTests
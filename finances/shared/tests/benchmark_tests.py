@@ -0,0 +1,67 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+from django.test import TestCase
+from django.contrib.auth.models import User
+from shared.benchmark import run_benchmark, regressions
+from shared.integrity import check_ledger
+from shared.models import Budget, Category, RealAcct, RealTxn, VirtualTxn
+from shared.synthetic import generate_ledgers
+
+
+class BenchmarkTests(TestCase):
+    """
+    Tests the synthetic ledger generator and the benchmark harness on a
+    small ledger.
+    """
+    
+    def setUp(self):
+        self.result = generate_ledgers(2, accounts = 2, budgets = 3, categories = 4, txns = 60,
+                                       days = 90, prefix = 'bench', password = 'secret', seed = 1,
+                                       chunk_size = 25)
+        self.users = list(User.objects.filter(username__startswith = 'bench').order_by('username'))
+    
+    def test_generate(self):
+        self.assertEqual(self.result.usernames, ['bench1', 'bench2'])
+        self.assertEqual([user.username for user in self.users], ['bench1', 'bench2'])
+        user = self.users[0]
+        self.assertEqual(RealAcct.objects.filter(owner = user).count(), 2)
+        self.assertEqual(Budget.objects.filter(owner = user).count(), 3)
+        self.assertEqual(Category.objects.filter(owner = user).count(), 4)
+        self.assertEqual(RealTxn.objects.filter(owner = user).count(), 60)
+        # every transaction is split to the budget of its category
+        self.assertEqual(VirtualTxn.objects.filter(owner = user).count(), 60)
+        self.assertEqual(self.result.virtualtxn_count, 120)
+        self.assertEqual(check_ledger(user.pk).violations, [])
+    
+    def test_benchmark(self):
+        results = run_benchmark(self.users, 'secret', iterations = 2, warmup = 1,
+                                only = ['dashboard', 'create-budget', 'balances'])
+        self.assertEqual(sorted(results['cases']), ['balances', 'create-budget', 'dashboard'])
+        self.assertEqual(results['errors'], {})
+        dashboard = results['cases']['dashboard']
+        self.assertEqual(dashboard['samples'], 4)
+        assert(dashboard['p50_ms'] <= dashboard['p99_ms'] <= dashboard['max_ms'])
+        assert(dashboard['queries_max'] > 0)
+        # the budgets created by the create-budget case are removed again
+        self.assertEqual(Budget.objects.filter(owner = self.users[0]).count(), 3)
+        
+        warm = run_benchmark(self.users[:1], 'secret', iterations = 2, warm = True, only = ['dashboard'])
+        self.assertEqual(warm['cases']['dashboard']['queries_max'], 1)
+        
+        self.assertEqual(regressions(results, results), [])
+        slower = {'cases': {'dashboard': dict(dashboard, p50_ms = dashboard['p50_ms'] * 2,
+                                              queries_max = dashboard['queries_max'] + 1)},
+                  'errors': {'balances': 'FieldError'}}
+        self.assertEqual(len(regressions(slower, results)), 3)
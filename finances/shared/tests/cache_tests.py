@@ -0,0 +1,100 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+import shutil
+import tempfile
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache, get_cache
+from django.db.models import F
+from shared.cache import ledger_version, ledger_cache_key
+from shared.controllers import MONTH_PERIOD
+from shared.models import Budget, Category, LedgerVersion, RealAcct, RealTxn
+
+
+class CacheBackendTests(TestCase):
+    """
+    Tests LRU eviction and hit/miss counts of the locmem and file based
+    backends.
+    """
+    
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors = True)
+    
+    def assert_lru(self, cache):
+        cache.clear()
+        cache.reset_stats()
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key.upper())
+        self.assertEqual(cache.get('a'), 'A')
+        cache.set('d', 'D')
+        
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual([cache.get(key) for key in ('a', 'c', 'd')], ['A', 'C', 'D'])
+        self.assertEqual(cache.stats(), {'hits': 4, 'misses': 1})
+    
+    def test_locmem(self):
+        cache = get_cache('shared.cache.backends.LRULocMemCache', LOCATION = 'lru-test',
+                          OPTIONS = {'MAX_ENTRIES': 3})
+        self.assert_lru(cache)
+        cache.set('n', 1)
+        self.assertEqual(cache.incr('n'), 2)
+        self.assertEqual(cache.get('n'), 2)
+    
+    def test_file(self):
+        cache = get_cache('shared.cache.backends.LRUFileBasedCache', LOCATION = self.dir,
+                          OPTIONS = {'MAX_ENTRIES': 3})
+        self.assert_lru(cache)
+
+
+class LedgerVersionTests(TestCase):
+    """
+    Tests that writes to a user's ledger bump only that user's version.
+    """
+    
+    def setUp(self):
+        self.user = User.objects.create(username = 'testuser', email = 'email@domain.tld')
+        self.other = User.objects.create(username = 'otheruser', email = 'other@domain.tld')
+        budget = Budget.objects.create(owner = self.user, period_budget_amount = '100.00',
+                                       period_length = MONTH_PERIOD)
+        self.category = Category.objects.create(owner = self.user, name = 'food', budget = budget)
+        self.acct = RealAcct.objects.create(owner = self.user)
+    
+    def test_bump(self):
+        version = ledger_version(self.user.pk)
+        other_version = ledger_version(self.other.pk)
+        key = ledger_cache_key(self.user.pk, '/accounts/index/')
+        self.assertEqual(key, ledger_cache_key(self.user.pk, '/accounts/index/'))
+        
+        txn = RealTxn.objects.create(owner = self.user, value = '-5.00', category = self.category,
+                                     real_account = self.acct)
+        self.assertNotEqual(ledger_version(self.user.pk), version)
+        self.assertNotEqual(ledger_cache_key(self.user.pk, '/accounts/index/'), key)
+        
+        version = ledger_version(self.user.pk)
+        txn.delete()
+        self.assertNotEqual(ledger_version(self.user.pk), version)
+        self.assertEqual(ledger_version(self.other.pk), other_version)
+    
+    def test_shared_between_processes(self):
+        version = ledger_version(self.user.pk)
+        # the version is not kept in this process's cache
+        cache.clear()
+        self.assertEqual(ledger_version(self.user.pk), version)
+        # a bump by another process, such as the run_jobs worker, is seen here
+        LedgerVersion.objects.filter(user = self.user).update(version = F('version') + 1)
+        self.assertEqual(ledger_version(self.user.pk), version + 1)
@@ -0,0 +1,93 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+from datetime import date
+from decimal import Decimal
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from shared.integrity import check_ledger
+from shared.models import (Budget, Category, RealAcct, VirtualAcct, RealTxn, VirtualTxn,
+                           RealAcctCheckpoint, CategoryMonthTotal)
+
+from accounts.allocation import allocate
+
+
+class LedgerIntegrityTests(TestCase):
+    """
+    Tests that the ledger checker finds broken splits and wrong stored
+    figures, and that rebuilding puts the stored figures right.
+    """
+    
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'email@domain.tld', 'pass')
+        self.budget = Budget.objects.create(owner = self.user, name = 'food',
+                                            period_budget_amount = '100.00')
+        self.category = Category.objects.create(owner = self.user, name = 'groceries',
+                                                budget = self.budget)
+        self.acct = RealAcct.objects.create(owner = self.user, name = 'chequing')
+        self.other = RealAcct.objects.create(owner = self.user, name = 'savings')
+        self.txns = [RealTxn.objects.create(owner = self.user, value = value, category = self.category,
+                                            real_account = self.acct, date = day)
+                     for day, value in ((date(2013, 1, 5), '-20.00'),
+                                        (date(2013, 2, 10), '-5.50'),
+                                        (date(2013, 3, 15), '100.00'))]
+        allocate(self.txns)
+        self.acct.checkpoint_for(date(2013, 3, 20))
+    
+    def kinds(self, report):
+        return sorted(violation.kind for violation in report.violations)
+    
+    def test_clean_ledger(self):
+        report = check_ledger(self.user.pk, chunk_size = 2)
+        self.assertEqual(report.violations, [])
+        self.assertEqual((report.realtxn_count, report.unsplit_count), (3, 0))
+        assert(RealAcctCheckpoint.objects.filter(acct = self.acct).exists())
+    
+    def test_broken_splits(self):
+        split = VirtualTxn.objects.get(real_txn = self.txns[0])
+        split.value = '-19.00'
+        split.save()
+        rent = Budget.objects.create(owner = self.user, name = 'rent', period_budget_amount = '50.00')
+        VirtualTxn.objects.filter(real_txn = self.txns[1]).update(
+            virtual_acct = VirtualAcct.objects.create(owner = self.user, parent_budget = rent,
+                                                      real_acct = self.other,
+                                                      period_start = rent.current_period_start_date))
+        report = check_ledger(self.user.pk, chunk_size = 2)
+        self.assertEqual(self.kinds(report), ['split-account', 'split-sum',
+                                              'virtualacct-balance', 'virtualacct-balance'])
+        self.assertEqual(report.violations[1].subject, self.txns[0].pk)
+        
+        with self.assertRaises(CommandError):
+            call_command('check_ledger', processes = 1, verbosity = 0)
+    
+    def test_rebuild(self):
+        RealAcct.objects.filter(pk = self.acct.pk).update(running_balance = '1.00')
+        VirtualTxn.objects.filter(real_txn = self.txns[2]).update(date = date(2013, 1, 1))
+        RealAcctCheckpoint.objects.filter(acct = self.acct).update(balance = '2.00')
+        CategoryMonthTotal.objects.filter(owner = self.user, month = date(2013, 2, 1)).delete()
+        CategoryMonthTotal.objects.filter(owner = self.user, month = date(2013, 3, 1))\
+            .update(total = '3.00')
+        
+        report = check_ledger(self.user.pk)
+        self.assertEqual(self.kinds(report), ['category-month-total', 'category-month-total',
+                                              'realacct-balance', 'realacct-checkpoint',
+                                              'realacct-checkpoint', 'realacct-checkpoint',
+                                              'virtualtxn-date'])
+        
+        call_command('check_ledger', processes = 1, rebuild = True, verbosity = 0)
+        self.assertEqual(check_ledger(self.user.pk).violations, [])
+        self.assertEqual(RealAcct.objects.get(pk = self.acct.pk).balance, Decimal('74.50'))
+        self.assertEqual(self.acct.balance_as_of(date(2013, 3, 1)), Decimal('-25.50'))
@@ -0,0 +1,149 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+import json
+import logging
+from datetime import timedelta
+from StringIO import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import DatabaseError
+from django.test import TestCase
+from django.utils import timezone
+from shared.jobs import JOB_KINDS, claim_job, enqueue, job_kind, report_progress, run_job
+from shared.management.commands import run_jobs
+from shared.models import Job
+
+
+class JobQueueTests(TestCase):
+    """
+    Tests that queued jobs are claimed one per owner at a time, retried
+    when they fail, and shown to their owner.
+    """
+    
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'email@domain.tld', 'pass')
+        self.other = User.objects.create_user('other', 'other@domain.tld', 'pass')
+        self.calls = []
+        
+        @job_kind('test', max_attempts = 2)
+        def test_job(job, fail = False):
+            self.calls.append(job.pk)
+            report_progress(job, 1, 2)
+            if fail:
+                raise ValueError('broken')
+            return u'ok'
+    
+    def tearDown(self):
+        del JOB_KINDS['test']
+    
+    def test_one_job_per_owner(self):
+        first = enqueue(self.user, 'test')
+        second = enqueue(self.user, 'test')
+        theirs = enqueue(self.other, 'test')
+        
+        self.assertEqual(claim_job('a').pk, first.pk)
+        self.assertEqual(claim_job('b').pk, theirs.pk)
+        self.assertEqual(claim_job('c'), None)
+        
+        job = run_job(Job.objects.get(pk = first.pk))
+        self.assertEqual((job.status, job.message, job.progress), (Job.DONE, u'ok', 2))
+        self.assertEqual(claim_job('c').pk, second.pk)
+    
+    def test_expired_lease(self):
+        job = enqueue(self.user, 'test')
+        claim_job('a')
+        Job.objects.filter(pk = job.pk).update(lease_expires = timezone.now() - timedelta(seconds = 1))
+        # the worker holding the job died, so another may take it over
+        job = claim_job('b')
+        self.assertEqual((job.worker, job.attempts), ('b', 2))
+    
+    def test_kind_lease(self):
+        @job_kind('test_long', lease = timedelta(hours = 2))
+        def test_long(job):
+            return u'ok'
+        self.addCleanup(JOB_KINDS.pop, 'test_long')
+        
+        job = enqueue(self.user, 'test_long')
+        job = claim_job('a')
+        # a job that cannot report progress keeps its owner busy for its whole lease
+        assert(job.lease_expires > timezone.now() + timedelta(minutes = 90))
+        Job.objects.filter(pk = job.pk).update(lease_expires = timezone.now() + timedelta(minutes = 30))
+        enqueue(self.user, 'test')
+        self.assertEqual(claim_job('b'), None)
+    
+    def test_retry(self):
+        # keep the tracebacks of the failed attempts out of the test output
+        logger = logging.getLogger('shared.jobs')
+        logger.disabled = True
+        self.addCleanup(setattr, logger, 'disabled', False)
+        job = enqueue(self.user, 'test', fail = True)
+        job = run_job(claim_job('a'))
+        self.assertEqual((job.status, job.attempts, job.message), (Job.QUEUED, 1, 'ValueError: broken'))
+        assert(job.run_after > timezone.now())
+        self.assertEqual(claim_job('a'), None)
+        
+        Job.objects.filter(pk = job.pk).update(run_after = timezone.now())
+        job = run_job(claim_job('a'))
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(self.calls, [job.pk, job.pk])
+    
+    def test_command(self):
+        enqueue(self.user, 'test')
+        enqueue(self.user, 'rebuild_ledger')
+        out = StringIO()
+        call_command('run_jobs', once = True, stdout = out)
+        self.assertEqual(list(Job.objects.values_list('status', flat = True)), [Job.DONE] * 2)
+        assert('rebuild_ledger) for user %d done' % self.user.pk in out.getvalue())
+    
+    def test_command_database_error(self):
+        # keep the traceback of the failed claim out of the test output
+        logger = logging.getLogger(run_jobs.__name__)
+        logger.disabled = True
+        self.addCleanup(setattr, logger, 'disabled', False)
+        # closing the test database's connection would drop the in-memory database
+        closed = []
+        self.addCleanup(setattr, run_jobs, 'close_connections', run_jobs.close_connections)
+        run_jobs.close_connections = lambda: closed.append(True)
+        claims = []
+        def claim_job(worker):
+            claims.append(worker)
+            if len(claims) == 1:
+                raise DatabaseError('database is locked')
+            return None
+        self.addCleanup(setattr, run_jobs, 'claim_job', run_jobs.claim_job)
+        run_jobs.claim_job = claim_job
+        
+        call_command('run_jobs', once = True, poll = 0.01, worker = 'a', stdout = StringIO())
+        self.assertEqual((claims, closed), (['a', 'a'], [True]))
+    
+    def test_views(self):
+        self.client.login(username = 'testuser', password = 'pass')
+        response = self.client.post(reverse('jobs:list'), {'kind': 'allocate'})
+        self.assertEqual(response.status_code, 302)
+        job = Job.objects.get(owner = self.user)
+        self.assertEqual(job.kind, 'allocate')
+        self.assertEqual(self.client.post(reverse('jobs:list'), {'kind': 'test'}).status_code, 400)
+        
+        response = self.client.get(reverse('jobs:list'))
+        self.assertEqual(list(response.context['job_list']), [job])
+        assert(response.context['has_active_jobs'])
+        assert("class='job queued'" in response.content)
+        
+        path = reverse('jobs:detail', args = [job.pk])
+        self.assertEqual(json.loads(self.client.get(path).content)['status'], Job.QUEUED)
+        self.client.login(username = 'other', password = 'pass')
+        self.assertEqual(self.client.get(path).status_code, 404)
@@ -17,4 +17,6 @@ from owned_model_tests import OwnedModelTests
 from budget_tests import BudgetTests
 from period_length_tests import PeriodLengthTests
 from virtual_acct_tests import VirtualAcctTests
-from real_acct_tests import RealAcctTests
\ No newline at end of file
+from real_acct_tests import RealAcctTests
+from checkpoint_tests import CheckpointTests
+from rollup_tests import CategoryMonthTotalTests
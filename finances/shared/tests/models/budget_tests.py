@@ -13,9 +13,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
+from datetime import date
 from django.contrib.auth.models import User
 from django.test import TestCase
-from shared.models import Budget, Year
+from shared.controllers import WEEK_PERIOD, MONTH_PERIOD, YEAR_PERIOD
+from shared.controllers.period_length import YearPeriodController
+from shared.models import Budget, Category, RealAcct, VirtualAcct, RealTxn, VirtualTxn
 
 
 class BudgetTests(TestCase):
@@ -23,19 +26,69 @@ class BudgetTests(TestCase):
     On the Budget model, only current_account() really needs to be tested.
     """
     
+    def setUp(self):
+        self.user = User.objects.create(username = 'testuser', email = 'email@domain.tld')
+        self.acct = RealAcct.objects.create(owner = self.user, name = 'chequing')
+    
     def test_current_account(self):
-        # TODO once I figure out how this should work
-        pass
+        budget = Budget.objects.create(owner = self.user, period_budget_amount = '100.00')
+        assert(budget.current_account is None)
+        
+        old = VirtualAcct.objects.create(owner = self.user, name = 'food', real_acct = self.acct,
+                                         parent_budget = budget, period_start = date(2012, 1, 1))
+        budget = Budget.objects.get(pk = budget.pk)
+        current = budget.current_account
+        self.assertNotEqual(current.pk, old.pk)
+        self.assertEqual(current.period_start, budget.current_period_start_date)
+        self.assertEqual(current.real_acct, self.acct)
+        self.assertEqual(Budget.objects.get(pk = budget.pk).current_account, current)
+    
+    def test_current_for_budgets(self):
+        budgets = []
+        for length in (WEEK_PERIOD, MONTH_PERIOD, YEAR_PERIOD):
+            budget = Budget.objects.create(owner = self.user, period_budget_amount = '1.00',
+                                           period_length = length)
+            VirtualAcct.objects.create(owner = self.user, real_acct = self.acct, parent_budget = budget)
+            budgets.append(budget)
+        
+        with self.assertNumQueries(1):
+            accounts = VirtualAcct.objects.current_for_budgets(budgets)
+        for budget in budgets:
+            self.assertEqual(accounts[budget.pk].period_start, budget.current_period_start_date)
     
     def test_periodlength_inheritance(self):
         """
-        See if having PeriodLength as not abstract will call PeriodLength
-        methods or subclass methods
+        See if setting period_length gives the budget the matching
+        period length controller
         """
-        user = User.objects.create(username = 'testuser', email = 'email@domain.tld')
-        budget = Budget(owner = user, period_budget_amount = '100.00')
-        year = Year.objects.create()
-        budget.period_length = year
+        budget = Budget(owner = self.user, period_budget_amount = '100.00', period_length = YEAR_PERIOD)
         budget.save()
-        length = budget.period_length
-        assert(length.__unicode__() == 'Year PeriodLength')
\ No newline at end of file
+        budget = Budget.objects.get(pk = budget.pk)
+        assert(isinstance(budget.period_length_controller, YearPeriodController))
+    
+    def test_period_transactions(self):
+        budget = Budget.objects.create(owner = self.user, period_budget_amount = '100.00')
+        other = Budget.objects.create(owner = self.user, period_budget_amount = '100.00')
+        food = Category.objects.create(owner = self.user, name = 'food', budget = budget)
+        rent = Category.objects.create(owner = self.user, name = 'rent', budget = other)
+        vacct = VirtualAcct.objects.create(owner = self.user, real_acct = self.acct, parent_budget = budget,
+                                           period_start = date(2013, 2, 1))
+        txns = [RealTxn.objects.create(owner = self.user, value = '-1.00', category = category,
+                                       real_account = self.acct, date = day)
+                for category, day in ((food, date(2013, 1, 31)), (food, date(2013, 2, 1)),
+                                      (rent, date(2013, 2, 10)), (food, date(2013, 2, 28)),
+                                      (food, date(2013, 3, 1)))]
+        for txn in txns:
+            VirtualTxn.objects.create(owner = self.user, value = '-1.00', real_txn = txn, virtual_acct = vacct)
+        
+        self.assertEqual(budget.period_dates(date(2013, 2, 14)), (date(2013, 2, 1), date(2013, 2, 28)))
+        self.assertEqual(sorted(budget.period_transactions(date(2013, 2, 14)).values_list('pk', flat = True)),
+                         [txns[1].pk, txns[3].pk])
+        self.assertEqual(sorted(budget.period_splits(date(2013, 2, 14)).values_list('real_txn', flat = True)),
+                         [txns[1].pk, txns[2].pk, txns[3].pk])
+        assert(not budget.period_transactions().exists())
+        
+        # splits follow the date of their RealTxn
+        txns[0].date = date(2013, 2, 2)
+        txns[0].save()
+        self.assertEqual(budget.period_splits(date(2013, 2, 14)).count(), 4)
@@ -0,0 +1,80 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from datetime import date
+from decimal import Decimal
+from django.test import TestCase
+from django.contrib.auth.models import User
+from shared.controllers import MONTH_PERIOD
+from shared.models import Budget, Category, RealAcct, VirtualAcct,\
+    RealTxn, VirtualTxn, RealAcctCheckpoint, VirtualAcctCheckpoint
+
+
+class CheckpointTests(TestCase):
+    """
+    Tests balance_as_of on RealAcct and VirtualAcct, and that checkpoints
+    follow edits to transactions dated before them.
+    """
+    
+    def setUp(self):
+        self.user = User.objects.create(username = 'testuser', email = 'email@domain.tld')
+        budget = Budget.objects.create(owner = self.user, period_budget_amount = '100.00',
+                                       period_length = MONTH_PERIOD)
+        self.category = Category.objects.create(owner = self.user, name = 'test', budget = budget)
+        self.acct = RealAcct.objects.create(owner = self.user)
+        self.vacct = VirtualAcct.objects.create(owner = self.user, real_acct = self.acct,
+                                                parent_budget = budget)
+        
+        self.txns = []
+        for day, value in ((date(2012, 11, 20), '50.00'),
+                           (date(2013, 1, 5), '-20.00'),
+                           (date(2013, 3, 10), '30.00')):
+            txn = RealTxn.objects.create(owner = self.user, value = value, date = day,
+                                         category = self.category, real_account = self.acct)
+            VirtualTxn.objects.create(owner = self.user, value = value, real_txn = txn,
+                                      virtual_acct = self.vacct)
+            self.txns.append(txn)
+    
+    def test_balance_as_of(self):
+        self.assertEqual(self.acct.balance_as_of(date(2012, 11, 19)), Decimal('0.00'))
+        self.assertEqual(self.acct.balance_as_of(date(2012, 12, 31)), Decimal('50.00'))
+        self.assertEqual(self.acct.balance_as_of(date(2013, 2, 1)), Decimal('30.00'))
+        self.assertEqual(self.vacct.balance_as_of(date(2013, 3, 10)), Decimal('60.00'))
+        
+        starts = RealAcctCheckpoint.objects.filter(acct = self.acct)\
+            .values_list('period_start', flat = True).order_by('period_start')
+        self.assertEqual(list(starts), [date(2012, 11, 1), date(2012, 12, 1),
+                                        date(2013, 1, 1), date(2013, 2, 1)])
+    
+    def test_backdated_edit(self):
+        self.acct.balance_as_of(date(2013, 2, 1))
+        self.vacct.balance_as_of(date(2013, 2, 1))
+        
+        txn = RealTxn.objects.get(pk = self.txns[0].pk)
+        txn.date = date(2012, 12, 15)
+        txn.value = '45.00'
+        txn.save()
+        
+        self.assertEqual(self.acct.balance_as_of(date(2012, 11, 30)), Decimal('0.00'))
+        self.assertEqual(self.acct.balance_as_of(date(2013, 2, 1)), Decimal('25.00'))
+        # the split moved with its RealTxn but kept its value
+        self.assertEqual(self.vacct.balance_as_of(date(2012, 11, 30)), Decimal('0.00'))
+        self.assertEqual(self.vacct.balance_as_of(date(2013, 2, 1)), Decimal('30.00'))
+        
+        self.txns[1].delete()
+        self.assertEqual(self.acct.balance_as_of(date(2013, 2, 1)), Decimal('45.00'))
+        self.assertEqual(self.vacct.balance_as_of(date(2013, 2, 1)), Decimal('50.00'))
+        self.assertEqual(VirtualAcctCheckpoint.objects.get(acct = self.vacct,
+                         period_start = date(2013, 2, 1)).balance, Decimal('50.00'))
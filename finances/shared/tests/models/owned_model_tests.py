@@ -15,9 +15,9 @@
 
 from django.test import TestCase
 from django.test.client import RequestFactory
-from django.contrib.auth.models import User
-from django.core.exceptions import FieldError
-from shared.models import OwnedModel
+from django.contrib.auth.models import User, AnonymousUser
+from django.core.exceptions import FieldError, PermissionDenied
+from shared.models import OwnedModel, Budget, Category, RealAcct, RealTxn
 
 
 class OwnedModelTestModel(OwnedModel):
@@ -51,4 +51,28 @@ class OwnedModelTests(TestCase):
         assert(self.instance.is_allowed(request) == False)
         request.user = self.user
         assert(self.instance.is_allowed(request) == True)
-        self.instance.assert_is_allowed(request)
\ No newline at end of file
+        self.instance.assert_is_allowed(request)
+        
+        request.user = User(username = 'other_user')
+        request.user.pk = 2
+        assert(self.instance.is_allowed(request) == False)
+        self.assertRaises(PermissionDenied, self.instance.assert_is_allowed, request)
+    
+    def test_for_user(self):
+        user = User.objects.create(username = 'owner')
+        other = User.objects.create(username = 'other')
+        budget = Budget.objects.create(owner = user, name = 'food', period_budget_amount = '100.00')
+        category = Category.objects.create(owner = user, name = 'groceries', budget = budget)
+        acct = RealAcct.objects.create(owner = user, name = 'chequing')
+        txn = RealTxn.objects.create(owner = user, value = '-1.00', category = category, real_account = acct)
+        
+        with self.assertNumQueries(1):
+            [fetched] = RealTxn.objects.for_user(user)
+            self.assertEqual((fetched.real_account.name, fetched.category.name), ('chequing', 'groceries'))
+        assert(not RealTxn.objects.for_user(other).exists())
+        assert(not RealAcct.objects.filter(pk = acct.pk).for_user(other).exists())
+        with self.assertNumQueries(0):
+            self.assertEqual(list(Budget.objects.for_user(AnonymousUser())), [])
+        
+        self.assertRaises(FieldError, setattr, txn, 'owner', other)
+        self.assertRaises(FieldError, setattr, RealTxn.objects.get(pk = txn.pk), 'owner', user)
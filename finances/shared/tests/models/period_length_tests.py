@@ -13,52 +13,62 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from calendar import monthrange
+import numpy
 from django.test import TestCase
-from shared.models import PeriodLength, Month, Year
+from django.utils import timezone
+from shared.controllers import PeriodLengthFactory, local_date,\
+    WEEK_PERIOD, MONTH_PERIOD, YEAR_PERIOD
+from shared.controllers.period_length import PeriodController, local_datetime64
 
 
 class PeriodLengthTests(TestCase):
     """
-    Test for all PeriodLength subclasses.
+    Test for all period length controllers.
     """
     
     def setUp(self):
-        self.period_length = PeriodLength()
-        self.month = Month()
-        self.year = Year()
+        self.period_length = PeriodController()
+        self.week = PeriodLengthFactory(WEEK_PERIOD).make_controller()
+        self.month = PeriodLengthFactory(MONTH_PERIOD).make_controller()
+        self.year = PeriodLengthFactory(YEAR_PERIOD).make_controller()
         
-        now = datetime.now()
+        now = local_date()
         self.now = now
         
-        self.month_beginning = datetime(now.year, now.month, 1)
-        self.month_end = datetime(now.year, now.month, monthrange(now.year, now.month)[1])
+        self.week_beginning = now - timedelta(days=now.weekday())
+        self.week_end = self.week_beginning + timedelta(days=6)
+        self.next_week = self.week_end + timedelta(days=1)
+        self.previous_week = self.week_beginning - timedelta(days=1)
+        
+        self.month_beginning = date(now.year, now.month, 1)
+        self.month_end = date(now.year, now.month, monthrange(now.year, now.month)[1])
         # account for Jan and Dec in month testing
         if now.month == 12:
-            self.next_month = datetime(now.year, 1, 1)
+            self.next_month = date(now.year + 1, 1, 1)
         else:
-            self.next_month = datetime(now.year, now.month + 1, 1)
+            self.next_month = date(now.year, now.month + 1, 1)
         if now.month == 1:
-            self.previous_month = datetime(now.year - 1, 12, 1)
+            self.previous_month = date(now.year - 1, 12, 1)
         else:
-            self.previous_month = datetime(now.year, now.month - 1, 1)
+            self.previous_month = date(now.year, now.month - 1, 1)
         
-        self.year_beginning = datetime(now.year, 1, 1)
-        self.year_end = datetime(now.year, 12, 31)
-        self.next_year = datetime(now.year + 1, now.month, 1)
-        self.previous_year = datetime(now.year - 1, now.month, 1)
+        self.year_beginning = date(now.year, 1, 1)
+        self.year_end = date(now.year, 12, 31)
+        self.next_year = date(now.year + 1, now.month, 1)
+        self.previous_year = date(now.year - 1, now.month, 1)
     
     def test_period_length(self):
-        now = datetime.now()
+        now = local_date()
         try:
-            self.period_length.current_period_start_date()
+            self.period_length.current_period_start_date
             assert(False)
         except NotImplementedError:
             assert(True)
         
         try:
-            self.period_length.current_period_end_date()
+            self.period_length.current_period_end_date
             assert(False)
         except NotImplementedError:
             assert(True)
@@ -69,6 +79,16 @@ class PeriodLengthTests(TestCase):
         except NotImplementedError:
             assert(True)
     
+    def test_week(self):
+        assert(self.week.current_period_start_date == self.week_beginning)
+        assert(self.week.current_period_end_date == self.week_end)
+        
+        assert(self.week.in_current_period(self.now))
+        assert(self.week.in_current_period(self.week_end))
+        assert(self.week.in_current_period(self.week_beginning))
+        assert(self.week.in_current_period(self.next_week) == False)
+        assert(self.week.in_current_period(self.previous_week) == False)
+    
     def test_month(self):
         assert(self.month.current_period_start_date == self.month_beginning)
         assert(self.month.current_period_end_date == self.month_end)
@@ -87,4 +107,52 @@ class PeriodLengthTests(TestCase):
         assert(self.year.in_current_period(self.year_end))
         assert(self.year.in_current_period(self.year_beginning))
         assert(self.year.in_current_period(self.next_year) == False)
-        assert(self.year.in_current_period(self.previous_year) == False)
\ No newline at end of file
+        assert(self.year.in_current_period(self.previous_year) == False)
+    
+    def test_period_start_dates(self):
+        starts = list(self.month.period_start_dates(date(2012, 11, 15), date(2013, 2, 1)))
+        self.assertEqual(starts, [date(2012, 11, 1), date(2012, 12, 1),
+                                  date(2013, 1, 1), date(2013, 2, 1)])
+    
+    def test_period_bounds(self):
+        """
+        Batch period bounds must agree with the single-date controller API.
+        """
+        days = [date(2011, 12, 31) + timedelta(days=n) for n in range(0, 800, 3)]
+        for controller in (self.week, self.month, self.year):
+            bounds = controller.period_bounds(days)
+            for i, day in enumerate(days):
+                self.assertEqual(bounds.start[i].astype(date), controller.period_start_date(day))
+                self.assertEqual(bounds.end[i].astype(date), controller.period_end_date(day))
+            self.assertEqual(list(controller.index_start_dates(bounds.index)), list(bounds.start))
+    
+    def test_local_datetime64(self):
+        """
+        UTC instants are bucketed by their local (America/Edmonton) date,
+        across both standard and daylight saving time.
+        """
+        instants = [datetime(2013, 3, 1, 5, 0, tzinfo=timezone.utc),
+                    datetime(2013, 3, 1, 7, 0, tzinfo=timezone.utc),
+                    datetime(2013, 7, 1, 5, 59, tzinfo=timezone.utc),
+                    datetime(2013, 7, 1, 6, 0, tzinfo=timezone.utc)]
+        expected = [local_date(instant) for instant in instants]
+        self.assertEqual(list(local_datetime64(instants).astype(date)), expected)
+        
+        utc = numpy.array([instant.replace(tzinfo=None) for instant in instants], dtype='M8[us]')
+        self.assertEqual(list(local_datetime64(utc).astype(date)), expected)
+        self.assertEqual(self.month.period_bounds(utc).start[0].astype(date), date(2013, 2, 1))
+    
+    def test_shared_controllers(self):
+        """
+        Controllers are shared per period length and time zone, and the
+        cached current period rolls over when the local date changes.
+        """
+        assert(PeriodLengthFactory(MONTH_PERIOD).make_controller() is self.month)
+        assert(PeriodLengthFactory(str(MONTH_PERIOD)).make_controller() is self.month)
+        assert(PeriodLengthFactory(YEAR_PERIOD).make_controller() is not self.month)
+        with timezone.override('UTC'):
+            assert(PeriodLengthFactory(MONTH_PERIOD).make_controller() is not self.month)
+        
+        last_year = date(self.now.year - 1, 6, 15)
+        self.month._current = (last_year, date(last_year.year, 6, 1), date(last_year.year, 6, 30))
+        self.assertEqual(self.month.current_period_start_date, self.month_beginning)
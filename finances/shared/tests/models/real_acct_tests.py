@@ -13,9 +13,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
+from decimal import Decimal
 from django.test import TestCase
 from django.contrib.auth.models import User
-from shared.models import RealAcct, Budget, Year, Category, RealTxn
+from shared.controllers import YEAR_PERIOD
+from shared.models import RealAcct, Budget, Category, RealTxn
 
 
 class RealAcctTests(TestCase):
@@ -30,20 +32,37 @@ class RealAcctTests(TestCase):
         """
         user = User.objects.create(username = 'testuser', email = 'email@domain.tld')
         budget = Budget(owner = user, period_budget_amount = '100.00')
-        year = Year.objects.create()
-        budget.period_length = year
+        budget.period_length = YEAR_PERIOD
         budget.save()
         
         category = Category.objects.create(owner = user, name = 'test', budget = budget)
         
         self.acct = RealAcct.objects.create(owner = user)
         
-        self.txn_1 = RealTxn(value = '110.00', category = category, real_acct = self.acct)
+        self.txn_1 = RealTxn(owner = user, value = '110.00', category = category, real_account = self.acct)
         self.txn_1.save()
-        self.txn_2 = RealTxn(value = '0.00', category = category, real_acct = self.acct)
+        self.txn_2 = RealTxn(owner = user, value = '0.00', category = category, real_account = self.acct)
         self.txn_2.save()
-        self.txn_3 = RealTxn(value = '-10.00', category = category, real_acct = self.acct)
+        self.txn_3 = RealTxn(owner = user, value = '-10.00', category = category, real_account = self.acct)
         self.txn_3.save()
         
     def test_balance(self):
-        self.assertEqual(self.acct.balance, '100.00')
\ No newline at end of file
+        self.assertEqual(self.acct.balance, Decimal('100.00'))
+        self.assertEqual(RealAcct.objects.get(pk = self.acct.pk).balance, Decimal('100.00'))
+    
+    def test_balance_after_edit(self):
+        txn = RealTxn.objects.get(pk = self.txn_3.pk)
+        txn.value = '-25.50'
+        txn.save()
+        self.assertEqual(RealAcct.objects.get(pk = self.acct.pk).balance, Decimal('84.50'))
+    
+    def test_balance_after_move(self):
+        other = RealAcct.objects.create(owner = self.acct.owner)
+        self.txn_1.real_account = other
+        self.txn_1.save()
+        self.assertEqual(RealAcct.objects.get(pk = self.acct.pk).balance, Decimal('-10.00'))
+        self.assertEqual(RealAcct.objects.get(pk = other.pk).balance, Decimal('110.00'))
+    
+    def test_balance_after_delete(self):
+        self.txn_1.delete()
+        self.assertEqual(RealAcct.objects.get(pk = self.acct.pk).balance, Decimal('-10.00'))
@@ -0,0 +1,72 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+from datetime import date
+from decimal import Decimal
+from django.test import TestCase
+from django.contrib.auth.models import User
+from shared.controllers import MONTH_PERIOD
+from shared.models import Budget, Category, RealAcct, RealTxn, CategoryMonthTotal
+
+
+class CategoryMonthTotalTests(TestCase):
+    """
+    Tests that the monthly category totals follow RealTxn saves, edits and
+    deletes.
+    """
+    
+    def setUp(self):
+        self.user = User.objects.create(username = 'testuser', email = 'email@domain.tld')
+        budget = Budget.objects.create(owner = self.user, period_budget_amount = '100.00',
+                                       period_length = MONTH_PERIOD)
+        self.food = Category.objects.create(owner = self.user, name = 'food', budget = budget)
+        self.rent = Category.objects.create(owner = self.user, name = 'rent', budget = budget)
+        self.acct = RealAcct.objects.create(owner = self.user)
+        
+        self.txns = []
+        for day, value in ((date(2013, 1, 5), '-20.00'),
+                           (date(2013, 1, 31), '-5.50'),
+                           (date(2013, 3, 10), '-30.00')):
+            self.txns.append(RealTxn.objects.create(owner = self.user, value = value, date = day,
+                                                    category = self.food, real_account = self.acct))
+    
+    def totals(self):
+        rows = CategoryMonthTotal.objects.filter(owner = self.user)\
+            .values_list('category', 'month', 'total')
+        return dict(((category, month), total) for category, month, total in rows if total)
+    
+    def test_create(self):
+        self.assertEqual(self.totals(), {
+            (self.food.pk, date(2013, 1, 1)): Decimal('-25.50'),
+            (self.food.pk, date(2013, 3, 1)): Decimal('-30.00'),
+        })
+    
+    def test_edit(self):
+        txn = self.txns[1]
+        txn.date = date(2013, 2, 1)
+        txn.category = self.rent
+        txn.value = '-6.00'
+        txn.save()
+        self.assertEqual(self.totals(), {
+            (self.food.pk, date(2013, 1, 1)): Decimal('-20.00'),
+            (self.rent.pk, date(2013, 2, 1)): Decimal('-6.00'),
+            (self.food.pk, date(2013, 3, 1)): Decimal('-30.00'),
+        })
+    
+    def test_delete(self):
+        self.txns[0].delete()
+        RealTxn.objects.filter(date__gte = date(2013, 3, 1)).delete()
+        self.assertEqual(self.totals(), {
+            (self.food.pk, date(2013, 1, 1)): Decimal('-5.50'),
+        })
@@ -13,9 +13,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
+from decimal import Decimal
 from django.test import TestCase
 from django.contrib.auth.models import User
-from shared.models import Budget, Year, Category, RealAcct,\
+from shared.controllers import YEAR_PERIOD
+from shared.models import Budget, Category, RealAcct,\
     VirtualAcct, RealTxn, VirtualTxn
 
 
@@ -30,8 +32,7 @@ class VirtualAcctTests(TestCase):
         """
         user = User.objects.create(username = 'testuser', email = 'email@domain.tld')
         budget = Budget(owner = user, period_budget_amount = '100.00')
-        year = Year.objects.create()
-        budget.period_length = year
+        budget.period_length = YEAR_PERIOD
         budget.save()
         
         category = Category(owner = user, name = 'test', budget = budget)
@@ -40,12 +41,21 @@ class VirtualAcctTests(TestCase):
         self.acct = RealAcct.objects.create(owner = user)
         self.vacct = VirtualAcct.objects.create(owner = user, real_acct = self.acct, parent_budget = budget)
         
-        self.txn_1 = RealTxn(value = '110.00', category = category, real_acct = self.acct)
+        self.txn_1 = RealTxn(owner = user, value = '110.00', category = category, real_account = self.acct)
         self.txn_1.save()
-        self.vtxn_1 = VirtualTxn(value = '90.00', real_txn = self.txn_1, virtual_acct = self.vacct)
+        self.vtxn_1 = VirtualTxn(owner = user, value = '90.00', real_txn = self.txn_1, virtual_acct = self.vacct)
         self.vtxn_1.save()
-        self.vtxn_2 = VirtualTxn(value = '20.00', real_txn = self.txn_1, virtual_acct = self.vacct)
+        self.vtxn_2 = VirtualTxn(owner = user, value = '20.00', real_txn = self.txn_1, virtual_acct = self.vacct)
         self.vtxn_2.save()
         
     def test_balance(self):
-        self.assertEqual(self.vacct.balance, '110.00')
\ No newline at end of file
+        self.assertEqual(self.vacct.balance, Decimal('110.00'))
+        self.assertEqual(VirtualAcct.objects.get(pk = self.vacct.pk).balance, Decimal('110.00'))
+    
+    def test_balance_after_cascade(self):
+        """
+        Deleting a RealTxn deletes its splits, which must leave the
+        VirtualAcct balance as it was before the RealTxn existed.
+        """
+        self.txn_1.delete()
+        self.assertEqual(VirtualAcct.objects.get(pk = self.vacct.pk).balance, Decimal('0.00'))
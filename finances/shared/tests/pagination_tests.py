@@ -0,0 +1,62 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from datetime import date, timedelta
+from django.test import TestCase
+from django.contrib.auth.models import User
+from shared.models import Budget, Category, RealAcct, RealTxn
+from shared.pagination import keyset_page, keyset_chunks
+
+
+class PaginationTests(TestCase):
+    """
+    Walk a RealAcct's transactions with keyset pages in both directions.
+    """
+    
+    def setUp(self):
+        user = User.objects.create(username = 'testuser', email = 'email@domain.tld')
+        budget = Budget.objects.create(owner = user, period_budget_amount = '100.00')
+        category = Category.objects.create(owner = user, name = 'test', budget = budget)
+        self.acct = RealAcct.objects.create(owner = user)
+        # two transactions per day, so pages split rows with the same date
+        for n in range(25):
+            RealTxn.objects.create(owner = user, value = '1.00', category = category,
+                                   real_account = self.acct,
+                                   date = date(2013, 1, 1) + timedelta(days=n // 2))
+        self.newest_first = list(RealTxn.objects.order_by('-date', '-id'))
+    
+    def test_walk_older_and_newer(self):
+        qs = self.acct.realtxn_set.all()
+        pages = [keyset_page(qs, page_size = 10)]
+        while pages[-1].older_cursor:
+            pages.append(keyset_page(qs, before = pages[-1].older_cursor, page_size = 10))
+        
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(sum([page.object_list for page in pages], []), self.newest_first)
+        assert(not pages[0].has_newer)
+        
+        newer = keyset_page(qs, after = pages[2].newer_cursor, page_size = 10)
+        self.assertEqual(newer.object_list, pages[1].object_list)
+        assert(newer.has_older and newer.has_newer)
+    
+    def test_bad_cursor(self):
+        page = keyset_page(self.acct.realtxn_set.all(), before = 'garbage', page_size = 10)
+        self.assertEqual(page.object_list, self.newest_first[:10])
+    
+    def test_chunks(self):
+        chunks = list(keyset_chunks(self.acct.realtxn_set.all(), chunk_size = 10))
+        self.assertEqual([len(chunk) for chunk in chunks], [10, 10, 5])
+        oldest_first = list(reversed(self.newest_first))
+        self.assertEqual(sum(chunks, []), oldest_first)
@@ -0,0 +1,114 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+import json
+import logging
+import os
+import tempfile
+from StringIO import StringIO
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.http import HttpResponse
+from django.test.client import RequestFactory
+from shared.models import Budget, VirtualAcct
+from shared.request_stats import RequestStatsMiddleware, logger, endpoint_summaries, repeated_queries
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+    
+    def emit(self, record):
+        self.records.append(json.loads(record.getMessage()))
+
+
+class RequestStatsTests(TestCase):
+    """
+    Tests the figures logged by RequestStatsMiddleware, and the reports made
+    from them.
+    """
+    
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'email@domain.tld', 'pass')
+        for n in range(3):
+            Budget.objects.create(owner = self.user, name = 'budget %d' % n, period_budget_amount = '1.00')
+        self.client.login(username = 'testuser', password = 'pass')
+        self.handler = _ListHandler()
+        logger.addHandler(self.handler)
+    
+    def tearDown(self):
+        logger.removeHandler(self.handler)
+    
+    def test_record(self):
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('accounts:index'))
+        self.assertEqual(response.status_code, 200)
+        [record] = self.handler.records
+        self.assertEqual(record['view'], 'accounts:index')
+        self.assertEqual((record['method'], record['status'], record['queries']), ('GET', 200, 5))
+        assert(record['total_ms'] >= record['sql_ms'] + record['template_ms'] > 0)
+        assert(record['template_ms'] > 0)
+        # the current accounts of the budgets are found in one query
+        assert('repeated' not in record)
+        
+        # the cursors are only wrapped during the request
+        assert('make_debug_cursor' not in connection.__dict__)
+        self.client.get(reverse('budgets:create'))
+        self.assertEqual(len(self.handler.records), 2)
+        assert('repeated' not in self.handler.records[1])
+    
+    def test_repeated(self):
+        request = RequestFactory().get('/')
+        middleware = RequestStatsMiddleware()
+        middleware.process_request(request)
+        # one query per budget
+        for budget in Budget.objects.filter(owner = self.user):
+            VirtualAcct.objects.filter(parent_budget = budget).exists()
+        middleware.process_response(request, HttpResponse())
+        [record] = self.handler.records
+        self.assertEqual(record['queries'], 4)
+        self.assertEqual(record['repeated'], 3)
+        assert(record['repeated_sql'].startswith('SELECT'))
+    
+    def test_report(self):
+        records = [
+            {'view': 'a', 'total_ms': 10.0, 'sql_ms': 2.0, 'template_ms': 1.0, 'queries': 3},
+            {'view': 'a', 'total_ms': 30.0, 'sql_ms': 2.0, 'template_ms': 1.0, 'queries': 9,
+             'repeated': 7, 'repeated_sql': 'SELECT 1'},
+            {'view': 'b', 'total_ms': 50.0, 'sql_ms': 2.0, 'template_ms': 1.0, 'queries': 2,
+             'repeated': 2, 'repeated_sql': 'SELECT 2'},
+        ]
+        summaries = endpoint_summaries(records)
+        self.assertEqual([summary['view'] for summary in summaries], ['b', 'a'])
+        self.assertEqual((summaries[1]['requests'], summaries[1]['p50_ms'], summaries[1]['queries']),
+                         (2, 20.0, 6.0))
+        self.assertEqual(repeated_queries(records), [{'view': 'a', 'sql': 'SELECT 1', 'repeats': 7,
+                                                      'requests': 1}])
+        
+        descriptor, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(descriptor, 'w') as log:
+                log.write('not a record\n')
+                for record in records:
+                    log.write(json.dumps(record) + '\n')
+            output = StringIO()
+            call_command('request_stats', path, stdout = output)
+            assert('3 requests' in output.getvalue())
+            assert('SELECT 1' in output.getvalue())
+        finally:
+            os.remove(path)
@@ -0,0 +1,116 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from shared.models import Budget
+from shared.routers import PIN_COOKIE, ReplicaPinningMiddleware, ReplicaRouter, primary_reads,\
+    primary_for_request, end_replica_reads
+
+
+class ReplicaRouterTests(TestCase):
+    """
+    Tests that only the reads of GET requests from clients that have not
+    written lately go to the replicas.
+    """
+    
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.middleware = ReplicaPinningMiddleware()
+        self.factory = RequestFactory()
+    
+    def tearDown(self):
+        end_replica_reads(None)
+    
+    def respond(self, request):
+        return self.middleware.process_response(request, HttpResponse())
+    
+    @override_settings(DATABASE_REPLICAS = ('replica1', 'replica2'))
+    def test_routing(self):
+        self.assertEqual(self.router.db_for_read(Budget), 'default')
+        
+        request = self.factory.get('/')
+        self.middleware.process_request(request)
+        replica = self.router.db_for_read(Budget)
+        assert(replica in ('replica1', 'replica2'))
+        # every read of the request goes to the same replica
+        self.assertEqual(set(self.router.db_for_read(Budget) for i in range(20)), set([replica]))
+        # except those of related objects, which go where their instance came from
+        budget = Budget(name = 'food')
+        budget._state.db = 'default'
+        self.assertEqual(self.router.db_for_read(Budget, instance = budget), 'default')
+        with primary_reads():
+            self.assertEqual(self.router.db_for_read(Budget), 'default')
+        assert(PIN_COOKIE not in self.respond(request).cookies)
+        
+        self.assertEqual(self.router.db_for_write(Budget), 'default')
+        # the writer reads its own writes, now and for a while after
+        self.assertEqual(self.router.db_for_read(Budget), 'default')
+        assert(PIN_COOKIE in self.respond(request).cookies)
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.middleware.process_request(request)
+        self.assertEqual(self.router.db_for_read(Budget), 'default')
+        
+        request = self.factory.post('/')
+        self.middleware.process_request(request)
+        self.assertEqual(self.router.db_for_read(Budget), 'default')
+        assert(PIN_COOKIE in self.respond(request).cookies)
+        
+        end_replica_reads(None)
+        self.assertEqual(self.router.db_for_read(Budget), 'default')
+    
+    # the default alias stands in for a replica, so the pages have data
+    @override_settings(DATABASE_REPLICAS = ('default',))
+    def test_pin_cookie(self):
+        User.objects.create_user('testuser', 'email@domain.tld', 'pass')
+        self.client.login(username = 'testuser', password = 'pass')
+        
+        assert(PIN_COOKIE not in self.client.get(reverse('jobs:list')).cookies)
+        response = self.client.post(reverse('jobs:list'), {'kind': 'allocate'})
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 120)
+    
+    @override_settings(DATABASE_REPLICAS = ('replica1', 'replica2'))
+    def test_primary_for_request(self):
+        request = self.factory.get('/')
+        self.middleware.process_request(request)
+        primary_for_request()
+        self.assertEqual(self.router.db_for_read(Budget), 'default')
+        assert(PIN_COOKIE not in self.respond(request).cookies)
+        end_replica_reads(None)
+        self.middleware.process_request(self.factory.get('/'))
+        assert(self.router.db_for_read(Budget) in ('replica1', 'replica2'))
+    
+    # 'replica1' is not a database here, so reading from it would fail
+    @override_settings(DATABASE_REPLICAS = ('replica1',))
+    def test_cached_page(self):
+        User.objects.create_user('testuser', 'email@domain.tld', 'pass')
+        self.client.login(username = 'testuser', password = 'pass')
+        # rendered from the primary, then served from the cache
+        for i in range(2):
+            response = self.client.get(reverse('accounts:index'))
+            self.assertEqual(response.status_code, 200)
+            assert(PIN_COOKIE not in response.cookies)
+    
+    @override_settings(DATABASE_REPLICAS = ())
+    def test_no_replicas(self):
+        request = self.factory.post('/')
+        self.middleware.process_request(request)
+        self.assertEqual(self.router.db_for_read(Budget), 'default')
+        assert(PIN_COOKIE not in self.respond(request).cookies)
@@ -0,0 +1,115 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+import os
+import shutil
+import sqlite3
+import tempfile
+from django.db import connection
+from django.db.utils import load_backend
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+from shared.benchmark import run_concurrency_benchmark
+from shared.sqlite import release_connection
+
+
+class DatabaseFilesMixin(object):
+    """
+    Opens connections to SQLite database files in a temporary directory.
+    """
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+    
+    def open(self, alias = 'other', **overrides):
+        settings_dict = dict(connection.settings_dict, NAME = os.path.join(self.directory, 'other.db'))
+        settings_dict.update(overrides)
+        wrapper = load_backend(settings_dict['ENGINE']).DatabaseWrapper(settings_dict, alias)
+        self.addCleanup(wrapper.close)
+        wrapper.cursor()
+        return wrapper
+    
+    def pragma(self, wrapper, name):
+        return wrapper.connection.execute('PRAGMA %s' % name).fetchone()[0]
+
+
+class SQLiteProfileTests(DatabaseFilesMixin, TestCase):
+    """
+    Tests the pragmas applied to new SQLite connections, and keeping
+    connections across requests.
+    """
+    
+    def test_pragmas(self):
+        other = self.open()
+        self.assertEqual(self.pragma(other, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(other, 'synchronous'), 1)
+        self.assertEqual(self.pragma(other, 'cache_size'), -64 * 1024)
+        self.assertEqual(self.pragma(other, 'busy_timeout'), 5000)
+        # the test database is in memory, so it has no -wal file
+        self.assertEqual(self.pragma(connection, 'journal_mode'), 'memory')
+        self.assertEqual(self.pragma(connection, 'synchronous'), 1)
+    
+    @override_settings(DATABASE_REPLICAS = ('replica',))
+    def test_replica(self):
+        replica = self.open(alias = 'replica')
+        self.assertEqual(self.pragma(replica, 'journal_mode'), 'delete')
+        self.assertEqual(self.pragma(replica, 'synchronous'), 1)
+    
+    def test_release(self):
+        kept = self.open(CONN_MAX_AGE = None)
+        kept.cursor().execute('CREATE TABLE t (x integer)')
+        kept.cursor().execute('INSERT INTO t VALUES (1)')
+        release_connection(kept)
+        # kept for the next request, without what the last one left uncommitted
+        assert(kept.connection is not None)
+        self.assertEqual(kept.cursor().execute('SELECT count(*) FROM t').fetchone()[0], 0)
+        
+        aged = self.open(CONN_MAX_AGE = 600)
+        release_connection(aged)
+        assert(aged.connection is not None)
+        aged.opened_at -= 600
+        release_connection(aged)
+        assert(aged.connection is None)
+        
+        closed = self.open(CONN_MAX_AGE = 0)
+        release_connection(closed)
+        assert(closed.connection is None)
+        
+        # the TestCase manages the transaction of the test database
+        release_connection(connection)
+        assert(connection.connection is not None)
+
+
+class ConcurrencyBenchmarkTests(DatabaseFilesMixin, TransactionTestCase):
+    """
+    Tests the concurrency benchmark on a copy of the test database. Its
+    processes are forked from the test's, so they could not commit inside
+    a TestCase transaction.
+    """
+    
+    def test_concurrency_benchmark(self):
+        path = os.path.join(self.directory, 'copy.db')
+        copy = sqlite3.connect(path)
+        copy.executescript('\n'.join(connection.connection.iterdump()))
+        copy.close()
+        
+        result = run_concurrency_benchmark(path, 'production', readers = 1, duration = 1,
+                                           import_rows = 20, seed_rows = 20)
+        self.assertEqual(self.pragma(self.open(NAME = path), 'journal_mode'), 'wal')
+        assert(result['reads'] > 0)
+        self.assertEqual(result['read_errors'], 0)
+        assert(result['imports'] > 0)
+        self.assertEqual(result['import_errors'], 0)
+        assert(result['p50_ms'] <= result['p99_ms'] <= result['max_ms'])
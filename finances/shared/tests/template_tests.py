@@ -0,0 +1,54 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+from django.core.management import call_command
+from django.template import TemplateDoesNotExist
+from django.test import TestCase
+from django.test.utils import override_settings
+from shared.loaders import CompiledHamlLoader
+
+
+class CompiledTemplateTests(TestCase):
+    """
+    Tests that compile_templates writes plain Django templates which
+    CompiledHamlLoader then serves.
+    """
+    
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors = True)
+    
+    def test_compile_and_load(self):
+        stale = os.path.join(self.dir, 'shared', 'removed.hamlpy')
+        os.makedirs(os.path.dirname(stale))
+        open(stale, 'w').close()
+        call_command('compile_templates', output = self.dir, stdout = StringIO())
+        assert(not os.path.exists(stale))
+        
+        with override_settings(COMPILED_TEMPLATE_DIR = self.dir):
+            loader = CompiledHamlLoader()
+            source, path = loader.load_template_source('shared/site_base.hamlpy')
+            self.assertEqual(path, os.path.join(self.dir, 'shared', 'site_base.hamlpy'))
+            assert(source.startswith('<!DOCTYPE'))
+            assert('%html' not in source)
+            self.assertRaises(TemplateDoesNotExist, loader.load_template_source,
+                              'shared/missing.hamlpy')
+            self.assertRaises(TemplateDoesNotExist, loader.load_template_source,
+                              'admin/base.html')
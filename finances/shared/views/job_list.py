@@ -0,0 +1,82 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+import json
+
+from django.core.urlresolvers import reverse
+from django.http import Http404, HttpResponse, HttpResponseRedirect, HttpResponseBadRequest
+from django.views.generic.base import TemplateView, View
+
+from shared.jobs import enqueue
+from shared.models import Job
+from shared.views.mixins import LoginRequiredMixin
+
+# jobs the owner can start from the job list
+STARTABLE_KINDS = ('allocate', 'close_periods', 'rebuild_ledger')
+
+# jobs shown on the job list
+RECENT_JOBS = 20
+
+
+class JobList(LoginRequiredMixin, TemplateView):
+    """
+    The owner's recent background jobs with their progress. The page
+    reloads itself while any of them is queued or running. POSTing a kind
+    in STARTABLE_KINDS queues a job of that kind.
+    """
+    
+    template_name = 'shared/job_list.hamlpy'
+    
+    def get_context_data(self, **kwargs):
+        context = super(JobList, self).get_context_data(**kwargs)
+        jobs = list(Job.objects.for_user(self.request.user).order_by('-created', '-pk')[:RECENT_JOBS])
+        context.update({
+            'job_list': jobs,
+            'has_active_jobs': any(job.is_active for job in jobs),
+            'startable_kinds': STARTABLE_KINDS,
+        })
+        return context
+    
+    def post(self, request):
+        kind = request.POST.get('kind')
+        if kind not in STARTABLE_KINDS:
+            return HttpResponseBadRequest(u"kind must be one of %s" % ', '.join(STARTABLE_KINDS))
+        enqueue(request.user, kind)
+        return HttpResponseRedirect(reverse('jobs:list'))
+
+
+class JobDetail(LoginRequiredMixin, View):
+    """
+    The status and progress of one of the owner's jobs as JSON, for
+    polling.
+    """
+    
+    def get(self, request, job_pk):
+        try:
+            job = Job.objects.for_user(request.user).get(pk=job_pk)
+        except Job.DoesNotExist:
+            raise Http404(u"No Job found matching the query")
+        data = {
+            'id': job.pk,
+            'kind': job.kind,
+            'status': job.status,
+            'attempts': job.attempts,
+            'progress': job.progress,
+            'progress_total': job.progress_total,
+            'percent_done': job.percent_done,
+            'message': job.message,
+            'created': job.created.isoformat(),
+            'finished': job.finished.isoformat() if job.finished else None,
+        }
+        return HttpResponse(json.dumps(data), content_type='application/json')
@@ -14,3 +14,4 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
 from login_required import LoginRequiredMixin
+from ledger_cache import LedgerCacheMixin
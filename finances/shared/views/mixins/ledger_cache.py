@@ -0,0 +1,55 @@
+# Copyright (C) 2013  Aaron Krebs akrebs@ualberta.ca
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from shared.cache import ledger_cache_key
+from shared.routers import primary_for_request
+
+
+class LedgerCacheMixin(object):
+    """
+    Serves GET requests from a cached copy of the page rendered for the
+    same user at the same ledger version, with no query but the one for the
+    version.
+    
+    The user is identified from the session alone, so this must come before
+    LoginRequiredMixin (and the session engine should be cache backed for a
+    hit to need no other query). Only pages without per-request content
+    such as CSRF tokens can be cached this way.
+    
+    A page that is not cached yet is rendered from the primary database: the
+    version comes from the primary, and a replica may not have caught up
+    with writes made outside the user's requests (by the run_jobs worker or
+    cron), so a render from it could be cached as current until the next
+    write.
+    """
+    
+    def dispatch(self, request, *args, **kwargs):
+        user_id = request.session.get(SESSION_KEY)
+        if request.method != 'GET' or user_id is None:
+            return super(LedgerCacheMixin, self).dispatch(request, *args, **kwargs)
+        
+        key = ledger_cache_key(user_id, request.get_full_path())
+        content = cache.get(key)
+        if content is not None:
+            return HttpResponse(content)
+        
+        primary_for_request()
+        response = super(LedgerCacheMixin, self).dispatch(request, *args, **kwargs)
+        if response.status_code == 200 and hasattr(response, 'add_post_render_callback'):
+            response.add_post_render_callback(lambda response: cache.set(key, response.content))
+        return response